@@ -1,6 +1,10 @@
 #!/bin/bash
 
 SIMULATOR=$HOME/adam/firmament/build/sim/trace-extract/google_trace_simulator
+if [[ ! -x "$SIMULATOR" ]]; then
+  # firmament not built: use the stand-in, which takes the same flags
+  SIMULATOR="python3 $(dirname $0)/../tests/py/trace_simulator.py"
+fi
 
 OUTPUT_DIR=$1
 PERCENTAGE=$2
@@ -17,3 +21,8 @@ $SIMULATOR -logtostderr -batch_step 10 -flow_scheduling_cost_model 8 \
  -num_files_to_process 1 -max_scheduling_rounds 1 \
  -percentage $PERCENTAGE -graph_output_file ${OUTPUT_DIR}/${INDEX}.min \
  -simulated_quincy_random_seed $SEED \
+
+# Set COMPRESS to store output as .min.zst: the benchmark reads it as it is
+if [[ -n "$COMPRESS" ]]; then
+  zstd -q --rm -T0 ${OUTPUT_DIR}/${INDEX}.min
+fi
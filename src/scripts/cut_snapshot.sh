@@ -8,15 +8,8 @@ fi
 
 SNAPSHOT_N=$1
 FILE=$2
+SCRIPT_ROOT=`dirname $(realpath $0)`
 
-if [[ $SNAPSHOT_N -eq 1 ]]; then
-  START_LINE=1
-  END_LINE=`grep -n "c EOI" $FILE | head -n 1 | cut -d: -f1`
-else
-  LINES=`grep -n "c EOI" $FILE | head -n $SNAPSHOT_N | tail -n 2 | cut -d: -f1`
-  LINES=($LINES)
-  START_LINE=`expr ${LINES[0]} + 1`
-  END_LINE=${LINES[1]}
-fi
-
-sed -n ${START_LINE},${END_LINE}p $FILE
+# Snapshot 1 is the initial graph, snapshot N the (N-1)th delta. The index
+# (built on first use) lets us seek straight to it, rather than scanning.
+exec $SCRIPT_ROOT/imin_index.py delta `expr $SNAPSHOT_N - 1` $FILE
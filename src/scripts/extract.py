@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
-import sys, os, re, sh, shutil
+import sys, os, re, shutil
+
+import imin_index
 
 # SCRIPT_ROOT = PROJECT_ROOT/src/scripts/
 SCRIPT_ROOT = os.path.dirname(os.path.realpath(__file__))
@@ -13,9 +15,6 @@ if len(sys.argv) < 3:
 input_dir = sys.argv[1]
 output_dir = sys.argv[2]
 
-FIRST_SNAPSHOT_COMMAND = sh.Command("/home/srguser/adam/project/src/scripts/cut_snapshot.sh")
-LAST_SNAPSHOT_COMMAND = sh.Command("/home/srguser/adam/project/build/bin/incremental_snapshots").bake("last_only")
-
 file_names = ['small.imin', 'medium.imin', 'large.imin', 'full_size.imin']
 pattern = re.compile('.*\.imin$')
 
@@ -28,9 +27,19 @@ sizes = [(os.stat(os.path.join(input_dir, fname)).st_size, fname)
          for fname in matching_files]
 sizes.sort() # ascending order of size
 
+# cluster timestamp of each delta, if generated by a hybrid test
+TIMESTAMPS_SUFFIX = ".timestamps"
+
 for ((size,old_fname),new_fname) in zip(sizes, file_names):
   shutil.move(os.path.join(input_dir, old_fname), 
               os.path.join(output_dir, new_fname))
+  old_timestamps = os.path.join(input_dir, old_fname + TIMESTAMPS_SUFFIX)
+  if os.path.exists(old_timestamps):
+    shutil.move(old_timestamps,
+                os.path.join(output_dir, new_fname + TIMESTAMPS_SUFFIX))
+  else:
+    print("warning: no {0}: replay tests will need an arrival_interval"
+          .format(old_timestamps), file=sys.stderr)
 
 for fname in file_names:
   prefix = fname[:-5] # strip out .imin
@@ -40,6 +49,9 @@ for fname in file_names:
   last_snapshot_fname = os.path.join(output_dir, last_snapshot_fname)
   input_path = os.path.join(output_dir, fname)
   
-  FIRST_SNAPSHOT_COMMAND("1", input_path, _out=first_snapshot_fname)
-  with open(input_path) as f:
-    SNAPSHOT_COMMAND(_in=f, _out=last_snapshot_fname)
+  # one pass to build the index, then read only what's needed
+  index = imin_index.load(input_path)
+  with open(first_snapshot_fname, 'wb') as f:
+    index.copy(f, 0)
+  with open(last_snapshot_fname, 'wb') as f:
+    index.snapshot(f)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+'''Index of the deltas in an incremental DIMACS (.imin) file.
+
+An .imin file is a full graph followed by a stream of deltas, each terminated
+by a "c EOI" line. Here the graph is numbered delta 0. The index records the
+byte offset, line number and number of changes of each type for every delta.
+It is built in one streaming pass, and saved alongside the input as
+<input>.idx. It is rebuilt if the input's size or mtime changes.
+
+With the index, any range of deltas can be read by seeking straight to it,
+rather than scanning the file for "c EOI" lines.'''
+
+import sys, os, json, subprocess
+
+# SCRIPT_ROOT = PROJECT_ROOT/src/scripts/
+SCRIPT_ROOT = os.path.dirname(os.path.realpath(__file__))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(SCRIPT_ROOT))
+SNAPSHOT_CREATOR_PATH = os.path.join(PROJECT_ROOT, "build", "bin",
+                                     "incremental_snapshots")
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+BUFFER_SIZE = 1024 * 1024
+END_OF_ITERATION = b"c EOI\n"
+# line types that change the graph: add node, remove node, add arc, change arc
+CHANGE_TYPES = ["n", "r", "a", "x"]
+
+class IminIndex(object):
+  def __init__(self, path, deltas):
+    '''deltas: list of dicts, with keys start & end (byte offsets, end
+       exclusive), line (of first line, starting from 1) and a count for
+       each of CHANGE_TYPES'''
+    self.path = path
+    self.deltas = deltas
+
+  def __len__(self):
+    return len(self.deltas)
+
+  def copy(self, out_file, start, stop=None):
+    '''Writes deltas [start, stop) to binary file out_file. Raises
+       IndexError if they are not all in the index.'''
+    if stop is None:
+      stop = start + 1
+    if not 0 <= start < stop <= len(self.deltas):
+      raise IndexError("deltas {0} to {1} out of range: {2} has 0 to {3}"
+                       .format(start, stop - 1, self.path,
+                               len(self.deltas) - 1))
+    remaining = self.deltas[stop - 1]["end"] - self.deltas[start]["start"]
+    with open(self.path, 'rb') as f:
+      f.seek(self.deltas[start]["start"])
+      while remaining > 0:
+        data = f.read(min(BUFFER_SIZE, remaining))
+        if not data:
+          raise EOFError("{0} truncated since it was indexed".format(self.path))
+        out_file.write(data)
+        remaining -= len(data)
+
+  def snapshot(self, out_file, delta_id=None):
+    '''Writes the full graph after applying deltas 1..delta_id (default: all)
+       to binary file out_file. Only the deltas up to delta_id are read.'''
+    if delta_id is None:
+      delta_id = len(self.deltas) - 1
+    if delta_id == 0:
+      # N.B. includes c EOI, as does output of incremental_snapshots
+      self.copy(out_file, 0)
+      return
+    creator = subprocess.Popen([SNAPSHOT_CREATOR_PATH, "quiet", "last_only"],
+                               stdin=subprocess.PIPE, stdout=out_file)
+    try:
+      self.copy(creator.stdin, 0, delta_id + 1)
+    finally:
+      creator.stdin.close()
+    if creator.wait() != 0:
+      raise subprocess.CalledProcessError(creator.returncode,
+                                          SNAPSHOT_CREATOR_PATH)
+
+def _signature(path):
+  stat = os.stat(path)
+  return [stat.st_size, stat.st_mtime_ns]
+
+def build(path):
+  '''Scans path, returning its IminIndex.'''
+  deltas = []
+  offset = 0
+  line_number = 1
+  current = None
+  with open(path, 'rb', buffering=BUFFER_SIZE) as f:
+    for line in f:
+      if current is None:
+        current = {"start": offset, "line": line_number}
+        current.update({change_type : 0 for change_type in CHANGE_TYPES})
+      offset += len(line)
+      line_number += 1
+      change_type = line[:1].decode('ascii', 'replace')
+      if change_type in CHANGE_TYPES:
+        current[change_type] += 1
+      elif line == END_OF_ITERATION:
+        current["end"] = offset
+        deltas.append(current)
+        current = None
+  if current is not None:
+    # no c EOI after final delta: still a delta
+    current["end"] = offset
+    deltas.append(current)
+  return IminIndex(path, deltas)
+
+def load(path):
+  '''Returns IminIndex for path, building it (and saving it, if we are able
+     to) if there is no up to date index.'''
+  index_path = path + INDEX_SUFFIX
+  try:
+    with open(index_path) as f:
+      saved = json.load(f)
+    if saved["version"] == INDEX_VERSION and \
+       saved["signature"] == _signature(path):
+      return IminIndex(path, saved["deltas"])
+  except (OSError, ValueError, KeyError):
+    pass
+
+  index = build(path)
+  saved = {"version": INDEX_VERSION,
+           "signature": _signature(path),
+           "deltas": index.deltas}
+  try:
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'w') as f:
+      json.dump(saved, f)
+    os.rename(temp_path, index_path)
+  except OSError as e:
+    print("WARNING: could not save index ", index_path, ": ", e,
+          sep="", file=sys.stderr)
+  return index
+
+### Command-line interface
+
+USAGE = '''usage: {0} <command> ...
+  build <input>                 build (or refresh) index of input
+  show <input>                  print offset, line and changes of each delta
+  delta <k> <input>             print delta k (0 is the initial graph)
+  slice <start> <stop> <input>  print deltas start, ..., stop - 1
+  snapshot <k|last> <input>     print full graph after applying deltas 1..k'''
+
+def usage():
+  print(USAGE.format(sys.argv[0]), file=sys.stderr)
+  sys.exit(1)
+
+def main(args):
+  if not args:
+    usage()
+  command, args = args[0], args[1:]
+  out_file = sys.stdout.buffer
+  try:
+    if command == "build" and len(args) == 1:
+      index = load(args[0])
+      print(len(index) - 1, "deltas")
+    elif command == "show" and len(args) == 1:
+      index = load(args[0])
+      print("delta,offset,line," + ",".join(CHANGE_TYPES))
+      for (delta_id, delta) in enumerate(index.deltas):
+        fields = [delta_id, delta["start"], delta["line"]] \
+               + [delta[change_type] for change_type in CHANGE_TYPES]
+        print(",".join(map(str, fields)))
+    elif command == "delta" and len(args) == 2:
+      load(args[1]).copy(out_file, int(args[0]))
+    elif command == "slice" and len(args) == 3:
+      load(args[2]).copy(out_file, int(args[0]), int(args[1]))
+    elif command == "snapshot" and len(args) == 2:
+      index = load(args[1])
+      delta_id = None if args[0] == "last" else int(args[0])
+      out_file.flush()
+      index.snapshot(out_file, delta_id)
+    else:
+      usage()
+  except ValueError:
+    usage()
+  except IndexError as e:
+    print(e, file=sys.stderr)
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
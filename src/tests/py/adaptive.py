@@ -0,0 +1,47 @@
+'''Adaptive iteration count: repeat a test on a file until the confidence
+interval on its running time is narrow enough.
+
+A case opts in by specifying "target_relative_ci": e.g. 0.05 stops once the
+half-width of the confidence interval is within 5% of the mean. It may also
+specify "min_iterations" and "max_iterations". If not specified, the latter
+defaults to the case's "iterations".'''
+
+import math
+
+DEFAULT_MIN_ITERATIONS = 3
+
+def enabled(case_config):
+  return "target_relative_ci" in case_config
+
+def iterationBounds(case_config):
+  min_iterations = case_config.get("min_iterations", DEFAULT_MIN_ITERATIONS)
+  max_iterations = case_config.get("max_iterations",
+                                   case_config["iterations"])
+  # with one sample, there's no estimate of the variance
+  assert(2 <= min_iterations <= max_iterations)
+  return (min_iterations, max_iterations)
+
+def relativeError(confidence_level, x):
+  '''Half-width of the Student-t confidence interval, relative to the mean.
+     Computed as in visualisation.analysis.t_error, so that the stopping rule
+     matches the error bars in the figures.'''
+  # only needed for adaptive cases: don't make it a dependency of the harness
+  import scipy.stats
+
+  n = len(x)
+  mu = sum(x) / n
+  sigma = math.sqrt(sum((y - mu) ** 2 for y in x) / n)
+  sample_sigma = sigma / math.sqrt(n)
+  if sample_sigma == 0:
+    return 0
+  elif mu == 0:
+    return float('+inf')
+  _lower, upper = scipy.stats.t.interval(confidence_level, n, scale=sample_sigma)
+  return upper / abs(mu)
+
+def converged(case_config, confidence_level, x):
+  min_iterations, _ = iterationBounds(case_config)
+  if len(x) < min_iterations:
+    return False
+  target = case_config["target_relative_ci"]
+  return relativeError(confidence_level, x) <= target
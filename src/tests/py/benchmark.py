@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 
 import config.benchmark as config
-import os, sys, time, sh, shutil, signal, csv, hashlib, re 
-import threading
+import os, sys, time, sh, shutil, csv, hashlib, re, json, glob, subprocess
+import contextlib, itertools, pprint, random
+import adaptive, builder, halving, journal, parallel, racing, result_store, runner
+import snapshots, staging, throughput, trace_cache
 
-class Alarm(Exception):
-    pass
-
-def alarm_handler(signum, frame):
-    raise Alarm
+# Resource usage of each solver run. Recorded on the final result row of a run.
+RUSAGE_FIELDS = runner.RUSAGE_FIELDS
+# Memory at end of each delta. Only recorded if "sample_memory" set for case.
+MEMORY_FIELDS = runner.MEMORY_FIELDS
 
 def error(*args):
   print(*args, file=sys.stderr)
@@ -34,17 +35,23 @@ def implementationKey(instance):
     key += "_" + instance["compiler"]
   return key
 
-def gitCommitID(version):
+def gitCommitIDs(versions):
+  '''Returns dict mapping each version to its commit ID. All versions are
+     resolved by a single git process.'''
+  versions = sorted(set(versions))
+  if not versions:
+    return {}
   # Make sure we're inside the git repository
   os.chdir(config.PROJECT_ROOT)
-  # We run git show -s --pretty=%H <version>
-  # git show displays git objects
-  # -s suppresses the normal patch output, just showing the commit message
-  # --pretty=%H specifies the format, giving just the SHA1 ID
+  # We run git rev-parse <version>^{commit} ...
+  # rev-parse prints the object ID of each argument, one per line
+  # ^{commit} dereferences tags to the commit they point to
   # Tell sh not to emulate TTY for STDOUT: otherwise, git will add escape codes
-  git_result = sh.git.show(version,s=True,pretty="%H",_tty_out=False)
-  commit_id = git_result.stdout.strip()
-  return commit_id.decode("utf-8")
+  git_result = sh.git("rev-parse", *[version + "^{commit}" for version in versions],
+                      _tty_out=False)
+  commit_ids = git_result.stdout.decode("utf-8").split()
+  assert(len(commit_ids) == len(versions))
+  return dict(zip(versions, commit_ids))
 
 def findImplementations(tests):
   implementations = {}
@@ -66,12 +73,16 @@ def findImplementations(tests):
         
       if key not in implementations:   
         implementation = config.IMPLEMENTATIONS[name].copy()
-        # rewrite to canonical version
-        implementation["version"] = gitCommitID(implementation["version"])
         if "compiler" in instance:
           implementation["compiler"] = instance["compiler"]
         implementations[key] = implementation
   
+  # rewrite to canonical version
+  commit_ids = gitCommitIDs([implementation["version"]
+                             for implementation in implementations.values()])
+  for implementation in implementations.values():
+    implementation["version"] = commit_ids[implementation["version"]]
+  
   return implementations
 
 def findBuildTargets(implementations):
@@ -94,78 +105,176 @@ def clean():
     pass
   os.mkdir(config.WORKING_DIRECTORY)
 
-# returns true if version has been successfully checked out to working directory;
-# false if version was already checked out. Raises exception on error. 
-def gitCheckout(version):
-  directory = versionDirectory(version)
-  if os.path.exists(directory):
-    # already checked out
-    # (since version is always a commit ID, the code can never have changed)
-    return False
+def profileDirectory(version, compiler_name):
+  return os.path.join(versionDirectory(version), compiler_name + "_profile")
+
+def buildSpec(version, compiler_name, targets, instrumented=False):
+  '''Returns description of a build of targets, for builder.buildAll.
+     instrumented: for PGO compilers, build to generate a profile rather
+     than to use it. N.B. both are built in the same directory.'''
+  root_directory = versionDirectory(version)
+  compiler = config.COMPILERS[compiler_name]
+  flags = compiler.get("flags", "")
+  if compiler.get("lto"):
+    flags += " -flto"
+  if "pgo" in compiler:
+    profile_key = "profile_generate" if instrumented else "profile_use"
+    flags += " " + compiler[profile_key].format(
+                     profileDirectory(version, compiler_name))
+  c_flags = flags + " " + compiler.get("cflags", "")
+  cxx_flags = flags + " " + compiler.get("cxxflags", "")
+  cmake_arguments = ["-DCMAKE_BUILD_TYPE=Custom",
+                     "-DCMAKE_C_COMPILER=" + compiler["cc"], 
+                     "-DCMAKE_CXX_COMPILER=" + compiler["cxx"],
+                     "-DCMAKE_C_FLAGS_CUSTOM=" + c_flags,
+                     "-DCMAKE_CXX_FLAGS_CUSTOM=" + cxx_flags]
+  if compiler.get("lto"):
+    # N.B. CMake treats relative paths as relative to the build directory
+    tools = {tool : shutil.which(compiler[tool]) or compiler[tool]
+             for tool in ["ar", "ranlib"]}
+    cmake_arguments += ["-DCMAKE_AR=" + tools["ar"],
+                        "-DCMAKE_RANLIB=" + tools["ranlib"]]
+  return {"source_directory": os.path.join(root_directory,
+                                           config.SOURCE_PREFIX),
+          "directory": os.path.join(root_directory, compiler_name),
+          "cmake_arguments": cmake_arguments,
+          "targets": sorted(targets)}
+
+def trainingSet(compiler_name, implementation_type):
+  '''Files to run the instrumented build of implementation_type on'''
+  dataset_name = config.COMPILERS[compiler_name]["pgo"][implementation_type]
+  if implementation_type == "full":
+    dataset = config.FULL_DATASET
   else:
-    os.makedirs(directory)
-    # Make sure we're inside the git repository first
-    os.chdir(config.PROJECT_ROOT)
-    # how to checkout branch to new working directory, see:
-    # http://blog.jessitron.com/2013/10/git-checkout-multiple-branches-at-same.html
-    sh.tar(sh.git.archive(version), "-xC", directory)
-    return True
-  
-def build(version, to_build):
-  saved_cwd = os.getcwd()
-
-  root_directory = os.path.join(config.WORKING_DIRECTORY, version)
-  source_directory = os.path.join(root_directory, config.SOURCE_PREFIX)
-  
-  for (compiler_name, targets) in to_build.items():
-    directory = os.path.join(root_directory, compiler_name)
-    build_directory = os.path.join(directory, config.BUILD_PREFIX)
-    log_directory = os.path.join(directory, "log") 
-    
-    compiler = config.COMPILERS[compiler_name]
-  
-    try:
-      os.makedirs(build_directory)
-      os.mkdir(log_directory)
-    except FileExistsError:
-      # ignore -- we have already built before, directories exist
-      pass
-    os.chdir(build_directory)
-    
-    if not os.path.exists(os.path.join(build_directory, "CMakeCache.txt")):
-      # N.B. Must NOT run CMake twice. This can break things!
-      # In particular, CMake will think that the compilers are being changed
-      # (even though they're remaining the same); it will issue a warning,
-      # and hose the CMakeCache completely (e.g. compiler flags get reset)
-      c_flags = compiler.get("flags", "") + " " + compiler.get("cflags", "")
-      cxx_flags = compiler.get("flags", "") + " " + compiler.get("cxxflags", "")
-      args = [source_directory, "-DCMAKE_BUILD_TYPE=Custom",
-               "-DCMAKE_C_COMPILER=" + compiler["cc"], 
-               "-DCMAKE_CXX_COMPILER=" + compiler["cxx"],
-               "-DCMAKE_C_FLAGS_CUSTOM=" + c_flags,
-               "-DCMAKE_CXX_FLAGS_CUSTOM=" + cxx_flags]
-      sh.cmake(*args)
-    
-    # run make 
-    sh.make(config.MAKE_FLAGS + list(targets), 
-            _out=os.path.join(log_directory, "makefile.out"),
-            _err=os.path.join(log_directory, "makefile.err"))
-    
-  os.chdir(saved_cwd)
-  
-def buildImplementations(implementations):
+    dataset = config.INCREMENTAL_DATASET
+  return list(dataset[dataset_name])
+
+def profileSignature(implementations, version, compiler_name):
+  '''Everything the profile depends on, bar the commit & compiler flags,
+     which are fixed for the profile directory'''
+  training = []
+  for implementation in implementations.values():
+    if implementation["version"] != version or \
+       implementation.get("compiler", config.DEFAULT_COMPILER) != compiler_name:
+      continue
+    arguments = implementation.get("arguments", []) \
+              + implementation.get("offline_arguments", [])
+    training.append({"target": implementation["target"],
+                     "path": implementation["path"],
+                     "arguments": arguments,
+                     "files": trainingSet(compiler_name, implementation["type"])})
+  training.sort(key=lambda x : json.dumps(x, sort_keys=True))
+  return json.dumps(training, sort_keys=True, indent=2)
+
+def trainedProfileSignature(version, compiler_name):
+  '''profileSignature of the profile built with, or None if not trained'''
+  path = os.path.join(profileDirectory(version, compiler_name), "complete")
+  try:
+    with open(path) as f:
+      return f.read()
+  except OSError:
+    return None
+
+def profileComplete(version, compiler_name, signature):
+  return trainedProfileSignature(version, compiler_name) == signature
+
+def trainProfile(version, compiler_name, signature):
+  '''Runs the instrumented build of compiler_name on its training set, for
+     each implementation built with it, and merges the resulting profiles.'''
+  compiler = config.COMPILERS[compiler_name]
+  profile_directory = profileDirectory(version, compiler_name)
+  build_directory = os.path.join(versionDirectory(version), compiler_name,
+                                 config.BUILD_PREFIX)
+  for training in json.loads(signature):
+    exe_path = os.path.join(build_directory, training["path"])
+    for fname in training["files"]:
+      print("training ", compiler_name, " ", training["target"], " on ", fname,
+            sep="")
+      input_path = os.path.join(config.DATASET_ROOT, fname)
+      stages = decompressionStages(input_path) \
+             + [[exe_path] + training["arguments"]]
+      processes = []
+      with open(input_path, 'rb') as input_file:
+        stdin = input_file
+        for (index, stage) in enumerate(stages):
+          last = index == len(stages) - 1
+          processes.append(subprocess.Popen(stage, stdin=stdin,
+                    stdout=subprocess.DEVNULL if last else subprocess.PIPE))
+          if index > 0:
+            # next stage has its own copy
+            stdin.close()
+          stdin = processes[-1].stdout
+      for process in processes:
+        if process.wait() != 0:
+          error("Training run ", process.args, " on ", fname, " failed")
+
+  if "profile_merge" in compiler:
+    merge = [argument.format(profile_directory)
+             for argument in compiler["profile_merge"]]
+    raw_profiles = sorted(glob.glob(os.path.join(profile_directory, "*.profraw")))
+    subprocess.run(merge + raw_profiles, check=True)
+  # instrumented objects must not be reused by the final build
+  shutil.rmtree(build_directory)
+  with open(os.path.join(profile_directory, "complete"), 'w') as f:
+    f.write(signature)
+
+def buildImplementations(implementations, keep_going=False):
+  '''keep_going: if a build fails, warn rather than exit. The caller should
+     check which executables exist.'''
   build_targets = findBuildTargets(implementations)
   
   # TODO: make sure this is safe
   #clean()
+  os.makedirs(config.WORKING_DIRECTORY, exist_ok=True)
+  checked_out = builder.checkoutAll(config.PROJECT_ROOT,
+                      {version : versionDirectory(version)
+                       for version in build_targets})
+  builds = []
+  # PGO builds without a profile: built instrumented, trained, then rebuilt
+  training = []
   for version, targets in build_targets.items():
     print(version, end="")
-    if gitCheckout(version):
+    if checked_out[version]:
       print(": checked out, ", end="")
     else:
       print(": skipped checkout, ", end="")
-    build(version, targets)
-    print(" built ", targets)
+    print("building ", targets)
+    for (compiler_name, compiler_targets) in targets.items():
+      if "pgo" in config.COMPILERS[compiler_name]:
+        signature = profileSignature(implementations, version, compiler_name)
+        if not profileComplete(version, compiler_name, signature):
+          # start afresh: stale profile or objects would otherwise be used
+          shutil.rmtree(profileDirectory(version, compiler_name),
+                        ignore_errors=True)
+          shutil.rmtree(os.path.join(versionDirectory(version), compiler_name),
+                        ignore_errors=True)
+          training.append((version, compiler_name, compiler_targets, signature))
+          builds.append(buildSpec(version, compiler_name, compiler_targets,
+                                  instrumented=True))
+          continue
+      builds.append(buildSpec(version, compiler_name, compiler_targets))
+  
+  launcher = config.COMPILER_LAUNCHER
+  if launcher and not shutil.which(launcher):
+    print("WARNING: ", launcher, " not found, building without it")
+    launcher = None
+  try:
+    builder.buildAll(builds, config.BUILD_JOBS, config.MAKE_FLAGS, launcher,
+                     cache_root=config.WORKING_DIRECTORY)
+    if training:
+      for (version, compiler_name, _, signature) in training:
+        trainProfile(version, compiler_name, signature)
+      builder.buildAll([buildSpec(version, compiler_name, compiler_targets)
+                        for (version, compiler_name, compiler_targets, _)
+                        in training],
+                       config.BUILD_JOBS, config.MAKE_FLAGS, launcher,
+                       cache_root=config.WORKING_DIRECTORY)
+  except subprocess.CalledProcessError:
+    if not keep_going:
+      raise
+    print("WARNING: some builds failed, see log/makefile.err of each build")
+    return
+  print("built all")
     
 class ExitCodeException(Exception):
   def __init__(self, exit_code):
@@ -174,44 +283,46 @@ class ExitCodeException(Exception):
   def __str__(self):
     return repr(self.exit_code)
 
+def decompressionStages(input_path):
+  '''Stages to put at the start of a pipeline reading input_path: empty,
+     unless input_path is compressed (see config.DECOMPRESSORS)'''
+  for (suffix, commands) in config.DECOMPRESSORS.items():
+    if input_path.endswith(suffix):
+      for command in commands:
+        if shutil.which(command[0]):
+          return [command]
+      error("No decompressor installed for ", input_path)
+  return []
+
+# Commands return the stages of a pipeline, to be run by runner.Pipeline.
+# The input file is opened as stdin of the first stage: no need for cat, or
+# for Python to read everything in and echo it out.
 def createNativeCommand(exe_path, arguments):
-  native_command = sh.Command(exe_path).bake(*arguments)
-  def runCommand(input_path, output_path, *extra_arguments, error_path=None):
-    # Due to a quirk of sh's design, having cat pipe the file contents is
-    # *considerably* faster than using _in directly (in which case Python
-    # will have to read everything in, and then echo it out. Seriously slow.)
-    if not error_path:
-      return native_command(sh.cat(input_path, _piped="direct"),
-                            *extra_arguments, _out=output_path, _iter="err")
-    else:
-      return native_command(sh.cat(input_path, _piped="direct"),
-                            *extra_arguments, _out=output_path, _err=error_path, 
-                            _bg=True)
-  return runCommand
+  def command(*extra_arguments):
+    return [[exe_path] + arguments + list(extra_arguments)]
+  return command
 
 def createWrapperCommand(exe_path, arguments):
   '''full solver to be used as incremental'''
-  snapshots = config.SNAPSHOT_CREATOR_PROGRAM
-  command = config.SNAPSHOT_SOLVER_PROGRAM.bake(exe_path, *arguments)
-  def runCommand(input_path, output_path, *extra_arguments, error_path=None):
-    # See createNativeCommand for why I'm using cat
-    if not error_path:
-      return command(
-                snapshots(sh.cat(input_path, _piped="direct"), _piped="direct"), 
-                *extra_arguments, _out=output_path, _iter="err")
-    else:
-      return command(
-                snapshots(sh.cat(input_path, _piped="direct"), _piped="direct"), 
-                *extra_arguments, _out=output_path, _err=error_path, _bg=True)
-  return runCommand
+  def command(*extra_arguments):
+    snapshots = [config.SNAPSHOT_CREATOR_PROGRAM_PATH] \
+              + config.SNAPSHOT_CREATOR_PROGRAM_ARGUMENTS
+    solver = [config.SNAPSHOT_SOLVER_PROGRAM_PATH, exe_path] \
+           + arguments + list(extra_arguments)
+    return [snapshots, solver]
+  return command
+
+def executablePath(implementation):
+  compiler = implementation.get("compiler", config.DEFAULT_COMPILER)
+  return os.path.join(versionDirectory(implementation["version"]), compiler,
+                      config.BUILD_PREFIX, implementation["path"])
 
 def helperCreateTestInstance(instance):
   implementation = implementations[implementationKey(instance)]
   
   version_directory = versionDirectory(implementation["version"])
   compiler = implementation.get("compiler", config.DEFAULT_COMPILER)
-  exe_path = os.path.join(version_directory, compiler, 
-                          config.BUILD_PREFIX, implementation["path"])
+  exe_path = executablePath(implementation)
   arguments = []
   if "arguments" in implementation:
     arguments += implementation["arguments"]
@@ -221,7 +332,23 @@ def helperCreateTestInstance(instance):
   return {"implementation": implementation,
           "version_directory": version_directory,
           "exe_path": exe_path,
-          "arguments": arguments}
+          "arguments": arguments,
+          "compiler": config.COMPILERS[compiler]}
+
+def describeTestInstance(parameters, arguments, runner_type):
+  '''Everything identifying what a test instance runs, for the result store.
+     implementation includes the commit ID, target and compiler name.'''
+  implementation = parameters["implementation"]
+  description = {"implementation": implementation,
+                 "compiler": parameters["compiler"],
+                 "arguments": arguments,
+                 "runner": runner_type}
+  if "pgo" in parameters["compiler"]:
+    # retraining changes the build, but not its commit or compiler
+    compiler_name = implementation.get("compiler", config.DEFAULT_COMPILER)
+    description["profile"] = trainedProfileSignature(
+                               implementation["version"], compiler_name)
+  return description
 
 def createFullTestInstance(instance, extra_arguments=None):
   parameters = helperCreateTestInstance(instance)
@@ -238,7 +365,8 @@ def createFullTestInstance(instance, extra_arguments=None):
     test_command = createNativeCommand(parameters["exe_path"],
                                        arguments)
     return {"cmd": test_command, 
-            "version_directory": parameters["version_directory"]
+            "version_directory": parameters["version_directory"],
+            "description": describeTestInstance(parameters, arguments, "native")
            }
   else:
     error("Illegal solver type ", solver_type, "for full test")
@@ -254,19 +382,31 @@ def createIncrementalTestInstance(instance):
     arguments += implementation["offline_arguments"]
   
   test_command = None
+  runner_type = None
   if solver_type == "full":
     test_command = createWrapperCommand(exe_path, arguments)
+    runner_type = "wrapper"
   elif solver_type == "incremental":
     test_command = createNativeCommand(exe_path, arguments)
+    runner_type = "native"
   else: 
     error("Unrecognised implementation type ", implementation)
 
-  return {"cmd": test_command,
-          "version_directory": parameters["version_directory"]
-         }
+  test_instance = {"cmd": test_command,
+                   "version_directory": parameters["version_directory"],
+                   "description": describeTestInstance(parameters, arguments,
+                                                       runner_type)
+                  }
+  if solver_type == "full":
+    # for solving snapshots individually, see runSnapshotUnit
+    test_instance["snapshot_cmd"] = createNativeCommand(exe_path, arguments)
+    test_instance["snapshot_description"] = \
+                describeTestInstance(parameters, arguments, "snapshot")
+  return test_instance
 
 def runTestInstance(test_name, test_command, log_directory, fname, iteration,
-                    timeout, *extra_arguments, log_fname=None):
+                    timeout, *extra_arguments, log_fname=None,
+                    sample_memory=False, run_bound=None):
   input_path = os.path.join(config.DATASET_ROOT, fname)
   
   if not log_fname:
@@ -288,64 +428,28 @@ def runTestInstance(test_name, test_command, log_directory, fname, iteration,
   prefix = test_name + "-offline_" + str(iteration)
   out_path = os.path.join(log_directory, prefix + ".out")
   err_path = os.path.join(log_directory, prefix + ".err")
-  with open(err_path, 'w') as err_file:      
-    signal.alarm(timeout)
-    try:
-      running_command = test_command(input_path, out_path, *extra_arguments)
-      
-      start_time = time.time()
-      
-      algotime_prefix = "ALGOTIME: "
-      for error_line in running_command:
-        if error_line == "STARTTIME\n":
-          # Reset timer. We will not always receive STARTTIME, only when there
-          # is some overhead we want to discount. For example, snapshot_solver
-          # outputs STARTTIME immediately before launching the solver. This way,
-          # we can discount the time taken to generate the snapshots themselves.
-          start_time = time.time()
-        elif error_line.find(algotime_prefix) == 0:
-          # record algorithm running time
-          algorithm_running_time = error_line[len(algotime_prefix):].strip()
-          
-          # record total time (includes parsing, etc)          
-          end_time = time.time()
-          # TODO: Is this an accurate way of measuring the total times?
-          time_elapsed = end_time - start_time
-          
-          yield((algorithm_running_time, time_elapsed))
-          
-          # reset timer
-          start_time = time.time()
-          # reset timeout
-          signal.alarm(timeout)
-        else:
-          err_file.write(error_line)
-      
-      # clear timeout
-      signal.alarm(0)  
-      if running_command.exit_code != 0:
-        raise ExitCodeException(result.exit_code)
-    except Alarm:
-      yield (("Timeout", "Timeout"))
-      running_command.terminate()
-
-class ReadCsv(object):
-  def __init__(self, fifo_path, read_events):
-    self.fifo_path = fifo_path
-    self.read_events = read_events
-    self.csv_rows = None
-  def read(self):
-    with open(self.fifo_path, 'r') as stats_file:
-      csv_reader = csv.DictReader(stats_file)
-      self.csv_rows = list(csv_reader)
-    for e in self.read_events:
-      e.set()
-    
-def wait_for_completion(running_command, events):
-  running_command.wait()
-  time.sleep(1)
-  for e in events:
-    e.set()
+  stages = decompressionStages(input_path) + test_command(*extra_arguments)
+  pipeline = runner.Pipeline(stages, out_path,
+                             stdin_fd=staging_area.open(input_path))
+  with open(err_path, 'w') as err_file:
+    # timeout applies to each delta (ALGOTIME) in turn
+    sampler = runner.memorySample if sample_memory else None
+    run = runner.algorithmTimes(pipeline, err_file, timeout, sampler=sampler,
+                                run_bound=run_bound)
+    # Resource usage is only known once the solver has been reaped. Hold back
+    # each result until the next arrives, so it can be attached to the last.
+    previous = None
+    for times in runner.iterate(run):
+      if previous:
+        yield previous
+      previous = times
+    if previous:
+      algorithm_time, time_elapsed, resources = previous
+      resources = dict(resources, **pipeline.rusage)
+      yield (algorithm_time, time_elapsed, resources)
+  
+  if not pipeline.killed and pipeline.exit_code != 0:
+    raise ExitCodeException(pipeline.exit_code)
 
 def runApproximateTestInstance(test_name, test_command, log_directory, fname,
           iteration, timeout, log_fname=None):
@@ -379,152 +483,846 @@ def runApproximateTestInstance(test_name, test_command, log_directory, fname,
   arguments = ["--statistics", fifo_path]
   
   try:
-    signal.alarm(timeout)
-    running_command = test_command(input_path, out_path, error_path=err_path,
-                                   *arguments)
-    
-    wake_up = threading.Event()
-    
-    stats_read = threading.Event()
-    stats_reader = ReadCsv(fifo_path, [stats_read, wake_up])
-    process_completed = threading.Event()
-    
-    # spin up threads
-    wait_t = threading.Thread(target=wait_for_completion,
-                              args=(running_command, [process_completed, wake_up]))
-    wait_t.start()
-    reader_t = threading.Thread(target=ReadCsv.read, args=(stats_reader,))
-    reader_t.setDaemon(True)
-    reader_t.start()
-
-    while not process_completed.isSet():
-      wake_up.wait()
-      wake_up.clear()
-      
-      if stats_read.isSet():
-        # clear timeout 
-        signal.alarm(0)
-        
-        yield stats_reader.csv_rows
-        
-        stats_read.clear()
-        t = threading.Thread(target=ReadCsv.read, args=(stats_reader,))
-        t.setDaemon(True)
-        t.start()
-        
-        # reset timeout
-        signal.alarm(timeout)
-    # process has terminated, end
-        
-    # clear timeout
-    signal.alarm(0)
+    stages = decompressionStages(input_path) + test_command(*arguments)
+    pipeline = runner.Pipeline(stages, out_path, err_path=err_path,
+                               stdin_fd=staging_area.open(input_path))
+    # yields list of rows for each delta; timeout reset after each delta
+    run = runner.statistics(pipeline, fifo_path, timeout)
+    # as for runTestInstance, resource usage attached to the final delta
+    previous = None
+    for stats in runner.iterate(run):
+      if previous:
+        yield (previous, {})
+      previous = stats
+    if previous:
+      yield (previous, pipeline.rusage)
       
-    if running_command.exit_code != 0:
-      raise ExitCodeException(result.exit_code)
-  except Alarm:
-    yield "Timeout"
-    running_command.terminate()
+    if not pipeline.killed and pipeline.exit_code != 0:
+      raise ExitCodeException(pipeline.exit_code)
   finally:
     os.unlink(fifo_path)
 
 # SOMEDAY: Ugly how logic and IO are intermixed here. You could perhaps switch
 # to putting the logic in a generator, and iterate over the results yielded
 
-def runFullTest(case_name, case_config, result_file):      
-  fieldnames = ["test", "file", "iteration", "algorithm_time", "total_time"]
-  result_writer = csv.DictWriter(result_file,fieldnames=fieldnames)
-  result_writer.writeheader()
-  iterations = case_config["iterations"]
+class Progress(object):
+  '''prints "<file> : <iteration> <iteration> ..." as results come in'''
+  def __init__(self):
+    self.fname = None
+    self.iteration = None
+    
+  def update(self, fname, iteration):
+    if fname != self.fname:
+      if self.fname is not None:
+        print("")
+      print("\t", fname, ": ", end="")
+      self.fname = fname
+      self.iteration = None
+    if iteration != self.iteration:
+      print(iteration, " ", end="")
+      self.iteration = iteration
+      
+  def finish(self):
+    if self.fname is not None:
+      print("")
+
+def runTestUnit(create_instance, case_name, case_config, test_name, fname, i):
+  '''Runs a single (test, file, iteration) unit. Returns list of times.
+     
+     Module-level, and only takes picklable arguments, so it can be executed
+     by a worker in the pool. (The commands in a test instance are closures,
+     which can't be pickled, so the instance is created here, in the
+     worker.)'''
+  test_instance = create_instance(case_config["tests"][test_name])
+  log_directory = os.path.join(test_instance["version_directory"],
+                               "log", case_name)
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  sample_memory = case_config.get("sample_memory", False)
   
-  tests = case_config["tests"]
-  test_instances = {test_name : createFullTestInstance(tests[test_name])
-                   for test_name in tests}
+  race_board = raceBoard(case_name, case_config)
+  run_bound = None
+  if race_board:
+    run_bound = lambda : race_board.bound(fname, test_name)
   
-  for fname in case_config["files"]:
-    print("\t", fname, ": ", end="")
-    
+  # Iteration i of a run is served from the store if we've done it before
+  input_path = os.path.join(config.DATASET_ROOT, fname)
+  key = store.runKey(test_instance["description"], input_path,
+                     {"timeout": timeout, "sample_memory": sample_memory})
+  times = store.lookup(key, i)
+  if times is None:
+    times = list(runTestInstance(test_name, test_instance["cmd"], log_directory,
+                                 fname, i, timeout, sample_memory=sample_memory,
+                                 run_bound=run_bound))
+    # depends on how the other tests did: wouldn't be reproducible
+    if not any("race_bound" in resources for (_, _, resources) in times):
+      store.record(key, i, times)
+  postRaceResult(race_board, test_name, fname, i, times)
+  return times
+
+def runSnapshotUnit(create_instance, case_name, case_config, test_name, fname,
+                    i, delta_id, snapshot_path):
+  '''Solves snapshot_path, the snapshot of fname after delta delta_id, with the
+     full solver of test_name. Returns list containing the times of that delta:
+     concatenating these for all the snapshots gives the times of a run.'''
+  test_instance = create_instance(case_config["tests"][test_name])
+  log_directory = os.path.join(test_instance["version_directory"],
+                               "log", case_name)
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  sample_memory = case_config.get("sample_memory", False)
+  
+  input_path = os.path.join(config.DATASET_ROOT, fname)
+  key = store.runKey(test_instance["snapshot_description"], input_path,
+                     {"timeout": timeout, "sample_memory": sample_memory,
+                      "delta_id": delta_id})
+  times = store.lookup(key, i)
+  if times is None:
+    log_fname = os.path.join(fname, "snapshot_" + str(delta_id))
+    times = list(runTestInstance(test_name, test_instance["snapshot_cmd"],
+                                 log_directory, snapshot_path, i, timeout,
+                                 log_fname=log_fname,
+                                 sample_memory=sample_memory))
+    store.record(key, i, times)
+  return times
+
+def raceBoard(case_name, case_config):
+  '''RaceBoard of the case, or None if it doesn't use relative timeouts'''
+  if "race_factor" not in case_config or case_config["type"] != "full":
+    return None
+  return racing.RaceBoard(os.path.join(config.WORKING_DIRECTORY, "race",
+                                       case_name),
+                          case_config["race_factor"])
+
+def raceOrder(case_config):
+  '''Tests of the case, in the order they are run on each file. Until one
+     test has solved a file, there is no bound on the others: so those in
+     "race_first", known to be fast, are run first.'''
+  tests = list(case_config["tests"])
+  first = [test_name for test_name in case_config.get("race_first", [])
+           if test_name in tests]
+  return first + [test_name for test_name in tests if test_name not in first]
+
+def postRaceResult(race_board, test_name, fname, i, times):
+  if not race_board:
+    return
+  (algorithm_time, time_elapsed, _) = times[-1]
+  if algorithm_time != "Timeout":
+    race_board.post(fname, test_name, i, time_elapsed)
+
+def callUnit(function, *args):
+  return function(*args)
+
+def snapshotFanout(case_config, test_name):
+  '''True if test_name is a full solver whose snapshots should be solved
+     concurrently, rather than in turn by snapshot_solver'''
+  if not case_config.get("snapshot_fanout", False):
+    return False
+  instance = case_config["tests"][test_name]
+  return implementations[implementationKey(instance)]["type"] == "full"
+
+def mapUnits(units, skip=None, known=None):
+  '''As pool.map(runTestUnit, units, skip, known). But if the case has
+     "snapshot_fanout" set, runs of full solvers are split into one work item
+     per snapshot (see runSnapshotUnit), so the snapshots are solved
+     concurrently. Their times are collected back into a single result for
+     the unit, in order of delta.'''
+  # snapshots of each input, pinned until the units have run
+  pinned = {}
+  with contextlib.ExitStack() as pins:
+    items = []
+    for u in units:
+      _, _, case_config, test_name, fname, _ = u
+      if (snapshotFanout(case_config, test_name)
+          and not (skip and skip(u))
+          and not (known and known(u) is not None)):
+        input_path = os.path.join(config.DATASET_ROOT, fname)
+        if input_path not in pinned:
+          pinned[input_path] = pins.enter_context(
+                                 snapshot_cache.pin(input_path))
+          # they may have taken the cache over its quota
+          snapshot_cache.collect()
+        for (delta_id, snapshot_path) in enumerate(pinned[input_path]):
+          items.append((runSnapshotUnit,) + u + (delta_id, snapshot_path))
+      else:
+        items.append((runTestUnit,) + u)
+  
+    # (test, file, iteration) of runs which have timed out: as when run by
+    # snapshot_solver, no later deltas are solved
     timedout = set()
-    for i in range(iterations):
-      print(i, " ", end="")
+    def runKey(u):
+      _, _, _, test_name, fname, i = u
+      return (test_name, fname, i)
+    def skipItem(item):
+      function, u = item[0], item[1:7]
+      if function == runSnapshotUnit:
+        return runKey(u) in timedout
+      return skip and skip(u)
+    def knownItem(item):
+      function, u = item[0], item[1:7]
+      if function == runSnapshotUnit:
+        return None
+      return known and known(u)
+  
+    pending = None
+    for (item, result) in pool.map(callUnit, items, skipItem, knownItem):
+      function, u = item[0], item[1:7]
+      if pending and pending[0] != u:
+        yield pending
+        pending = None
+      if function == runTestUnit:
+        yield (u, result)
+        continue
+    
+      if not pending:
+        pending = (u, [])
+      pending[1].extend(result)
+      if unitRunningTime(result) is None:
+        timedout.add(runKey(u))
+    if pending:
+      yield pending
+  if pinned:
+    snapshot_cache.collect()
+
+def unitRunningTime(times):
+  '''total algorithm time over all deltas of a run; None if it timed out'''
+  if any(algorithm_time == "Timeout" for (algorithm_time, _, _) in times):
+    return None
+  return sum(float(algorithm_time) for (algorithm_time, _, _) in times)
+
+def runTestUnits(create_instance, case_name, case_config, journal, skip=None):
+  '''Yields (unit, times) for each (test, file, iteration) of the case, in
+     order of file, iteration and then test. Units already committed to the
+     journal are not run again: their times are taken from the journal.
+     
+     If the case has an adaptive iteration count, each (test, file) pair is
+     repeated in rounds until its running time has converged. Rounds are
+     sized to keep the workers busy. Rows for a file may then be interleaved
+     with those of other files, but iterations of a pair are always in order.'''
+  files = case_config["files"]
+  tests = raceOrder(case_config)
+  def unit(test_name, fname, i):
+    return (create_instance, case_name, case_config, test_name, fname, i)
+  def known(u):
+    _, _, _, test_name, fname, i = u
+    state = journal.state(test_name, fname, i)
+    if state is None:
+      return None
+    return [tuple(times) for times in state["times"]]
+  
+  if not adaptive.enabled(case_config):
+    units = [unit(test_name, fname, i)
+             for fname in files
+             for i in range(case_config["iterations"])
+             for test_name in tests]
+    yield from mapUnits(units, skip, known)
+    return
+  
+  min_iterations, max_iterations = adaptive.iterationBounds(case_config)
+  pairs = [(fname, test_name) for fname in files for test_name in tests]
+  samples = {pair : [] for pair in pairs}
+  stopped = set()
+  completed = {pair : 0 for pair in pairs}
+  batch = {pair : min_iterations for pair in pairs}
+  while batch:
+    units = [unit(test_name, fname, i)
+             for fname in files
+             for i in range(max_iterations)
+             for test_name in tests
+             if (fname, test_name) in batch
+             and completed[(fname, test_name)] <= i
+             and i < completed[(fname, test_name)] + batch[(fname, test_name)]]
+    for (u, times) in mapUnits(units, skip, known):
+      yield (u, times)
       
-      for test_name, test_config in test_instances.items():
-        if test_name in timedout:
-          continue
-        
-        log_directory = os.path.join(test_config["version_directory"],
-                                     "log", case_name)
-        timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
-        run = runTestInstance(test_name, test_config["cmd"], log_directory,
-                              fname, i, timeout)
-        times = list(run)
-        
-        assert(len(times) == 1)
-        algorithm_time, time_elapsed = times[0]
-        
-        result = { "test": test_name,
-                   "file": fname,
-                   "iteration": i,
-                   "algorithm_time": algorithm_time,
-                   "total_time": time_elapsed }
-        result_writer.writerow(result)
-        result_file.flush()
-        
-        if algorithm_time == "Timeout":
-          timedout.add(test_name)
-        
-    print("")
+      _, _, _, test_name, fname, _ = u
+      running_time = unitRunningTime(times)
+      if running_time is None:
+        stopped.add((fname, test_name))
+      else:
+        samples[(fname, test_name)].append(running_time)
+    
+    for pair in batch:
+      completed[pair] += batch[pair]
+    active = [pair for pair in pairs
+              if pair not in stopped
+              and not (skip and skip(unit(pair[1], pair[0], completed[pair])))
+              and completed[pair] < max_iterations
+              and not adaptive.converged(case_config, config.CONFIDENCE_LEVEL,
+                                         samples[pair])]
+    # one more iteration of each active pair, or more if workers would idle
+    per_pair = max(1, pool.jobs // max(1, len(active)))
+    batch = {pair : min(per_pair, max_iterations - completed[pair])
+             for pair in active}
 
-def runIncrementalOfflineTest(case_name, case_config, result_file):
-  fieldnames = ["test", "file", "delta_id", 
-                "iteration", "algorithm_time", "total_time"]
+FULL_FIELDS = ["test", "file", "iteration", "algorithm_time", "total_time"] \
+            + RUSAGE_FIELDS
+
+def fullResultWriter(result_file):
+  # race_bound: set if killed early (see racing)
+  fieldnames = FULL_FIELDS + ["race_bound"]
   result_writer = csv.DictWriter(result_file,fieldnames=fieldnames)
-  result_writer.writeheader()
-  iterations = case_config["iterations"]
+  if result_file.tell() == 0:
+    result_writer.writeheader()
+  return result_writer
+
+def recordFullUnit(result_writer, journal, unit, times):
+  _, _, _, test_name, fname, i = unit
+  assert(len(times) == 1)
+  algorithm_time, time_elapsed, resources = times[0]
   
-  tests = case_config["tests"]
-  test_instances = {test_name : createIncrementalTestInstance(tests[test_name])
-                   for test_name in tests}
+  if not journal.done(test_name, fname, i):
+    result = { "test": test_name,
+               "file": fname,
+               "iteration": i,
+               "algorithm_time": algorithm_time,
+               "total_time": time_elapsed }
+    result.update(resources)
+    result_writer.writerow(result)
+    journal.commit(test_name, fname, i, times=times)
+
+def runFullTest(case_name, case_config, result_file, journal):      
+  race_board = raceBoard(case_name, case_config)
+  if race_board and not journal.entries:
+    # when resuming, keep the times posted by the committed runs
+    race_board.clear()
+  
+  if "colocate" in case_config:
+    runColocatedTest(createFullTestInstance, case_name, case_config,
+                     result_file, journal, FULL_FIELDS)
+    return
+
+  if halving.enabled(case_config):
+    (ranking, scores) = runFullHalvingTest(case_name, case_config,
+                                           result_file, journal)
+    print("\tbest: ", ", ".join("{0} ({1})".format(test_name, scores[test_name])
+                                for test_name in ranking))
+    return
   
+  result_writer = fullResultWriter(result_file)
+  
+  # (file, test) pairs which have timed out: no point running them again
+  timedout = set()
+  def skip(unit):
+    _, _, _, test_name, fname, _ = unit
+    return (fname, test_name) in timedout
+  
+  progress = Progress()
+  for (unit, times) in runTestUnits(createFullTestInstance, case_name,
+                                    case_config, journal, skip):
+    _, _, _, test_name, fname, i = unit
+    progress.update(fname, i)
+    recordFullUnit(result_writer, journal, unit, times)
+    if unitRunningTime(times) is None:
+      timedout.add((fname, test_name))
+      
+  progress.finish()
+
+### Co-located runs
+
+# Instances run at once, which instance, and its slowdown relative to running
+# alone (which is recorded as instance 0 of 1)
+COLOCATE_FIELDS = ["instances", "instance", "slowdown"]
+
+def runColocatedTestInstances(test_name, test_command, log_directory, fname,
+                              iteration, timeout, cpu_sets,
+                              sample_memory=False):
+  '''As runTestInstance, but starts an instance pinned to each of cpu_sets at
+     the same time. Returns list of the times of each instance.'''
+  input_path = os.path.join(config.DATASET_ROOT, fname)
+  log_directory = os.path.join(log_directory, fname)
+  if not(os.path.exists(input_path)):
+    error("Cannot open ", input_path, "for reading")
+  os.makedirs(log_directory, exist_ok=True)
+
+  sampler = runner.memorySample if sample_memory else None
+  pipelines = []
+  runs = []
+  with contextlib.ExitStack() as stack:
+    for (instance, cpus) in enumerate(cpu_sets):
+      prefix = "{0}-offline_{1}_colocated_{2}of{3}".format(test_name,
+                 iteration, instance, len(cpu_sets))
+      out_path = os.path.join(log_directory, prefix + ".out")
+      err_file = stack.enter_context(
+                   open(os.path.join(log_directory, prefix + ".err"), 'w'))
+      stages = decompressionStages(input_path) + test_command()
+      # each instance reads the input through its own file offset
+      pipeline = runner.Pipeline(stages, out_path,
+                                 stdin_fd=staging_area.open(input_path),
+                                 cpus=cpus)
+      pipelines.append(pipeline)
+      runs.append(runner.algorithmTimes(pipeline, err_file, timeout,
+                                        sampler=sampler))
+    runs = runner.concurrently(runs)
+
+  for (pipeline, times) in zip(pipelines, runs):
+    if not pipeline.killed and pipeline.exit_code != 0:
+      raise ExitCodeException(pipeline.exit_code)
+    if times:
+      # as in runTestInstance: resource usage attached to the last delta
+      algorithm_time, time_elapsed, resources = times[-1]
+      times[-1] = (algorithm_time, time_elapsed,
+                   dict(resources, **pipeline.rusage))
+  return runs
+
+def runColocatedTest(create_instance, case_name, case_config, result_file,
+                     journal, fieldnames):
+  '''Runs each test alone, then as n identical instances at once (see
+     "colocate" in config), recording the slowdown of each delta of each
+     instance relative to running alone. Runs are made one at a time from
+     this process: other work on the machine would distort them.'''
+  fieldnames = fieldnames + COLOCATE_FIELDS
+  result_writer = csv.DictWriter(result_file, fieldnames=fieldnames)
+  if result_file.tell() == 0:
+    result_writer.writeheader()
+
+  instances = case_config["colocate"]["n"]
+  pin = case_config["colocate"].get("pin", "isolated")
+  cpu_sets = parallel.colocationCpus(instances, pin)
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  sample_memory = case_config.get("sample_memory", False)
   for fname in case_config["files"]:
-    print("\t", fname, ": ", end="")
+    for (test_name, test_config) in case_config["tests"].items():
+      test_instance = create_instance(test_config)
+      log_directory = os.path.join(test_instance["version_directory"],
+                                   "log", case_name)
+      print("\t", test_name, fname, ": ", end="", flush=True)
+      slowdowns = []
+      for i in range(case_config["iterations"]):
+        if journal.done(test_name, fname, i):
+          continue
+        def run(cpu_sets):
+          return runColocatedTestInstances(test_name, test_instance["cmd"],
+                   log_directory, fname, i, timeout, cpu_sets, sample_memory)
+        # alone, on the CPUs of the first instance
+        (solo,) = run(cpu_sets[:1])
+        runs = run(cpu_sets)
+
+        for (instance, times) in [(None, solo)] + list(enumerate(runs)):
+          for (delta_id, (algorithm_time, time_elapsed, resources)) \
+              in enumerate(times):
+            result = {"test": test_name,
+                      "file": fname,
+                      "iteration": i,
+                      "algorithm_time": algorithm_time,
+                      "total_time": time_elapsed,
+                      "instances": 1 if instance is None else instances,
+                      "instance": instance or 0}
+            if "delta_id" in fieldnames:
+              result["delta_id"] = delta_id
+            solo_time = solo[delta_id][1] if delta_id < len(solo) else None
+            if instance is not None and time_elapsed != "Timeout" and \
+               solo_time not in [None, "Timeout", 0]:
+              result["slowdown"] = time_elapsed / solo_time
+            result.update(resources)
+            result_writer.writerow(result)
+          if instance is not None and unitRunningTime(times) is not None \
+             and unitRunningTime(solo) is not None:
+            solo_time = sum(t for (_, t, _) in solo)
+            if solo_time > 0:
+              slowdowns.append(sum(t for (_, t, _) in times) / solo_time)
+        journal.commit(test_name, fname, i)
+      if slowdowns:
+        print("{0:.2f}x slowdown (mean of {1} instance runs)".format(
+              sum(slowdowns) / len(slowdowns), len(slowdowns)))
+      else:
+        print("")
+
+def inputSize(fname):
+  try:
+    return os.path.getsize(os.path.join(config.DATASET_ROOT, fname))
+  except OSError:
+    # reported when it is run
+    return 0
+
+def runFullHalvingTest(case_name, case_config, result_file, journal):
+  '''As runFullTest, but races the tests against one another by successive
+     halving (see halving), so only the best are run on every file, for
+     every iteration. Early rounds use the case's "initial_files", then the
+     smallest files. Every run is recorded in result_file, as for
+     runFullTest; since later rounds include the runs of earlier ones, these
+     are not repeated.
+     Returns the tests of the final round, best first, and their scores.'''
+  assert(not adaptive.enabled(case_config))
+  (eta, survivors, initial_files) = halving.options(case_config)
+  result_writer = fullResultWriter(result_file)
+  initial_files = [fname for fname in initial_files
+                   if fname in case_config["files"]]
+  files = initial_files + sorted([fname for fname in case_config["files"]
+                                  if fname not in initial_files], key=inputSize)
+  
+  timedout = set()
+  def skip(unit):
+    _, _, _, test_name, fname, _ = unit
+    return (fname, test_name) in timedout
+  
+  def evaluate(test_names, num_files, iterations):
+    print("\tround: ", len(test_names), " tests, ", num_files, " files, ",
+          iterations, " iterations", sep="")
+    round_config = dict(case_config, files=files[:num_files],
+                        iterations=iterations,
+                        tests={test_name : case_config["tests"][test_name]
+                               for test_name in test_names})
+    samples = {test_name : {} for test_name in test_names}
+    progress = Progress()
+    for (unit, times) in runTestUnits(createFullTestInstance, case_name,
+                                      round_config, journal, skip):
+      _, _, _, test_name, fname, i = unit
+      progress.update(fname, i)
+      recordFullUnit(result_writer, journal, unit, times)
+      running_time = unitRunningTime(times)
+      if running_time is None:
+        timedout.add((fname, test_name))
+      samples[test_name].setdefault(fname, []).append(running_time)
+    progress.finish()
+    # timed out pairs are skipped in later iterations: still count as such
+    for (fname, test_name) in timedout:
+      if test_name in samples:
+        samples[test_name].setdefault(fname, []).append(None)
+    return {test_name : halving.score(samples[test_name])
+            for test_name in test_names}
+  
+  rounds = halving.schedule(len(case_config["tests"]), len(files),
+                            case_config["iterations"], eta, survivors,
+                            min_files=len(initial_files))
+  return halving.successiveHalving(list(case_config["tests"]), rounds,
+                                   evaluate)
+
+OFFLINE_FIELDS = ["test", "file", "delta_id", "iteration", "algorithm_time",
+                  "total_time"] + MEMORY_FIELDS + RUSAGE_FIELDS
+
+def runIncrementalOfflineTest(case_name, case_config, result_file, journal):
+  if "colocate" in case_config:
+    runColocatedTest(createIncrementalTestInstance, case_name, case_config,
+                     result_file, journal, OFFLINE_FIELDS)
+    return
+
+  fieldnames = OFFLINE_FIELDS
+  result_writer = csv.DictWriter(result_file,fieldnames=fieldnames)
+  if result_file.tell() == 0:
+    result_writer.writeheader()
+  
+  progress = Progress()
+  for (unit, times) in runTestUnits(createIncrementalTestInstance, case_name,
+                                    case_config, journal):
+    _, _, _, test_name, fname, i = unit
+    progress.update(fname, i)
+    if journal.done(test_name, fname, i):
+      continue
     
-    for i in range(iterations):
-      print(i, " ", end="")
+    for (delta_id, (algorithm_time, time_elapsed, resources)) in enumerate(times):
+      result = { "test": test_name,
+                 "file": fname,
+                 "delta_id": delta_id, 
+                 "iteration": i,
+                 "algorithm_time": algorithm_time,
+                 "total_time": time_elapsed }
+      result.update(resources)
+      result_writer.writerow(result)
+    journal.commit(test_name, fname, i, times=times)
       
-      timedout = set()
-      for test_name, test_config in test_instances.items():
-        if test_name in timedout:
+  progress.finish()
+
+EOI_LINE = b"c EOI\n"
+
+def incrementalDeltas(input_path):
+  '''Yields the initial graph then each delta of the incremental graph at
+     input_path (decompressing it if needed), as bytes, each ending in c EOI.'''
+  stages = decompressionStages(input_path)
+  if stages:
+    with open(input_path, 'rb') as compressed:
+      # decompressor has its own copy
+      decompressor = subprocess.Popen(stages[0], stdout=subprocess.PIPE,
+                                      stdin=compressed)
+    f = decompressor.stdout
+  else:
+    decompressor = None
+    f = open(input_path, 'rb')
+  try:
+    delta = []
+    for line in f:
+      delta.append(line)
+      if line == EOI_LINE:
+        yield b"".join(delta)
+        delta = []
+    if b"".join(delta).strip():
+      # last delta need not be terminated
+      yield b"".join(delta + [EOI_LINE])
+  finally:
+    f.close()
+    if decompressor:
+      decompressor.kill()
+      decompressor.wait()
+
+def timestampsPath(input_path):
+  '''Cluster timestamps of the deltas of input_path, one per line in
+     microseconds. Shared by compressed versions of the same trace.'''
+  for suffix in config.DECOMPRESSORS:
+    if input_path.endswith(suffix):
+      input_path = input_path[:-len(suffix)]
+  return input_path + ".timestamps"
+
+def replayArrivals(input_path, speedup, arrival_interval):
+  '''Yields arrival time of each delta after the initial graph, in seconds
+     after the initial graph has been solved. From the cluster timestamps of
+     input_path if present (see timestampsPath), otherwise one delta every
+     arrival_interval seconds. Both are in cluster time: divided by
+     speedup.'''
+  timestamps_path = timestampsPath(input_path)
+  if os.path.exists(timestamps_path):
+    with open(timestamps_path) as f:
+      first = None
+      for line in f:
+        if not line.strip():
           continue
-        
-        log_directory = os.path.join(test_config["version_directory"],
-                                     "log", case_name)
-        
-        delta_id = 0
-        timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
-        for (algorithm_time, time_elapsed) in runTestInstance(test_name, 
-                                              test_config["cmd"], log_directory, 
-                                              fname, i, timeout):
-          result = { "test": test_name,
-                     "file": fname,
-                     "delta_id": delta_id, 
-                     "iteration": i,
-                     "algorithm_time": algorithm_time,
-                     "total_time": time_elapsed }
-          result_writer.writerow(result)
+        timestamp = int(line)
+        if first is None:
+          first = timestamp
+        yield (timestamp - first) / 1e6 / speedup
+  else:
+    assert(arrival_interval is not None)
+    for k in itertools.count():
+      yield k * arrival_interval / speedup
+
+REPLAY_FIELDS = ["test", "file", "speedup", "iteration", "delta_id",
+                 "arrival_time", "queueing_delay", "response_time",
+                 "algorithm_time"] + RUSAGE_FIELDS
+
+def runReplayInstance(test_instance, log_directory, fname, speedup, iteration,
+                      timeout, arrival_interval):
+  '''Replays fname to the solver, yielding times for each delta as
+     runner.replay does. Resource usage is in a dict, as the fifth element:
+     empty except for the last delta.'''
+  input_path = os.path.join(config.DATASET_ROOT, fname)
+  if not(os.path.exists(input_path)):
+    error("Cannot open ", input_path, "for reading")
+  log_directory = os.path.join(log_directory, fname)
+  os.makedirs(log_directory, exist_ok=True)
+
+  prefix = "replay_{0}x_{1}".format(speedup, iteration)
+  out_path = os.path.join(log_directory, prefix + ".out")
+  err_path = os.path.join(log_directory, prefix + ".err")
+  pipeline = runner.Pipeline(test_instance["cmd"](), out_path, stdin_pipe=True)
+  with open(err_path, 'w') as err_file:
+    run = runner.replay(pipeline, incrementalDeltas(input_path),
+                        replayArrivals(input_path, speedup, arrival_interval),
+                        err_file, timeout)
+    # as in runTestInstance: resource usage attached to the last delta
+    previous = None
+    for times in runner.iterate(run):
+      if previous:
+        yield previous + ({},)
+      previous = times
+    if previous:
+      yield previous + (pipeline.rusage,)
+
+  if not pipeline.killed and pipeline.exit_code != 0:
+    raise ExitCodeException(pipeline.exit_code)
+
+def runIncrementalReplayTest(case_name, case_config, result_file, journal):
+  '''Replays each delta at the cluster time it was recorded, scaled down by
+     each speed-up in turn. Unlike offline tests, deltas arrive whether or not
+     the solver has finished the previous one, so they may queue. A test is
+     not run at higher speed-ups of a file once it times out.'''
+  result_writer = csv.DictWriter(result_file, fieldnames=REPLAY_FIELDS)
+  if result_file.tell() == 0:
+    result_writer.writeheader()
+
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  # a fixed rate isn't cluster time: only used if the case asks for it
+  arrival_interval = case_config.get("arrival_interval")
+  if arrival_interval is None:
+    for fname in case_config["files"]:
+      input_path = os.path.join(config.DATASET_ROOT, fname)
+      if not os.path.exists(timestampsPath(input_path)):
+        error("No cluster timestamps for", fname, "at",
+              timestampsPath(input_path), "(see extract.py):",
+              "set arrival_interval to replay it at a fixed rate")
+  speedups = sorted(case_config["speedups"])
+  for (test_name, test_config) in case_config["tests"].items():
+    test_instance = createIncrementalTestInstance(test_config)
+    log_directory = os.path.join(test_instance["version_directory"],
+                                 "log", case_name, test_name)
+    for fname in case_config["files"]:
+      print("\t", test_name, fname, ": ", end="", flush=True)
+      summary = []
+      for speedup in speedups:
+        timedout = False
+        queueing_delays = []
+        for i in range(case_config["iterations"]):
+          state = journal.state(test_name, fname, speedup, i)
+          if state is not None:
+            if state["timedout"]:
+              timedout = True
+              break
+            continue
+          times = runReplayInstance(test_instance, log_directory, fname,
+                                    speedup, i, timeout, arrival_interval)
+          for (delta_id, (algorithm_time, arrival_time, queueing_delay,
+                          response_time, resources)) in enumerate(times):
+            result = {"test": test_name, "file": fname, "speedup": speedup,
+                      "iteration": i, "delta_id": delta_id,
+                      "arrival_time": arrival_time,
+                      "queueing_delay": queueing_delay,
+                      "response_time": response_time,
+                      "algorithm_time": algorithm_time}
+            result.update(resources)
+            result_writer.writerow(result)
+            if algorithm_time == "Timeout":
+              timedout = True
+            else:
+              queueing_delays.append(queueing_delay)
           result_file.flush()
-          delta_id += 1
-          
-          if algorithm_time == "Timeout":
-            timedout.add(test_name)
-        
-    print("")
+          journal.commit(test_name, fname, speedup, i, timedout=timedout)
+          if timedout:
+            break
+        if queueing_delays:
+          summary.append("{0}x: {1:.3f}/{2:.3f}s".format(speedup,
+                  sum(queueing_delays) / len(queueing_delays),
+                  max(queueing_delays)))
+        if timedout:
+          summary.append("{0}x: Timeout".format(speedup))
+          break
+      # mean/max queueing delay: diverges beyond the sustainable speed-up
+      print(", ".join(summary))
 
-def runSimulator(case_name, case_config, test_name, test_instance,
-                 trace_name, trace_config, trace_spec, iteration, type):
-  assert(type == "hybrid" or type == "online")
-  
-  parameters = helperCreateTestInstance(test_instance)
-  simulator = config.GOOGLE_TRACE_SIMULATOR
+THROUGHPUT_FIELDS = ["test", "file", "copies", "iteration", "pass",
+                     "window_start", "window_end", "deltas", "changes",
+                     "deltas_per_second", "changes_per_second"] + RUSAGE_FIELDS
+
+def throughputCachePath(input_path, suffix):
+  # new version of input gets a new name: no need to check cached copy
+  stat = os.stat(input_path)
+  signature = "{0}:{1}:{2}".format(os.path.realpath(input_path),
+                                   stat.st_size, stat.st_mtime_ns)
+  digest = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+  return os.path.join(config.WORKING_DIRECTORY, "throughput",
+                      digest + "-" + os.path.basename(input_path) + suffix)
+
+def writeStages(stages, input_path, out_path):
+  '''Pipes input_path through stages (decompressing it first if needed) into
+     out_path, unless out_path already exists. Returns out_path.'''
+  if os.path.exists(out_path):
+    return out_path
+  os.makedirs(os.path.dirname(out_path), exist_ok=True)
+  temp_path = out_path + ".tmp"
+  processes = []
+  with open(input_path, 'rb') as input_file, \
+       open(temp_path, 'wb') as out_file:
+    stdin = input_file
+    stages = decompressionStages(input_path) + stages
+    for (index, argv) in enumerate(stages):
+      last = index == len(stages) - 1
+      processes.append(subprocess.Popen(argv, stdin=stdin,
+                         stdout=out_file if last else subprocess.PIPE))
+      if index > 0:
+        # next stage has its own copy
+        stdin.close()
+      stdin = processes[-1].stdout
+  for process in processes:
+    if process.wait() != 0:
+      raise subprocess.CalledProcessError(process.returncode, process.args)
+  # written last: only used once complete
+  os.rename(temp_path, out_path)
+  return out_path
+
+def amplifiedTrace(input_path, copies, loops):
+  '''Path of input_path amplified by throughput.py, created if needed.'''
+  if copies == 1 and loops == 1:
+    return input_path
+  amplifier = [sys.executable,
+               os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            "throughput.py"),
+               str(copies), str(loops)]
+  out_path = throughputCachePath(input_path,
+                                 "-{0}x{1}.imin".format(copies, loops))
+  return writeStages([amplifier], input_path, out_path)
+
+def deltaChanges(trace_path):
+  '''Returns number of changes made by each delta of trace_path, as counted by
+     incremental_statistics.'''
+  stats_path = writeStages([[config.DELTA_STATISTICS_PROGRAM_PATH]],
+                           trace_path,
+                           throughputCachePath(trace_path, ".stats.csv"))
+  with open(stats_path) as f:
+    return [throughput.deltaChanges(row) for row in csv.DictReader(f)]
+
+def throughputRows(times, changes, case_config):
+  '''times: of each delta in a run, as yielded by runTestInstance. Yields rows
+     of THROUGHPUT_FIELDS (without test, file, etc.) for each window.'''
+  loops = case_config.get("loops", 1)
+  window = case_config.get("window", 10)
+  step = case_config.get("window_step", window / 2)
+  # solve times of deltas after the initial graph, which is not measured
+  completions = list(itertools.accumulate(float(time_elapsed)
+                                          for (_, time_elapsed, _) in times[1:]))
+  num_deltas = (len(changes) + 1) // loops - 1
+  spans = throughput.spans(num_deltas, loops, case_config.get("warmup", 10))
+  for (pass_id, span) in enumerate(spans):
+    # solver may have exited early
+    span = range(span.start, min(span.stop, len(completions)))
+    for (start, end, deltas, num_changes) in throughput.windows(completions,
+                                               changes, span, window, step):
+      duration = end - start
+      yield {"pass": pass_id,
+             "window_start": start,
+             "window_end": end,
+             "deltas": deltas,
+             "changes": num_changes,
+             "deltas_per_second": deltas / duration if duration else "",
+             "changes_per_second": num_changes / duration if duration else ""}
+
+def runIncrementalThroughputTest(case_name, case_config, result_file,
+                                 journal):
+  '''Streams each file to the solver as fast as it reads it, measuring the
+     deltas and changes solved per second over sliding windows.'''
+  result_writer = csv.DictWriter(result_file, fieldnames=THROUGHPUT_FIELDS)
+  if result_file.tell() == 0:
+    result_writer.writeheader()
+
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  copies = case_config.get("copies", 1)
+  for fname in case_config["files"]:
+    input_path = os.path.join(config.DATASET_ROOT, fname)
+    trace_path = amplifiedTrace(input_path, copies,
+                                case_config.get("loops", 1))
+    changes = deltaChanges(trace_path)
+    for (test_name, test_config) in case_config["tests"].items():
+      test_instance = createIncrementalTestInstance(test_config)
+      log_directory = os.path.join(test_instance["version_directory"],
+                                   "log", case_name)
+      print("\t", test_name, fname, ": ", end="", flush=True)
+      rates = []
+      for i in range(case_config["iterations"]):
+        if journal.done(test_name, fname, i):
+          continue
+        times = list(runTestInstance(test_name, test_instance["cmd"],
+                                     log_directory, trace_path, i, timeout,
+                                     log_fname=fname))
+        base = {"test": test_name, "file": fname, "copies": copies,
+                "iteration": i}
+        if not times or times[-1][0] == "Timeout":
+          rows = [{"deltas_per_second": "Timeout",
+                   "changes_per_second": "Timeout"}]
+        else:
+          rows = list(throughputRows(times, changes, case_config))
+        for (index, row) in enumerate(rows):
+          row.update(base)
+          if index == len(rows) - 1:
+            row.update(times[-1][2] if times else {})
+          result_writer.writerow(row)
+          rates.append(row["deltas_per_second"])
+        journal.commit(test_name, fname, i)
+      rates = sorted(rate for rate in rates if isinstance(rate, float))
+      if rates:
+        print("{0:.1f} deltas/s (median window), {1:.1f} max".format(
+              rates[len(rates) // 2], rates[-1]))
+      else:
+        print("")
+
+def simulatorFlags(case_config, parameters, trace_config, trace_spec, type):
+  '''Flags for the simulator to run the solver of parameters (as returned by
+     helperCreateTestInstance) on a trace, other than those naming files the
+     simulator writes to.'''
+  flags = []
   
   solver_type = parameters["implementation"]["type"]
   incremental = None
@@ -535,214 +1333,318 @@ def runSimulator(case_name, case_config, test_name, test_instance,
   else:
     error("Unrecognised solver type ", solver_type)
     
-  ### Set up logging
-  log_directory = os.path.join(parameters["version_directory"], "log",
-                               case_name, trace_name)
-  try:
-    os.makedirs(log_directory)
-  except OSError:
-    # directory already created if not first time we've been run
-    pass
-  
-  prefix = test_name + "-online_" + str(iteration)
-  out_path = os.path.join(log_directory, prefix + ".out")
-  err_path = os.path.join(log_directory, prefix + ".err")
-  
   ### General parameters
   if type == "hybrid":
     batch_step = config.DEFAULT_BATCH_STEP
     if "batch_step" in case_config:
       batch_step = case_config["batch_step"]
-    simulator = simulator.bake("-batch_step", batch_step)
+    flags += ["-batch_step", batch_step]
   else:
     online_factor = config.DEFAULT_ONLINE_FACTOR
     if "online_factor" in case_config:
       online_factor = case_config["online_factor"]
-    simulator = simulator.bake("-online_factor", online_factor)
+    flags += ["-online_factor", online_factor]
     
     online_max_time = config.DEFAULT_ONLINE_MAX_TIME
     if "online_max_time" in case_config:
       online_max_time = case_config["online_max_time"]
-    simulator = simulator.bake("-online_max_time", online_max_time)
+    flags += ["-online_max_time", online_max_time]
   cost_model = config.DEFAULT_COST_MODEL
   if "cost_model" in trace_config:
     cost_model = trace_config["cost_model"]
-  simulator = simulator.bake("-flow_scheduling_cost_model",
-                             config.COST_MODELS[cost_model])
+  flags += ["-flow_scheduling_cost_model", config.COST_MODELS[cost_model]]
   machine_type = config.FIRMAMENT_DEFAULT_MACHINE
   if "machine" in trace_config:
     machine_type = trace_config["machine"]
-  simulator = simulator.bake("-machine_tmpl_file",
-                             config.FIRMAMENT_MACHINES[machine_type])
+  flags += ["-machine_tmpl_file", config.FIRMAMENT_MACHINES[machine_type]]
   
   ### Configuration for the solver
-  simulator = simulator.bake("-solver", "custom")
+  flags += ["-solver", "custom"]
   timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
-  simulator = simulator.bake("-solver_timeout", timeout)
-  simulator = simulator.bake("-flow_scheduling_binary", parameters["exe_path"])
+  flags += ["-solver_timeout", timeout]
+  flags += ["-flow_scheduling_binary", parameters["exe_path"]]
   arguments = parameters["arguments"]
   if arguments:
-    simulator = simulator.bake("-custom_flow_scheduling_args", 
-                               " ".join(arguments))
+    flags += ["-custom_flow_scheduling_args", " ".join(arguments)]
   # Note "-incremental_flow False" will not work; GFlags will interpret this
   # as setting FLAGS_incremental_flow, and then a positional argument False.
   # So have to construct the argument string ourselves
-  simulator = simulator.bake("-incremental_flow=" + str(incremental))
+  flags += ["-incremental_flow=" + str(incremental)]
   
   ### Configuration for the trace  
-  simulator = simulator.bake("-trace_path", trace_spec["dir"])
-  simulator = simulator.bake("-num_files_to_process", trace_spec["num_files"])
+  flags += ["-trace_path", trace_spec["dir"]]
+  flags += ["-num_files_to_process", trace_spec["num_files"]]
   if "runtime" in trace_config:
-    simulator = simulator.bake("-runtime", trace_config["runtime"])
+    flags += ["-runtime", trace_config["runtime"]]
   if "num_events" in trace_config:
-    simulator = simulator.bake("-max_events", trace_config["num_events"])
+    flags += ["-max_events", trace_config["num_events"]]
   if "scheduling_rounds" in trace_config:
-    simulator = simulator.bake("-max_scheduling_rounds",
-                               trace_config["scheduling_rounds"])
+    flags += ["-max_scheduling_rounds", trace_config["scheduling_rounds"]]
   if "percentage" in trace_config:
-    simulator = simulator.bake("-percentage", trace_config["percentage"])
+    flags += ["-percentage", trace_config["percentage"]]
+  
+  return flags
+
+def hybridTraceKey(parameters, trace_name, flags):
+  '''Returns (key, description) of the trace generated by the simulator with
+     flags, in the trace cache. We must never give the same key to two
+     invocations which could produce *different* traces: so it covers the
+     solver, its arguments and the simulator's flags. But the solver is
+     identified by the contents of its binary, not its path, which includes
+     the commit: so unchanged solvers share traces across commits.'''
+  normalised = list(config.GOOGLE_TRACE_SIMULATOR_ARGS)
+  flags = iter(flags)
+  for flag in flags:
+    if flag == "-flow_scheduling_binary":
+      # identified by its contents instead
+      next(flags)
+    elif flag == "-trace_path":
+      normalised += [flag, os.path.realpath(next(flags))]
+    else:
+      normalised.append(str(flag))
+  
+  simulator_hashes = [store.inputHash(path)
+                      for path in config.GOOGLE_TRACE_SIMULATOR_FILES]
+  key = trace_cache.traceKey(store.inputHash(parameters["exe_path"]),
+                             simulator_hashes, normalised)
+  description = {"trace": trace_name,
+                 "solver": parameters["exe_path"],
+                 "flags": normalised}
+  return (key, description)
+
+def runSimulator(case_name, case_config, test_name, test_instance,
+                 trace_name, trace_config, trace_spec, iteration, type):
+  '''hybrid: yields (path of trace, "cached" or "generating") before
+     generating it. online: yields lists of statistics rows as they arrive.'''
+  assert(type == "hybrid" or type == "online")
+  
+  parameters = helperCreateTestInstance(test_instance)
+  flags = simulatorFlags(case_config, parameters, trace_config, trace_spec, type)
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  
+  ### Set up logging
+  log_directory = os.path.join(parameters["version_directory"], "log",
+                               case_name, trace_name)
+  try:
+    os.makedirs(log_directory)
+  except OSError:
+    # directory already created if not first time we've been run
+    pass
+  
+  prefix = test_name + "-online_" + str(iteration)
+  out_path = os.path.join(log_directory, prefix + ".out")
+  err_path = os.path.join(log_directory, prefix + ".err")
   
   ### Record deltas for offline tests
+  graph_output_file = None
   if type == "hybrid":
-    trace_directory = os.path.join(parameters["version_directory"], "trace", 
-                                   trace_name, 
-                                   parameters["implementation"]["target"])
-    try:
-      os.makedirs(trace_directory)
-    except OSError:
-      # directory already created if not first time we've been run
-      pass
-    
-    # We must never generate the same trace path for two invocations which could
-    # produce *different* results. Different algorithms may certainly produce  
-    # different solutions, and hence different traces. Parameters may also 
-    # effect this. 
-    hash = hashlib.md5()
-    
-    cli = " ".join([parameters["exe_path"]] + parameters["arguments"])
-    hash.update(cli.encode('utf-8'))
-    hash.update(str(simulator).encode('utf-8'))
-    
-    delta_file = os.path.join(trace_directory, hash.hexdigest() + ".imin")
-    if os.path.exists(delta_file): 
-      yield (delta_file, "cached")
+    key, description = hybridTraceKey(parameters, trace_name, flags)
+    cached_file = hybrid_traces.lookup(key)
+    if cached_file:
+      yield (cached_file, "cached")
       return
-    else:
-      yield (delta_file, "generating") 
-    simulator = simulator.bake("-graph_output_file", delta_file) 
+    yield (hybrid_traces.path(key), "generating")
+    # published once complete, so a failed run is never mistaken for a trace
+    graph_output_file = hybrid_traces.temporaryPath(key)
+    flags += ["-graph_output_file", graph_output_file]
   
   ### Setup pipe for statistics output from the simulator
-  if type == "online":
-    fifo_path = os.path.join(log_directory, prefix + ".stats_fifo")
-    if os.path.exists(fifo_path):
-      print("WARNING: removing stale FIFO ", fifo_path)
-      os.unlink(fifo_path)
-    os.mkfifo(fifo_path)
-    simulator = simulator.bake("-stats_file", fifo_path)
+  # hybrid: for the cluster timestamp of each delta, which replays follow
+  fifo_path = os.path.join(log_directory, prefix + ".stats_fifo")
+  if os.path.exists(fifo_path):
+    print("WARNING: removing stale FIFO ", fifo_path)
+    os.unlink(fifo_path)
+  os.mkfifo(fifo_path)
+  flags += ["-stats_file", fifo_path]
   
   ### Run the simulator and parse output
-  with open(err_path, 'w') as err_file:
-    print("Executing ", simulator, file=err_file)
-    err_file.flush()
-    
-    with open(out_path, 'w') as out_file:
-      # WARNING: Do not replace this to just  call _out=out_path directly.
-      # Normally this would work OK, but out_file is a FIFO. sh is annoying
-      # and doesn't close FDs. So we'd never read EOF, and would get stuck. 
-      running_simulator = simulator(_out=out_file.buffer, _err=err_file.buffer,
-                                    _bg=True)
-    
-      # SOMEDAY(adam): if simulator dies, test script will hang waiting on
-      # reading FIFO, as exception will not be generated whilst blocked on IO
-      if type == "online":
-        with open(fifo_path, 'r') as stats_file:
-          csv_reader = csv.DictReader(stats_file)
-          for row in csv_reader:
-            if type == "online":
-              yield row
-      
-      running_simulator.wait()
-  
-  ### Clean up  
-  if type == "online":
+  argv = config.GOOGLE_TRACE_SIMULATOR_COMMAND + [str(flag) for flag in flags]
+  pipeline = runner.Pipeline([argv], out_path)
+  stall_timeout = timeout + case_config.get("stall_timeout",
+                                            config.SIMULATOR_STALL_TIMEOUT)
+  try:
+    with open(err_path, 'w') as err_file:
+      print("Executing ", " ".join(argv), file=err_file)
+      err_file.flush()
+
+      # Statistics, stderr and exit are waited on together: a simulator which
+      # dies or stalls is detected, rather than blocking on the FIFO for ever.
+      run = runner.simulation(pipeline, fifo_path, err_file, stall_timeout,
+                              progress_path=graph_output_file)
+      cluster_timestamp = 0
+      # one row per scheduling round, and so per delta of the trace
+      timestamps = []
+      for rows in runner.iterate(run):
+        if rows == "Timeout":
+          print("WARNING: simulator made no progress for", stall_timeout,
+                "seconds: killed", file=err_file)
+          if type == "hybrid":
+            raise ExitCodeException(pipeline.exit_code)
+          # as if the round after the last had timed out
+          timeout_row = {field: "Timeout" if field in ONLINE_TIME_FIELDS else 0
+                         for field in ONLINE_STATISTICS_FIELDS}
+          timeout_row["cluster_timestamp"] = cluster_timestamp
+          yield [timeout_row]
+          return
+        cluster_timestamp = rows[-1]["cluster_timestamp"]
+        if type == "hybrid":
+          timestamps += [row["cluster_timestamp"] for row in rows]
+        else:
+          yield rows
+  finally:
+    ### Clean up
     os.unlink(fifo_path)
-  
-  if running_simulator.exit_code != 0:
-    raise ExitCodeException(result.exit_code)
+    if graph_output_file and os.path.exists(graph_output_file):
+      if pipeline.processes and pipeline.exit_code == 0:
+        # the initial graph is not replayed at any particular time
+        with open(graph_output_file + ".timestamps", 'w') as f:
+          f.writelines(timestamp + "\n" for timestamp in timestamps[1:])
+        hybrid_traces.publish(key, graph_output_file, description)
+      else:
+        os.unlink(graph_output_file)
+
+  if pipeline.exit_code != 0:
+    raise ExitCodeException(pipeline.exit_code)
+
+def generateHybridTrace(case_name, case_config, test_name, dataset_name):
+  '''Generates the trace of dataset_name replayed by the offline runs of
+     test_name, returning its path. Module-level, so it can be executed by a
+     worker in the pool.'''
+  dataset_config = case_config["traces"][dataset_name]
+  trace_name = dataset_config["trace"]
+  result = runSimulator(case_name, case_config, test_name,
+                        case_config["tests"][test_name], trace_name,
+                        dataset_config, config.TRACE_DATASET[trace_name], 0,
+                        type="hybrid")
+  result = list(result)
+  assert(len(result) == 1)
+  trace_file, _ = result[0]
+  return trace_file
+
+def runHybridUnit(case_name, case_config, test_name, trace_name, i,
+                  trace_file):
+  '''Iteration i of the offline run of test_name on trace_file. Returns list
+     of times of each delta.'''
+  test_instance = createIncrementalTestInstance(case_config["tests"][test_name])
+  log_directory = os.path.join(test_instance["version_directory"],
+                               "log", case_name)
+  log_fname = os.path.relpath(os.path.join(log_directory, test_name),
+                              trace_file)
+  timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+  sample_memory = case_config.get("sample_memory", False)
+  return list(runTestInstance(test_name, test_instance["cmd"], log_directory,
+                              trace_file, i, timeout, log_fname=log_fname,
+                              sample_memory=sample_memory))
 
-def runIncrementalHybridTest(case_name, case_config, result_file): 
+def runIncrementalHybridTest(case_name, case_config, result_file, journal): 
+  '''Generates a trace with the simulator for each test, and replays it
+     offline. The traces and offline runs form a graph of jobs: each run
+     starts as soon as its trace is complete, while other traces may still
+     be being generated.'''
   fieldnames = ["test", "file", "delta_id", 
-                "iteration", "algorithm_time", "total_time"]
+                "iteration", "algorithm_time", "total_time"] \
+             + MEMORY_FIELDS + RUSAGE_FIELDS
   result_writer = csv.DictWriter(result_file,fieldnames=fieldnames)
-  result_writer.writeheader()
+  if result_file.tell() == 0:
+    result_writer.writeheader()
   iterations = case_config["iterations"]
   
   tests = case_config["tests"]
-  test_instances = {test_name : createIncrementalTestInstance(tests[test_name])
-                   for test_name in tests}
-  
-  for (dataset_name, dataset_config) in case_config["traces"].items():
-    trace_name = dataset_config["trace"]
-    trace_spec = config.TRACE_DATASET[trace_name]
-    trace_files = {}
-    
-    print("\t", dataset_name, " - online: ", end="")
-    
-    for (test_name, test_instance) in tests.items(): 
-      result = runSimulator(case_name, case_config, test_name, test_instance,
-                  trace_name, dataset_config, trace_spec, 0, type="hybrid")
-      result = list(result)
-      assert(len(result) == 1)
+  trace_jobs = {}
+  offline_jobs = {}
+  # traces in use are pinned, so that they can't be evicted from the cache
+  with contextlib.ExitStack() as pins:
+    for (dataset_name, dataset_config) in case_config["traces"].items():
+      trace_name = dataset_config["trace"]
+      trace_spec = config.TRACE_DATASET[trace_name]
       
-      trace_files[test_name], status = result[0]
-          
-      print(test_name, 
-            "*" if status == "cached" else "",
-            sep="", end=" ")
-        
-    print("/ offline: ", end="")
-    for i in range(iterations):
-      print(i, " ", end="")
+      print("\t", dataset_name, " - online: ", end="")
       
-      timedout = set()
-      
-      for test_name, test_config in test_instances.items():
-        if test_name in timedout:
-          continue
-        
-        log_directory = os.path.join(test_config["version_directory"], 
-                                     "log", case_name)
+      for (test_name, test_instance) in tests.items(): 
+        remaining = [i for i in range(iterations)
+                     if not journal.done(test_name, dataset_name, i)]
+        parameters = helperCreateTestInstance(test_instance)
+        flags = simulatorFlags(case_config, parameters, dataset_config,
+                               trace_spec, "hybrid")
+        key, _ = hybridTraceKey(parameters, trace_name, flags)
+        trace = hybrid_traces.lookup(key)
+        if trace and remaining:
+          try:
+            pins.enter_context(hybrid_traces.pin(trace))
+          except FileNotFoundError:
+            # evicted since the lookup
+            trace = None
         
-        delta_id = 0
-        input_graph = trace_files[test_name]
-        log_fname = os.path.relpath(os.path.join(log_directory, test_name),
-                                    input_graph)
-        timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
-        for (algorithm_time, time_elapsed) in runTestInstance(
-                      test_name, test_config["cmd"], log_directory, input_graph, 
-                      i, timeout, log_fname=log_fname):
-          result = { "test": test_name,
-                     "file": trace_name,
-                     "delta_id": delta_id, 
-                     "iteration": i,
-                     "algorithm_time": algorithm_time,
-                     "total_time": time_elapsed }
-          result_writer.writerow(result)
-          result_file.flush()
-          delta_id += 1
-          
-          if algorithm_time == "Timeout":
-            timedout.add(test_name)
+        print(test_name, 
+              "*" if trace else "",
+              sep="", end=" ")
         
-    print("")
+        if not remaining:
+          continue
+        if not trace:
+          # tests running the same solver share a trace: only generate it once
+          trace_key = ("online", key)
+          if trace_key not in trace_jobs:
+            trace_jobs[trace_key] = parallel.Job(generateHybridTrace,
+                        (case_name, case_config, test_name, dataset_name),
+                        "simulator")
+          trace = parallel.Result(trace_key)
+        for i in remaining:
+          offline_jobs[("offline", test_name, dataset_name, i)] = \
+                    parallel.Job(runHybridUnit, (case_name, case_config,
+                                                 test_name, trace_name, i,
+                                                 trace))
+      print("")
+      
+    print("\t progress: ", end="")
+    # traces first: the offline runs are waiting on them
+    jobs = dict(trace_jobs)
+    jobs.update(offline_jobs)
+    max_simulators = case_config.get("max_simulators",
+                                     config.MAX_CONCURRENT_SIMULATORS)
+    for (key, result) in pool.graph(jobs, {"simulator": max_simulators}):
+      if key[0] == "online":
+        print("online", end=" ")
+        pins.enter_context(hybrid_traces.pin(result))
+        # the new trace may have taken the cache over its quota
+        hybrid_traces.collect()
+        continue
+      
+      _, test_name, dataset_name, i = key
+      print(dataset_name, "/", test_name, "/", i, sep="", end=" ")
+      timedout = False
+      for (delta_id, (algorithm_time, time_elapsed, resources)) \
+          in enumerate(result):
+        row = { "test": test_name,
+                "file": case_config["traces"][dataset_name]["trace"],
+                "delta_id": delta_id, 
+                "iteration": i,
+                "algorithm_time": algorithm_time,
+                "total_time": time_elapsed }
+        row.update(resources)
+        result_writer.writerow(row)
+        if algorithm_time == "Timeout":
+          timedout = True
+      journal.commit(test_name, dataset_name, i, timedout=timedout)
+    
+  hybrid_traces.collect()
+  print("")
+
+# Statistics the simulator reports for each scheduling round
+ONLINE_TIME_FIELDS = ["scheduling_latency", "algorithm_time",
+                      "flowsolver_time", "total_time"]
+ONLINE_STATISTICS_FIELDS = ["cluster_timestamp"] + ONLINE_TIME_FIELDS \
+                         + ["total_changes", "new_node", "remove_node",
+                            "new_arc", "change_arc", "remove_arc"]
 
-def runIncrementalOnlineTest(case_name, case_config, result_file):
+def runIncrementalOnlineTest(case_name, case_config, result_file, journal):
   fieldnames = ["test", "dataset", "delta_id", "cluster_timestamp", "iteration",
       "scheduling_latency", "algorithm_time", "flowsolver_time", "total_time",
       "total_changes","new_node","remove_node",
       "new_arc","change_arc","remove_arc"]
   result_writer = csv.DictWriter(result_file,fieldnames=fieldnames)
-  result_writer.writeheader()
+  if result_file.tell() == 0:
+    result_writer.writeheader()
   
   iterations = case_config["iterations"]
   tests = case_config["tests"]
@@ -761,34 +1663,54 @@ def runIncrementalOnlineTest(case_name, case_config, result_file):
       for (test_name, test_instance) in tests.items():
         if test_name in timedout:
           continue
+        state = journal.state(test_name, dataset_name, i)
+        if state is not None:
+          if state["timedout"]:
+            timedout.add(test_name)
+          continue
         
         row_number = 0
-        for row in runSimulator(case_name, case_config, test_name, test_instance,
-                           trace_name, dataset_config, trace_spec, i, type="online"):
-          result = { "test": test_name,
-                     "dataset": dataset_name,
-                     "delta_id": row_number, 
-                     "iteration": i}
-          fields = ["cluster_timestamp", "scheduling_latency", 
-                    "algorithm_time", "flowsolver_time", "total_time",
-                    "total_changes","new_node","remove_node",
-                    "new_arc","change_arc","remove_arc"]
-          result.update({k: row[k] for k in fields})
-          result_writer.writerow(result)
+        # rows arrive in batches: one write and flush each, not one per row
+        for rows in runSimulator(case_name, case_config, test_name,
+                                 test_instance, trace_name, dataset_config,
+                                 trace_spec, i, type="online"):
+          results = []
+          for row in rows:
+            result = { "test": test_name,
+                       "dataset": dataset_name,
+                       "delta_id": row_number,
+                       "iteration": i}
+            result.update({k: row[k] for k in ONLINE_STATISTICS_FIELDS})
+            results.append(result)
+            row_number += 1
+
+            if row["algorithm_time"] == "Timeout":
+              timedout.add(test_name)
+          result_writer.writerows(results)
           result_file.flush()
-          row_number += 1
-          
-          if row["algorithm_time"] == "Timeout":
-            timedout.add(test_name)
+        journal.commit(test_name, dataset_name, i,
+                       timedout=test_name in timedout)
         
     print("")
 
 APPROXIMATE_FIELDS = ["refine_iteration", "refine_time", "overhead_time",
-                      "epsilon", "cost","task_assignments_changed"]
-def runApproximateFullTest(case_name, case_config, result_file):
+                      "epsilon", "cost","task_assignments_changed"] \
+                   + RUSAGE_FIELDS
+def writeApproximateRows(result_writer, base_output, rows, resources):
+  for (index, row) in enumerate(rows):
+    output = base_output.copy()
+    output.update(row)
+    if index == len(rows) - 1:
+      # resources empty except for final delta of run
+      output.update(resources)
+    result_writer.writerow(output)
+
+def runApproximateFullTest(case_name, case_config, result_file,
+                           journal):
   fieldnames = ["file", "test_iteration"] + APPROXIMATE_FIELDS
   result_writer = csv.DictWriter(result_file, fieldnames=fieldnames)
-  result_writer.writeheader()
+  if result_file.tell() == 0:
+    result_writer.writeheader()
   
   iterations = case_config["iterations"]
   instance = case_config.get("test", config.APPROXIMATE_DEFAULT_TEST)
@@ -800,6 +1722,11 @@ def runApproximateFullTest(case_name, case_config, result_file):
     
     for i in range(iterations):
       print(i, " ", end="")
+      state = journal.state(fname, i)
+      if state is not None:
+        if state["timedout"]:
+          break
+        continue
         
       log_directory = os.path.join(test_instance["version_directory"],
                                    "log", case_name)
@@ -809,7 +1736,7 @@ def runApproximateFullTest(case_name, case_config, result_file):
                                                 log_directory, fname, i, timeout)
       test_results = list(test_results)
       assert(len(test_results) == 1) # only a single 'delta'
-      test_results = test_results[0]
+      test_results, resources = test_results[0]
       base_output = { "file": fname,
                       "test_iteration": i }
       if test_results == "Timeout":
@@ -820,21 +1747,23 @@ def runApproximateFullTest(case_name, case_config, result_file):
                        "epsilon": -1,
                        "cost": -1,
                        "task_assignments_changed": -1})
+        output.update(resources)
         result_writer.writerow(output)
+        journal.commit(fname, i, timedout=True)
         break
       else:
-        for row in test_results:
-          output = base_output.copy()
-          output.update(row)
-          result_writer.writerow(output)
-      result_file.flush()
+        writeApproximateRows(result_writer, base_output, test_results,
+                             resources)
+      journal.commit(fname, i, timedout=False)
         
     print("")
     
-def runApproximateIncrementalOfflineTest(case_name, case_config, result_file):
+def runApproximateIncrementalOfflineTest(case_name, case_config, result_file,
+                                         journal):
   fieldnames = ["file", "delta_id", "test_iteration"] + APPROXIMATE_FIELDS
   result_writer = csv.DictWriter(result_file, fieldnames=fieldnames)
-  result_writer.writeheader()
+  if result_file.tell() == 0:
+    result_writer.writeheader()
   
   iterations = case_config["iterations"]
   instance = case_config.get("test", config.APPROXIMATE_DEFAULT_TEST)
@@ -846,6 +1775,11 @@ def runApproximateIncrementalOfflineTest(case_name, case_config, result_file):
     
     for i in range(iterations):
       print(i, " ", end="")
+      state = journal.state(fname, i)
+      if state is not None:
+        if state["timedout"]:
+          break
+        continue
         
       log_directory = os.path.join(test_instance["version_directory"],
                                    "log", case_name)
@@ -855,7 +1789,7 @@ def runApproximateIncrementalOfflineTest(case_name, case_config, result_file):
                                        log_directory, fname, i, timeout)
       delta_id = 0
       timedout = False
-      for test_result in run:
+      for (test_result, resources) in run:
         base_output = { "file": fname,
                         "delta_id": delta_id,
                         "test_iteration": i }
@@ -867,27 +1801,29 @@ def runApproximateIncrementalOfflineTest(case_name, case_config, result_file):
                          "epsilon": -1,
                          "cost": -1,
                          "task_assignments_changed": -1})
+          output.update(resources)
           result_writer.writerow(output)
           result_file.flush()
           timedout = True
           break
         else:
-          for row in test_result:
-            output = base_output.copy()
-            output.update(row)
-            result_writer.writerow(output)
+          writeApproximateRows(result_writer, base_output, test_result,
+                               resources)
           delta_id += 1
           result_file.flush()
-        
+      
+      journal.commit(fname, i, timedout=timedout)
       if timedout:
         break
         
     print("")
       
-def runApproximateIncrementalHybridTest(case_name, case_config, result_file):
+def runApproximateIncrementalHybridTest(case_name, case_config, result_file,
+                                        journal):
   fieldnames = ["file", "delta_id", "test_iteration"] + APPROXIMATE_FIELDS
   result_writer = csv.DictWriter(result_file, fieldnames=fieldnames)
-  result_writer.writeheader()
+  if result_file.tell() == 0:
+    result_writer.writeheader()
   
   iterations = case_config["iterations"]
   test_instance = case_config.get("test", config.APPROXIMATE_DEFAULT_TEST)
@@ -908,73 +1844,219 @@ def runApproximateIncrementalHybridTest(case_name, case_config, result_file):
           
     print(status, end=" ")
     
-    print("/ offline: ", end="")
-    for i in range(iterations):
-      print(i, " ", end="")
+    with hybrid_traces.pin(trace_file):
+      hybrid_traces.collect()
+    
+      print("/ offline: ", end="")
+      for i in range(iterations):
+        print(i, " ", end="")
+        state = journal.state(dataset_name, i)
+        if state is not None:
+          if state["timedout"]:
+            break
+          continue
         
-      log_directory = os.path.join(test_instance["version_directory"],
-                                   "log", case_name)
-      timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
-      log_fname = os.path.relpath(os.path.join(log_directory, "approximate"),
-                                  trace_file)
-      run = runApproximateTestInstance("approximate", test_instance["cmd"], 
-                    log_directory, trace_file, i, timeout, log_fname=log_fname)
+        log_directory = os.path.join(test_instance["version_directory"],
+                                     "log", case_name)
+        timeout = case_config.get("timeout", config.DEFAULT_TIMEOUT)
+        log_fname = os.path.relpath(os.path.join(log_directory, "approximate"),
+                                    trace_file)
+        run = runApproximateTestInstance("approximate", test_instance["cmd"], 
+                      log_directory, trace_file, i, timeout,
+                      log_fname=log_fname)
       
-      delta_id = 0
-      timedout = False
-      for test_result in run:
-        base_output = { "file": dataset_name,
-                        "delta_id": delta_id,
-                        "test_iteration": i }
-        if test_result == "Timeout":
-          output = base_output.copy()
-          output.update({"refine_iteration": 0,
-                         "refine_time": "Timeout",
-                         "overhead_time": "Timeout",
-                         "epsilon": -1,
-                         "cost": -1,
-                         "task_assignments_changed": -1})
-          result_writer.writerow(output)
-          result_file.flush()
-          timedout = True
-          break
-        else:
-          for row in test_result:
+        delta_id = 0
+        timedout = False
+        for (test_result, resources) in run:
+          base_output = { "file": dataset_name,
+                          "delta_id": delta_id,
+                          "test_iteration": i }
+          if test_result == "Timeout":
             output = base_output.copy()
-            output.update(row)
+            output.update({"refine_iteration": 0,
+                           "refine_time": "Timeout",
+                           "overhead_time": "Timeout",
+                           "epsilon": -1,
+                           "cost": -1,
+                           "task_assignments_changed": -1})
+            output.update(resources)
             result_writer.writerow(output)
-          delta_id += 1
-          result_file.flush()
-        
-      if timedout:
-        break
+            result_file.flush()
+            timedout = True
+            break
+          else:
+            writeApproximateRows(result_writer, base_output, test_result,
+                                 resources)
+            delta_id += 1
+            result_file.flush()
+      
+        journal.commit(dataset_name, i, timedout=timedout)
+        if timedout:
+          break
         
-    print("")
+      print("")
+    hybrid_traces.collect()
 
-def runTests(tests):
+@contextlib.contextmanager
+def openResults(case_name, resume=False):
+  '''Yields result file and journal of case_name'''
+  result_fname = os.path.join(config.RESULT_ROOT, case_name + ".csv") 
+  journal_fname = os.path.join(config.RESULT_ROOT, case_name + ".journal")
+  resume_case = resume and os.path.exists(result_fname)
+  # N.B. not truncated on open: journal decides how much to keep
+  with open(result_fname, 'r+' if resume_case else 'w+') as result_file, \
+       journal.Journal(journal_fname, result_file, resume_case) as case_journal:
+    yield (result_file, case_journal)
+
+def runTests(tests, resume=False):
   for case_name, case_config in tests.items():
     print(case_name)
     
-    result_fname = os.path.join(config.RESULT_ROOT, case_name + ".csv") 
-    with open(result_fname, 'w') as result_file:
+    with openResults(case_name, resume) as (result_file, case_journal):
       test_type = case_config["type"]
       if test_type == "full":
-        runFullTest(case_name, case_config, result_file)
+        runFullTest(case_name, case_config, result_file, case_journal)
       elif test_type == "incremental_offline":
-        runIncrementalOfflineTest(case_name, case_config, result_file)
+        runIncrementalOfflineTest(case_name, case_config, result_file, case_journal)
       elif test_type == "incremental_hybrid":
-        runIncrementalHybridTest(case_name, case_config, result_file)
+        runIncrementalHybridTest(case_name, case_config, result_file, case_journal)
       elif test_type == "incremental_online":
-        runIncrementalOnlineTest(case_name, case_config, result_file)
+        runIncrementalOnlineTest(case_name, case_config, result_file, case_journal)
+      elif test_type == "incremental_replay":
+        runIncrementalReplayTest(case_name, case_config, result_file, case_journal)
+      elif test_type == "incremental_throughput":
+        runIncrementalThroughputTest(case_name, case_config, result_file, case_journal)
       elif test_type == "approximate_full":
-        runApproximateFullTest(case_name, case_config, result_file)
+        runApproximateFullTest(case_name, case_config, result_file, case_journal)
       elif test_type == "approximate_incremental_offline":
-        runApproximateIncrementalOfflineTest(case_name, case_config, result_file)
+        runApproximateIncrementalOfflineTest(case_name, case_config, result_file, case_journal)
       elif test_type == "approximate_incremental_hybrid":
-        runApproximateIncrementalHybridTest(case_name, case_config, result_file)
+        runApproximateIncrementalHybridTest(case_name, case_config, result_file, case_journal)
       else:
         error("Unrecognised test type: ", test_type)
 
+### Compiler flag tuning
+
+def flagTuningCase(implementation_name, dataset_name):
+  '''Test case racing the flag sets of config.FLAG_TUNING against one
+     another. Adds a compiler for each flag set to config.COMPILERS.
+     Returns case name, case config and dict mapping each compiler name to
+     the flags it adds to the base compiler.'''
+  tuning = config.FLAG_TUNING
+  if implementation_name not in config.IMPLEMENTATIONS:
+    error("Unknown implementation: ", implementation_name)
+  if dataset_name not in config.FULL_DATASET:
+    error("Unknown dataset: ", dataset_name)
+  base_name = tuning["base"]
+  base = config.COMPILERS[base_name]
+  
+  # one alternative from each dimension of the space
+  flag_sets = [[flag for flag in choice if flag]
+               for choice in itertools.product(*tuning["space"].values())]
+  if len(flag_sets) > tuning["candidates"]:
+    baseline, others = flag_sets[0], flag_sets[1:]
+    # seeded, so a resumed tuning run has the same candidates
+    sample = random.Random(tuning["seed"]).sample(others,
+                                                  tuning["candidates"] - 1)
+    flag_sets = [baseline] + sample
+  
+  candidates = {}
+  for flags in flag_sets:
+    digest = hashlib.sha1(" ".join(flags).encode('utf-8')).hexdigest()
+    compiler_name = base_name + "_" + digest[:8] if flags else base_name
+    candidates[compiler_name] = flags
+    config.COMPILERS[compiler_name] = config.extend_dict(base,
+                      {"flags": " ".join([base.get("flags", "")] + flags)})
+  
+  case_name = "tune_flags_" + implementation_name + "_" + dataset_name
+  case_config = {
+    "type": "full",
+    "files": config.FULL_DATASET[dataset_name],
+    "iterations": tuning["iterations"],
+    "timeout": tuning["timeout"],
+    "halving": {"eta": tuning["eta"], "survivors": tuning["survivors"]},
+    "tests": {compiler_name : {"implementation": implementation_name,
+                               "compiler": compiler_name}
+              for compiler_name in candidates}
+  }
+  return (case_name, case_config, candidates)
+
+def writeTunedCompilers(tuned, tuned_for):
+  '''Adds tuned (dict of compiler name to compiler) to config.TUNED_COMPILERS,
+     replacing those previously tuned for the same implementation & dataset,
+     and saves them to config.TUNED_COMPILERS_PATH.'''
+  compilers = {name : compiler
+               for (name, compiler) in config.TUNED_COMPILERS.items()
+               if compiler.get("tuned_for") != tuned_for}
+  for (name, compiler) in tuned.items():
+    compilers[name] = config.extend_dict(compiler, {"tuned_for": tuned_for})
+  temp_path = config.TUNED_COMPILERS_PATH + ".tmp"
+  with open(temp_path, 'w') as f:
+    print("# Generated by benchmark.py tune-flags: changes are overwritten.",
+          file=f)
+    print("TUNED_COMPILERS = " + pprint.pformat(compilers), file=f)
+  os.rename(temp_path, config.TUNED_COMPILERS_PATH)
+
+def tuneFlags(case_name, case_config, candidates, tuned_for, resume=False):
+  '''Finds the best flag sets by successive halving. Of those measured in
+     the final round, emits the Pareto-best in running time and number of
+     flags as new compilers.
+     tuned_for: implementation and dataset, recorded with the compilers'''
+  print(case_name, ": ", len(candidates), " flag sets", sep="")
+  with openResults(case_name, resume) as (result_file, case_journal):
+    (ranking, scores) = runFullHalvingTest(case_name, case_config, result_file,
+                                           case_journal)
+  
+  objectives = {compiler_name : (scores[compiler_name],
+                                 len(candidates[compiler_name]))
+                for compiler_name in ranking
+                if scores[compiler_name] != float('+inf')}
+  front = set(halving.paretoFront(objectives))
+  print("Final round (geometric mean algorithm time):")
+  for compiler_name in ranking:
+    print("\t", "*" if compiler_name in front else " ", " ",
+          scores[compiler_name], " ", compiler_name, ": ",
+          " ".join(candidates[compiler_name]) or "(no flags)", sep="")
+  
+  # baseline is already a compiler
+  tuned = {compiler_name : config.COMPILERS[compiler_name]
+           for compiler_name in front if candidates[compiler_name]}
+  writeTunedCompilers(tuned, tuned_for)
+  print("Pareto-best flag sets (*) written to ", config.TUNED_COMPILERS_PATH)
+
+def formatSize(size):
+  if size < 1024:
+    return "{0} B".format(size)
+  for unit in ["KiB", "MiB", "GiB", "TiB"]:
+    size /= 1024
+    if size < 1024:
+      break
+  return "{0:.1f} {1}".format(size, unit)
+
+def traceCacheCommand(command):
+  '''ls: lists traces in the trace cache, least recently used first.
+     gc: evicts least recently used traces until within quota.'''
+  cache = trace_cache.TraceCache(config.TRACE_CACHE_ROOT,
+                                 config.TRACE_CACHE_QUOTA,
+                                 config.compressed_variants)
+  if command == "ls":
+    entries = cache.entries()
+    for entry in entries:
+      description = entry["description"] or {}
+      print(time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"])),
+            formatSize(entry["size"]).rjust(10), entry["key"][:12],
+            description.get("trace", "?"), description.get("solver", "?"),
+            sep="  ")
+    total = sum(entry["size"] for entry in entries)
+    print(len(entries), "traces,", formatSize(total), "of",
+          formatSize(cache.quota), "quota")
+  elif command == "gc":
+    evicted = cache.collect()
+    for entry in evicted:
+      print("evicted", entry["key"][:12], formatSize(entry["size"]))
+    print("evicted", len(evicted), "traces,",
+          formatSize(sum(entry["size"] for entry in evicted)))
+
 def findTestCases(test_patterns):
   test_cases = set()
   for pattern_regex in test_patterns:
@@ -989,39 +2071,102 @@ if __name__ == "__main__":
   # Unbuffered output. This is needed for progress indicators to display correctly,
   # since a new line is printed only at the end of each test.    
   sys.stdout = flushfile(sys.stdout)
-  
-  # Install signal handler for timeouts
-  signal.signal(signal.SIGALRM, alarm_handler)
       
   build_only = False
   dont_build = False
-  test_cases = None
-  if len(sys.argv) == 1:
-    # no arguments
-    test_cases = config.TESTS.keys()
-  else:
-    if sys.argv[1] == "--build-only":
+  rerun = False
+  resume = False
+  jobs = 1
+  args = sys.argv[1:]
+  while args and args[0].startswith("--"):
+    flag = args.pop(0)
+    if flag == "--build-only":
       build_only = True
-      flag_found = True 
-    elif sys.argv[1] == "--dont-build":
+    elif flag == "--dont-build":
       dont_build = True
-      sys.argv[1:] = sys.argv[2:]
+    elif flag == "--rerun":
+      # Ignore results in the store. New results still recorded.
+      rerun = True
+    elif flag == "--resume":
+      # Continue interrupted test cases from where they stopped, appending to
+      # their result files.
+      resume = True
+    elif flag == "--jobs":
+      # Run up to N units of full and incremental offline tests concurrently,
+      # each worker pinned to its own set of CPUs.
+      try:
+        jobs = int(args.pop(0))
+      except (IndexError, ValueError):
+        error("--jobs requires a number of workers")
+      if jobs < 1 or jobs > parallel.availableCpus():
+        error("--jobs must be between 1 and ", parallel.availableCpus())
+    else:
+      error("Unrecognised flag: ", flag)
+  
+  if args and args[0] == "cache":
+    # cache ls|gc: inspect or trim the cache of hybrid traces
+    if len(args) != 2 or args[1] not in ["ls", "gc"]:
+      error("usage: benchmark.py cache ls|gc")
+    traceCacheCommand(args[1])
+    sys.exit(0)
+  
+  tuning = None
+  test_cases = None
+  if args and args[0] == "tune-flags":
+    # tune-flags <implementation> <dataset>: search config.FLAG_TUNING for
+    # the fastest flags for implementation on dataset (in FULL_DATASET)
+    if len(args) != 3:
+      error("usage: benchmark.py [flags] tune-flags <implementation> <dataset>")
+    (case_name, case_config, candidates) = flagTuningCase(args[1], args[2])
+    tuning = {"implementation": args[1], "dataset": args[2]}
+    tests = {case_name : case_config}
+  else:
+    if not args:
+      # no test patterns
+      test_cases = config.TESTS.keys()
+    else:
+      # arguments are list of test patterns
+      test_cases = findTestCases(args)
       
-    # arguments are list of test patterns
-    test_patterns = sys.argv[1:]
-    test_cases = findTestCases(test_patterns)
-    
-  print("Running: ", test_cases)
-  tests = {k : config.TESTS[k] for k in test_cases}
+    print("Running: ", test_cases)
+    tests = {k : config.TESTS[k] for k in test_cases}
   implementations = findImplementations(tests)
   
   if not dont_build:
-    # Dangerous -- assumes that tests have already been built.
-    # Should only be used by distributed_benchmark.py, where it's needed to
-    # avoid race (two instances running in parallel try to build the same target)
+    # --dont-build assumes that tests have already been built. Building is
+    # safe with several instances running in parallel (see builder), so this
+    # just avoids the overhead of checking.
     print("*** Building ***")
-    buildImplementations(implementations)
+    # some flag sets may not compile, e.g. -fno-exceptions
+    buildImplementations(implementations, keep_going=bool(tuning))
+  
+  if tuning:
+    for (compiler_name, test_instance) in list(case_config["tests"].items()):
+      implementation = implementations[implementationKey(test_instance)]
+      if not os.path.exists(executablePath(implementation)):
+        print("WARNING: ", compiler_name, " (", " ".join(candidates[compiler_name]),
+              ") not built, excluding it", sep="")
+        del case_config["tests"][compiler_name]
+        del candidates[compiler_name]
+    if not candidates:
+      error("No flag sets built")
   
   if not build_only:
     print("*** Running tests ***")
-    runTests(tests)
\ No newline at end of file
+    store = result_store.ResultStore(config.RESULT_STORE_ROOT,
+                                     use_stored=not rerun)
+    staging_area = staging.StagingArea(config.STAGING_ROOT,
+                                       config.STAGING_BUDGET)
+    snapshot_cache = snapshots.SnapshotCache(config.SNAPSHOT_ROOT,
+                        [config.SNAPSHOT_CREATOR_PROGRAM_PATH]
+                        + config.SNAPSHOT_CREATOR_PROGRAM_ARGUMENTS,
+                        decompressionStages, config.SNAPSHOT_QUOTA)
+    hybrid_traces = trace_cache.TraceCache(config.TRACE_CACHE_ROOT,
+                                           config.TRACE_CACHE_QUOTA,
+                                           config.compressed_variants)
+    # N.B. workers are forked, so must create pool after implementations set
+    with parallel.createPool(jobs) as pool:
+      if tuning:
+        tuneFlags(case_name, case_config, candidates, tuning, resume)
+      else:
+        runTests(tests, resume)
\ No newline at end of file
@@ -0,0 +1,110 @@
+'''Checks out and builds the versions of the solvers under test.
+
+All versions are extracted from git concurrently. Each (version, compiler)
+pair has its own build tree. These are built in parallel by a generated
+top-level Makefile, so all the builds share a single make jobserver, and the
+total number of jobs is bounded.
+
+File locks make it safe for several harness instances to build at once:
+whichever gets there second waits, then finds there is nothing left to do.'''
+
+import os, shutil, shlex, subprocess, fcntl, tempfile, contextlib
+import concurrent.futures
+
+@contextlib.contextmanager
+def fileLock(path):
+  with open(path, 'w') as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    yield
+
+def checkout(project_root, version, directory):
+  '''Extracts version into directory. Returns True if it was extracted, False
+     if it had already been.'''
+  with fileLock(directory + ".lock"):
+    if os.path.exists(directory):
+      # since version is always a commit ID, the code can never have changed
+      return False
+    # extract to temporary directory: directory only exists once complete
+    temp_directory = directory + ".tmp"
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    os.makedirs(temp_directory)
+    git = subprocess.Popen(["git", "archive", version], cwd=project_root,
+                           stdout=subprocess.PIPE)
+    tar = subprocess.Popen(["tar", "-xC", temp_directory], stdin=git.stdout)
+    # tar has its own copy
+    git.stdout.close()
+    for process in [git, tar]:
+      if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+    os.rename(temp_directory, directory)
+    return True
+
+def checkoutAll(project_root, directories):
+  '''directories: dict of version -> directory to extract it to.
+     Extracts all versions concurrently. Returns dict of version -> result
+     of checkout.'''
+  if not directories:
+    return {}
+  with concurrent.futures.ThreadPoolExecutor(len(directories)) as executor:
+    futures = {version : executor.submit(checkout, project_root,
+                                         version, directory)
+               for (version, directory) in directories.items()}
+    return {version : future.result() for (version, future) in futures.items()}
+
+# Replaced by $(MAKE) once the recipe has been quoted, so make knows the
+# recipe runs a sub-make and lets it use the jobserver
+_MAKE_PLACEHOLDER = "__SUBMAKE__"
+
+def _recipe(build, make_flags, launcher):
+  build_directory = os.path.join(build["directory"], "build")
+  log_directory = os.path.join(build["directory"], "log")
+  cmake = ["cmake", build["source_directory"]] + build["cmake_arguments"]
+  if launcher:
+    cmake += ["-DCMAKE_C_COMPILER_LAUNCHER=" + launcher,
+              "-DCMAKE_CXX_COMPILER_LAUNCHER=" + launcher]
+  quote = lambda args : " ".join(map(shlex.quote, args))
+  # N.B. Must NOT run CMake twice. This can break things!
+  # In particular, CMake will think that the compilers are being changed
+  # (even though they're remaining the same); it will issue a warning,
+  # and hose the CMakeCache completely (e.g. compiler flags get reset)
+  script = "cd {0} && (test -f CMakeCache.txt || {1}) && {2} {3}".format(
+             shlex.quote(build_directory), quote(cmake), _MAKE_PLACEHOLDER,
+             quote(make_flags + list(build["targets"])))
+  command = "mkdir -p {0} {1} && flock {2} sh -c {3} >{4} 2>{5}".format(
+             shlex.quote(build_directory), shlex.quote(log_directory),
+             shlex.quote(build["directory"] + ".lock"), shlex.quote(script),
+             shlex.quote(os.path.join(log_directory, "makefile.out")),
+             shlex.quote(os.path.join(log_directory, "makefile.err")))
+  # escape for make
+  command = command.replace("$", "$$")
+  return command.replace(_MAKE_PLACEHOLDER, "$(MAKE)")
+
+def buildAll(builds, jobs, make_flags=[], launcher=None, cache_root=None):
+  '''builds: list of dicts, with keys source_directory, directory (under which
+     the build and log directories are created), cmake_arguments & targets.
+     Runs all builds in parallel, with at most jobs jobs at once in total.
+
+     launcher: e.g. ccache, to reuse object files across versions. Paths under
+     cache_root are treated as relative, so identical sources in different
+     versions' directories hit in the cache.
+
+     Raises CalledProcessError if any build fails, after attempting the
+     others. Output of each build is in its log directory.'''
+  if not builds:
+    return
+  names = ["build_" + str(index) for index in range(len(builds))]
+  makefile = ".PHONY: all " + " ".join(names) + "\n"
+  makefile += "all: " + " ".join(names) + "\n"
+  for (name, build) in zip(names, builds):
+    makefile += "{0}:\n\t@{1}\n".format(name, _recipe(build, make_flags, launcher))
+
+  env = dict(os.environ)
+  if launcher and cache_root:
+    env["CCACHE_BASEDIR"] = cache_root
+    env["CCACHE_NOHASHDIR"] = "1"
+  with tempfile.NamedTemporaryFile('w', suffix=".mk") as f:
+    f.write(makefile)
+    f.flush()
+    # -k: one failing build shouldn't stop the others
+    subprocess.run(["make", "-k", "-j", str(jobs), "-f", f.name, "all"],
+                   env=env, check=True)
@@ -3,14 +3,35 @@
 # Example config file
 # Mock-up only
 
-import os, sh
+import os
 
 from config.common import *
 
+# Passed to make for each build. Don't use -j: see BUILD_JOBS.
 MAKE_FLAGS = []
+# Total number of jobs, across all builds (which run concurrently)
+BUILD_JOBS = os.cpu_count()
+# Compiler wrapper, used if installed. ccache lets versions with files in
+# common share object files.
+COMPILER_LAUNCHER = "ccache"
 WORKING_DIRECTORY = "/tmp/flowsolver_benchmark"
 
 RESULT_ROOT = os.path.join(PROJECT_ROOT, "benchmark")
+# Inputs are copied here (should be tmpfs) so they're only read from disk once.
+# Least recently used inputs are evicted once the total exceeds the budget,
+# in bytes. Set budget to 0 to read inputs from DATASET_ROOT every time.
+STAGING_ROOT = "/dev/shm/flowsolver_staging"
+STAGING_BUDGET = 8 * 1024 * 1024 * 1024
+# Snapshots of incremental inputs, for cases with "snapshot_fanout". Those of
+# the least recently used inputs are removed once the total exceeds the quota,
+# in bytes; those of inputs which have changed since, straight away.
+SNAPSHOT_ROOT = os.path.join(WORKING_DIRECTORY, "snapshots")
+SNAPSHOT_QUOTA = 64 * 1024 * 1024 * 1024
+# Traces generated by the simulator for hybrid tests, shared between commits.
+# Least recently used traces are evicted once the total exceeds the quota, in
+# bytes. "benchmark.py cache ls" lists them; "benchmark.py cache gc" evicts.
+TRACE_CACHE_ROOT = os.path.join(WORKING_DIRECTORY, "trace_cache")
+TRACE_CACHE_QUOTA = 64 * 1024 * 1024 * 1024
 FIRMAMENT_ROOT = os.path.join(os.path.dirname(PROJECT_ROOT), "firmament")
 
 try:
@@ -20,14 +41,30 @@ except ImportError:
   pass
 
 FIRMAMENT_MACHINE_DIR = os.path.join(FIRMAMENT_ROOT, "tests", "testdata")
+# Results of previous runs, keyed by commit, compiler, arguments, input & machine
+RESULT_STORE_ROOT = os.path.join(RESULT_ROOT, "store")
 
 ##### Executables
  
 GOOGLE_TRACE_SIMULATOR_PATH = os.path.join(FIRMAMENT_ROOT, 
                       "build", "sim", "trace-extract", "google_trace_simulator")
 GOOGLE_TRACE_SIMULATOR_ARGS = ["--logtostderr"]
-GOOGLE_TRACE_SIMULATOR = sh.Command(GOOGLE_TRACE_SIMULATOR_PATH) \
-                           .bake(*GOOGLE_TRACE_SIMULATOR_ARGS)                          
+# Stand-in needing only Python, used when firmament has not been built.
+# Takes the same flags; see trace_simulator.py for what it models.
+LOCAL_TRACE_SIMULATOR_PATH = os.path.join(os.path.dirname(SCRIPT_ROOT),
+                                          "trace_simulator.py")
+# The contents of GOOGLE_TRACE_SIMULATOR_FILES identify the simulator in the
+# trace cache: for the stand-in, these include the modules it imports.
+if os.path.exists(GOOGLE_TRACE_SIMULATOR_PATH):
+  GOOGLE_TRACE_SIMULATOR_FILES = [GOOGLE_TRACE_SIMULATOR_PATH]
+  GOOGLE_TRACE_SIMULATOR_COMMAND = [GOOGLE_TRACE_SIMULATOR_PATH] \
+                                 + GOOGLE_TRACE_SIMULATOR_ARGS
+else:
+  GOOGLE_TRACE_SIMULATOR_FILES = [LOCAL_TRACE_SIMULATOR_PATH] \
+    + [os.path.join(os.path.dirname(LOCAL_TRACE_SIMULATOR_PATH), module)
+       for module in ["throughput.py", "trace_store.py"]]
+  GOOGLE_TRACE_SIMULATOR_COMMAND = [sys.executable, LOCAL_TRACE_SIMULATOR_PATH] \
+                                 + GOOGLE_TRACE_SIMULATOR_ARGS
 
 ##### Dataset
 # Note these variables are not used by the suite at all. They are provided
@@ -162,11 +199,13 @@ FULL_DATASET["all_1hour_small"] = FULL_DATASET["quincy_1hour_small"] \
                                 + FULL_DATASET["octopus_1hour_small"]                                    
 FULL_DATASET["all_1hour"] = FULL_DATASET["quincy_1hour"] \
                           + FULL_DATASET["octopus_1hour"]
+# Quincy graphs generated by approx_generator.sh, with other random seeds
+# than the 1 hour graphs. Only the approximate tests benchmark these.
+FULL_DATASET["quincy_approx_medium_few"] = LazyFiles(
+  lambda : sorted(FULL_DATASET["quincy_approx_medium"])[:4])
 
-all_files = set()
-for files in FULL_DATASET.values():
-  all_files.update(files)
-FULL_DATASET["all"] = all_files
+_all_datasets = list(FULL_DATASET.values())
+FULL_DATASET["all"] = LazyFiles(lambda : sorted(set().union(*_all_datasets)))
 
 ### Incremental graphs
 INCREMENTAL_DATASET = {
@@ -201,6 +240,8 @@ INCREMENTAL_DATASET["all_1hour"] = INCREMENTAL_DATASET["quincy_1hour"] \
                                  + INCREMENTAL_DATASET["octopus_1hour"]                                  
 
 ### Google cluster trace(s)
+# "dir" may instead be a store converted by trace_store.py, which seeks
+# straight to a time window. Only the local trace simulator reads these.
 TRACE_DATASET = {
   "tiny_trace": 
   {
@@ -270,17 +311,44 @@ FIRMAMENT_DEFAULT_MACHINE = "24core"
 # "flags": C & C++ flags
 # "cflags": C-only flags
 # "cxxflags": C++-only flags
+# "lto": if True, use link-time optimisation. "ar" & "ranlib" are used to
+#        build the static library, and must understand LTO object files.
+# "pgo": profile-guided optimisation. Dict mapping implementation type
+#        ("full" or "incremental") to the name of a dataset (in FULL_DATASET
+#        or INCREMENTAL_DATASET, respectively). An instrumented build is run
+#        on each file in the dataset, and the profile used for the final build.
+# "profile_generate": flags for the instrumented build, {0} the profile directory
+# "profile_merge": command to merge the raw profiles, which are appended to it
+# "profile_use": flags for the final build
 
 COMPILER_GCC = {
     "cc": "gcc",
     "cxx": "g++",
+    "ar": "gcc-ar",
+    "ranlib": "gcc-ranlib",
+    "profile_generate": "-fprofile-generate={0}",
+    # N.B. profile is found by mangled object path: must build in same place
+    "profile_use": "-fprofile-use={0} -fprofile-correction -Wno-missing-profile",
 }
 
 COMPILER_CLANG = {
     "cc": "clang",
     "cxx": "clang++",
+    "ar": "llvm-ar",
+    "ranlib": "llvm-ranlib",
+    "profile_generate": "-fprofile-generate={0}",
+    "profile_merge": ["llvm-profdata", "merge", "-output={0}/default.profdata"],
+    "profile_use": "-fprofile-use={0}/default.profdata",
 } 
 
+# Training inputs for PGO. Representative of, but not the same as, the inputs
+# the compilers_* cases benchmark, so builds are not tuned on the inputs they
+# are compared on. Those cases are all full. N.B. quincy_1hour_small is also
+# benchmarked by the incremental cases: a PGO build used there would be
+# compared on its own training inputs.
+PGO_TRAINING = {"full": "quincy_approx_medium_few",
+                "incremental": "quincy_1hour_small"}
+
 COMPILERS = {
   #"gcc_debug": extend_dict(COMPILER_GCC, {"flags": "-g"}),
   "gcc_O0": extend_dict(COMPILER_GCC, {"flags": "-O0 -DNDEBUG"}),
@@ -292,10 +360,64 @@ COMPILERS = {
   "clang_O1": extend_dict(COMPILER_CLANG, {"flags": "-O1 -DNDEBUG"}),
   "clang_O2": extend_dict(COMPILER_CLANG, {"flags": "-O2 -DNDEBUG"}),
   "clang_O3": extend_dict(COMPILER_CLANG, {"flags": "-O3 -DNDEBUG"}),
+  "gcc_O3_lto": extend_dict(COMPILER_GCC, {"flags": "-O3 -DNDEBUG",
+                                           "lto": True}),
+  "gcc_O3_pgo": extend_dict(COMPILER_GCC, {"flags": "-O3 -DNDEBUG",
+                                           "pgo": PGO_TRAINING}),
+  "gcc_O3_pgo_lto": extend_dict(COMPILER_GCC, {"flags": "-O3 -DNDEBUG",
+                                               "lto": True,
+                                               "pgo": PGO_TRAINING}),
+  "clang_O3_lto": extend_dict(COMPILER_CLANG, {"flags": "-O3 -DNDEBUG",
+                                               "lto": True}),
+  "clang_O3_pgo": extend_dict(COMPILER_CLANG, {"flags": "-O3 -DNDEBUG",
+                                               "pgo": PGO_TRAINING}),
+  "clang_O3_pgo_lto": extend_dict(COMPILER_CLANG, {"flags": "-O3 -DNDEBUG",
+                                                   "lto": True,
+                                                   "pgo": PGO_TRAINING}),
 }
 
+# Flag sets found by benchmark.py tune-flags (see FLAG_TUNING)
+TUNED_COMPILERS = {}
+try:
+  from config.compilers_tuned import TUNED_COMPILERS
+except ImportError:
+  pass
+COMPILERS.update(TUNED_COMPILERS)
+
+# Used for all tests which don't specify a compiler. If the compilers_* cases
+# show a PGO or LTO build to be faster, it can be used here.
 DEFAULT_COMPILER = "gcc_O3"
 
+### Compiler flag tuning
+# benchmark.py tune-flags <implementation> <dataset> races sets of flags,
+# added to those of the base compiler, by successive halving. The Pareto-best
+# in running time & number of flags are saved to TUNED_COMPILERS_PATH, and
+# become entries in COMPILERS.
+FLAG_TUNING = {
+  "base": "gcc_O3",
+  # One alternative is picked from each dimension ("" for no flag)
+  "space": {
+    "arch": ["", "-march=native"],
+    "unroll": ["", "-funroll-loops", "-funroll-all-loops"],
+    "inline": ["", "-finline-limit=1000", "--param max-inline-insns-auto=100"],
+    "exceptions": ["", "-fno-exceptions"],
+    "frame_pointer": ["", "-fomit-frame-pointer"],
+    "ipa": ["", "-fipa-pta"],
+  },
+  # If the space is larger, a random sample of this many flag sets is raced,
+  # always including the base compiler
+  "candidates": 32,
+  "seed": 0,
+  # Budget of the final round. Earlier rounds use fewer files & iterations.
+  "iterations": 5,
+  "timeout": 120,
+  # Fraction of flag sets promoted to each round is 1/eta
+  "eta": 2,
+  # Number of flag sets in the final round
+  "survivors": 4,
+}
+TUNED_COMPILERS_PATH = os.path.join(SCRIPT_ROOT, "compilers_tuned.py")
+
 def compilerTests(test_cases, compilers):
   d = {}
   for test_name, test_config in test_cases.items():
@@ -519,6 +641,27 @@ IMPLEMENTATIONS = merge_dicts([FULL_IMPLEMENTATIONS, INCREMENTAL_IMPLEMENTATIONS
 
 DEFAULT_TIMEOUT = 60 # 1 minute
 
+# Full tests may specify "race_factor": once one test has solved a file, the
+# others are killed if they take race_factor times longer (see racing).
+# Nothing bounds the tests run before then: list tests known to be fast in
+# "race_first", to run them first on each file. N.B. without --jobs, tests
+# are run one at a time, so only those after the first to finish are bounded.
+
+# Full and incremental offline tests may specify "colocate": {"n": N, "pin":
+# "isolated" or "shared"}. Each test is then run alone, and then as N identical
+# instances at once on the same input, recording the slowdown of each.
+# "isolated" pins each instance to its own CPUs, so they only contend for
+# caches and memory bandwidth; "shared" lets them all run on any CPU.
+
+# Parameter sweeps of full tests may specify "halving": each test is run once
+# on a cheap subset of files, then only the best are run on more files and
+# iterations. See halving for the options.
+_SCALING_FACTOR_HALVING = {
+  "eta": 2,
+  "survivors": 4,
+  "initial_files": ["clusters/natural/google_trace/quincy/1hour/medium_first.min"],
+}
+
 ### Tests on full graphs, comparing only full solvers
 FULL_TESTS = {
   # For testing benchmark suite only
@@ -651,12 +794,15 @@ FULL_TESTS = {
   ## Relaxation
   # Caching arcs crossing the cut
   # There's really high variance on the none case for some reason, so bump
-  # number of iterations to get reasonable error margins.
+  # number of iterations to get reasonable error margins. Stop early on the
+  # (test, file) pairs that converge quickly.
   "opt_relax_cache_arcs_quincy": {
     "files": FULL_DATASET["quincy_1hour"],
     # It's quite slow even on medium-sized datasets, so need to bump the timeout
     "timeout": 600,
     "iterations": 30,
+    "target_relative_ci": 0.05,
+    "min_iterations": 5,
     "tests": {
       "none": {
         "implementation": "f_relax_cache_none",
@@ -668,8 +814,11 @@ FULL_TESTS = {
   },
   "opt_relax_cache_arcs_octopus": {
     "files": FULL_DATASET["octopus_1hour_small"],
-    # No cache is REALLY slow. Bump the timeout so can have a better graph.
+    # No cache is REALLY slow. Bump the timeout so can have a better graph,
+    # but don't spend hours confirming it's more than 20x slower.
     "timeout": 7200,
+    "race_factor": 20,
+    "race_first": ["all"],
     "iterations": 10,
     "tests": {
       "none": {
@@ -686,6 +835,8 @@ FULL_TESTS = {
     "files": FULL_DATASET["all_1hour_small"],
     "iterations": 10,
     "timeout": 7200,
+    "race_factor": 20,
+    "race_first": ["fifo"],
     "tests": {
       "wave": {
         "implementation": "f_cs_wave",
@@ -695,11 +846,15 @@ FULL_TESTS = {
       },
     },
   },
-  "opt_cs_scaling_factor": {
+  # Most scaling factors are clearly bad after one run: race them, and only run
+  # the best few on every file (see halving). Every factor is still run on the
+  # medium graph, for the scaling factor figures.
+  "opt_cs_scaling_factor": lambda : {
     "files": FULL_DATASET["quincy_1hour_small"] \
            + FULL_DATASET["quincy_1hour_large_only"],
     "iterations": 5,
     "timeout": 120,
+    "halving": _SCALING_FACTOR_HALVING,
     "tests": { 
       str(x): {
         "implementation": "f_cs_latest",
@@ -707,9 +862,10 @@ FULL_TESTS = {
       } for x in range(2,32)
     }
   },
-  "opt_cs_goldberg_scaling_factor": {
+  "opt_cs_goldberg_scaling_factor": lambda : {
     "files": FULL_DATASET["quincy_1hour"],
     "iterations": 5,
+    "halving": _SCALING_FACTOR_HALVING,
     "tests": { 
       str(x): {
         "implementation": "f_cs_goldberg",
@@ -746,38 +902,38 @@ FULL_TESTS = {
  
   ### Compiler comparisons
   ## My implementations
-  "compilers_ap": {
+  "compilers_ap": lambda : {
     "files": FULL_DATASET["all_1hour_small"],
     "iterations": 5,              
     "tests": compilerTests({"ap": {"implementation": "f_ap_latest"}},
                            COMPILERS.keys())
   },
-  "compilers_cc": {
+  "compilers_cc": lambda : {
     "files": FULL_DATASET["all_1hour_mini"],
     "iterations": 5,              
     "tests": compilerTests({"cc": {"implementation": "f_cc_latest"}},
                            COMPILERS.keys())
   },
-  "compilers_cs": {
+  "compilers_cs": lambda : {
     "files": FULL_DATASET["all_1hour"],
     "iterations": 5,              
     "tests": compilerTests({"cs": {"implementation": "f_cs_latest"}},
                            COMPILERS.keys())
   },
-  "compilers_relax": {
+  "compilers_relax": lambda : {
     "files": FULL_DATASET["quincy_1hour"] + FULL_DATASET["octopus_1hour_small"],
     "iterations": 5,              
     "tests": compilerTests({"relax": {"implementation": "f_relax_latest"}},
                            COMPILERS.keys())
   },
   ## Reference implementations
-  "compilers_cs_goldberg": {
+  "compilers_cs_goldberg": lambda : {
     "files": FULL_DATASET["all_1hour"],
     "iterations": 5,              
     "tests": compilerTests({"goldberg": {"implementation": "f_cs_goldberg"}},
                            COMPILERS.keys())
   },
-  "compilers_relax_frangioni": {
+  "compilers_relax_frangioni": lambda : {
     "files": FULL_DATASET["all_1hour"],
     "iterations": 5,              
     "tests": compilerTests({"frangioni": {"implementation": "f_relax_frangioni"}},
@@ -794,8 +950,33 @@ FULL_TESTS = {
       "frangioni_relax": {"implementation": "f_relax_frangioni"},
     },
   },
+  ## Interference
+  "colocate_isolated": {
+    "files": FULL_DATASET["quincy_1hour_small"],
+    "iterations": 3,
+    "colocate": {"n": 4, "pin": "isolated"},
+    "tests": {
+      "cs": {"implementation": "f_cs_latest"},
+      "relax": {"implementation": "f_relax_latest"},
+      "ap": {"implementation": "f_ap_latest"},
+    },
+  },
+  "colocate_shared": {
+    "files": FULL_DATASET["quincy_1hour_small"],
+    "iterations": 3,
+    "colocate": {"n": 4, "pin": "shared"},
+    "tests": {
+      "cs": {"implementation": "f_cs_latest"},
+      "relax": {"implementation": "f_relax_latest"},
+      "ap": {"implementation": "f_ap_latest"},
+    },
+  },
 }
 
+# Offline and hybrid cases may set "sample_memory": True to record the solver's
+# resident and anonymous memory after each delta (rss_kb and anon_kb columns).
+# Offline cases may set "snapshot_fanout": True to solve the snapshots of full
+# solvers concurrently, one per worker, rather than in turn (needs --jobs).
 INCREMENTAL_TESTS_OFFLINE = {
   # For testing benchmark suite only.
   "development_only": {
@@ -812,6 +993,87 @@ INCREMENTAL_TESTS_OFFLINE = {
   },
 }
 
+# Replay tests release each delta of the graph at the cluster time it was
+# recorded, divided by each of "speedups", whether or not the solver has
+# finished the last: how fast can the trace go before deltas queue up?
+# Timestamps are read from <file>.timestamps, one per delta in microseconds.
+# Hybrid tests write one alongside each trace they generate (in the trace
+# cache), from the cluster timestamp of each scheduling round, and extract.py
+# moves it with the trace into the dataset. A case with files lacking one
+# fails, unless it sets "arrival_interval": then deltas of those files arrive
+# every arrival_interval seconds instead, which is not cluster time.
+# "timeout" applies to each delta, from when the solver starts it.
+INCREMENTAL_TESTS_REPLAY = {
+  "development_only": {
+    "files": INCREMENTAL_DATASET["development_only"],
+    "iterations": 1,
+    # not generated by the simulator: no timestamps
+    "arrival_interval": 1,
+    "speedups": [1, 10, 100],
+    "timeout": 60,
+    "tests": {
+      "my": {
+        "implementation": "i_ap_latest",
+      },
+      "goldberg": {
+        "implementation": "f_cs_goldberg",
+      },
+    },
+  },
+  "quincy_1hour_small": {
+    "files": INCREMENTAL_DATASET["quincy_1hour_small"],
+    "iterations": 3,
+    "speedups": [1, 2, 4, 8, 16, 32, 64],
+    "timeout": 600,
+    "tests": {
+      "my": {
+        "implementation": "i_ap_latest",
+      },
+      "my_relax": {
+        "implementation": "i_relaxf_latest",
+      },
+      "goldberg": {
+        "implementation": "f_cs_goldberg",
+      },
+    },
+  },
+}
+
+# Throughput tests stream the graph to the solver as fast as it reads it, and
+# report deltas and changes solved per second over sliding windows of
+# "window" seconds (default 10), starting every "window_step" (default half a
+# window). The first "warmup" deltas (default 10) of each pass are excluded.
+# Traces may be amplified (see throughput.py): "copies" replicates the
+# cluster, and "loops" plays the trace repeatedly in the same solver.
+INCREMENTAL_TESTS_THROUGHPUT = {
+  "development_only": {
+    "files": INCREMENTAL_DATASET["development_only"],
+    "iterations": 1,
+    "window": 1,
+    "warmup": 1,
+    "tests": {
+      "my": {
+        "implementation": "i_ap_latest",
+      },
+    },
+  },
+  "quincy_1hour_small": {
+    "files": INCREMENTAL_DATASET["quincy_1hour_small"],
+    "iterations": 3,
+    "copies": 4,
+    "loops": 3,
+    "timeout": 600,
+    "tests": {
+      "my": {
+        "implementation": "i_ap_latest",
+      },
+      "my_relax": {
+        "implementation": "i_relaxf_latest",
+      },
+    },
+  },
+}
+
 ### Incremental tests: available either as hybrid, or pure online
 
 COST_MODELS = {
@@ -830,6 +1092,15 @@ DEFAULT_COST_MODEL = "simulated_quincy"
 DEFAULT_BATCH_STEP = 10 # microseconds
 DEFAULT_ONLINE_FACTOR = 1
 DEFAULT_ONLINE_MAX_TIME = 5 # seconds
+# A simulator making no progress (no statistics, log output or trace output)
+# for this long, on top of the solver timeout, is killed. Cases may override
+# with "stall_timeout".
+SIMULATOR_STALL_TIMEOUT = 600 # seconds
+# Hybrid tests generate traces concurrently with the offline runs replaying
+# them. Simulators (and the solvers they run) can use a lot of memory on the
+# larger traces, so few are run at once. Cases may override with
+# "max_simulators".
+MAX_CONCURRENT_SIMULATORS = 1
 
 INCREMENTAL_TESTS_ANYONLINE = {
   # Testing benchmark suite only.
@@ -853,7 +1124,7 @@ INCREMENTAL_TESTS_ANYONLINE = {
     },
    },
   # For producing datasets used in optimisation tests
-  "generate_random": { # Random currently has some unimplemented functions
+  "generate_random": lambda : { # Random currently has some unimplemented functions
     "traces": { k : extend_dict(v, {"cost_model": "random"}) 
                 for k,v in STANDARD_TRACE_CONFIG_1HOUR.items() },
     "iterations": 0,
@@ -861,7 +1132,7 @@ INCREMENTAL_TESTS_ANYONLINE = {
       "goldberg": { "implementation": "i_relaxf_latest"},
     },
   },
-  "generate_sjf": { # SJF currently has some unimplemented functions
+  "generate_sjf": lambda : { # SJF currently has some unimplemented functions
     "traces": { k : extend_dict(v, {"cost_model": "sjf"}) 
                 for k,v in STANDARD_TRACE_CONFIG_1HOUR.items() },
     "iterations": 0,
@@ -869,7 +1140,7 @@ INCREMENTAL_TESTS_ANYONLINE = {
       "goldberg": { "implementation": "i_relaxf_latest" },
     },
   },
-  "generate_octopus": {
+  "generate_octopus": lambda : {
     "traces": { k : extend_dict(v, {"cost_model": "octopus"}) 
                 for k,v in STANDARD_TRACE_CONFIG_1HOUR.items() },
     "iterations": 0,
@@ -877,7 +1148,7 @@ INCREMENTAL_TESTS_ANYONLINE = {
       "goldberg": { "implementation": "i_relaxf_latest" },
     },
   },
-  "generate_quincy": {
+  "generate_quincy": lambda : {
     "traces": { k : extend_dict(v, {"cost_model": "simulated_quincy"}) 
                 for k,v in STANDARD_TRACE_CONFIG_1HOUR.items() },
     "iterations": 0,
@@ -885,7 +1156,7 @@ INCREMENTAL_TESTS_ANYONLINE = {
       "goldberg": { "implementation": "i_relaxf_latest" },
     },
   },
-  "generate_quincy_longgap": {
+  "generate_quincy_longgap": lambda : {
     # 600000000 = minute scheduling interval
     "traces": { k : extend_dict(v, {"cost_model": "simulated_quincy"})  
                 for k,v in STANDARD_TRACE_CONFIG_24HOUR.items() },
@@ -895,7 +1166,7 @@ INCREMENTAL_TESTS_ANYONLINE = {
       "goldberg": { "implementation": "f_cs_goldberg" },
     },
   },
-  "generate_octopus_longgap": {
+  "generate_octopus_longgap": lambda : {
     # 600000000 = minute scheduling interval
     "traces": { k : extend_dict(v, {"cost_model": "octopus"})  
                 for k,v in STANDARD_TRACE_CONFIG_24HOUR.items() },
@@ -1115,15 +1386,21 @@ APPROXIMATE_TESTS_INCREMENTAL_HYBRID = {
 
 ### All tests
 
-TESTS = merge_dicts(
+# Each case is only built when it is looked up (see LazyCases). Cases which
+# are costly to build, e.g. by compilerTests, are given as a function
+# returning the case.
+TESTS = merge_cases(
   [FULL_TESTS,
    INCREMENTAL_TESTS_OFFLINE, 
    INCREMENTAL_TESTS_HYBRID,
    INCREMENTAL_TESTS_ONLINE,
+   INCREMENTAL_TESTS_REPLAY,
+   INCREMENTAL_TESTS_THROUGHPUT,
    APPROXIMATE_TESTS_FULL,
    APPROXIMATE_TESTS_INCREMENTAL_OFFLINE,
    APPROXIMATE_TESTS_INCREMENTAL_HYBRID],
-  ["f", "iof", "ihy", "ion", "af", "aio", "aih"],
+  ["f", "iof", "ihy", "ion", "irp", "itp", "af", "aio", "aih"],
   ["full", "incremental_offline", "incremental_hybrid", "incremental_online",
-   "approximate_full", "approximate_incremental_offline", 
+   "incremental_replay", "incremental_throughput", "approximate_full",
+   "approximate_incremental_offline", 
    "approximate_incremental_hybrid"])
@@ -1,4 +1,4 @@
-import os, sys, glob, itertools, functools, sh
+import os, sys, glob, itertools, functools, json, collections.abc, sh
 
 # For reading DIMACS input
 BUFFER_SIZE = 4 * 1024
@@ -10,6 +10,9 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(S
 BUILD_PREFIX = "build"
 SOURCE_PREFIX = "src"
 DATASET_ROOT = os.path.join(PROJECT_ROOT, SOURCE_PREFIX, "graphs")
+# Cache of graph_glob results, invalidated when the directory is modified
+GRAPH_GLOB_MANIFEST = os.path.join(PROJECT_ROOT, BUILD_PREFIX,
+                                   "graph_glob_manifest.json")
 EXECUTABLE_DIR = os.path.join(PROJECT_ROOT, BUILD_PREFIX, "bin")
 EXECUTABLE_SRC_DIR = os.path.join(PROJECT_ROOT, SOURCE_PREFIX, "bin")
 
@@ -30,8 +33,24 @@ SNAPSHOT_CREATOR_PROGRAM = sh.Command(SNAPSHOT_CREATOR_PROGRAM_PATH) \
 SNAPSHOT_SOLVER_PROGRAM_PATH  = os.path.join(EXECUTABLE_DIR,
                                              "snapshot_solver")
 SNAPSHOT_SOLVER_PROGRAM = sh.Command(SNAPSHOT_SOLVER_PROGRAM_PATH)
+# Program counting the changes made by each delta
+DELTA_STATISTICS_PROGRAM_PATH = os.path.join(EXECUTABLE_DIR,
+                                             "incremental_statistics")
                             
 
+### Compressed inputs
+# Inputs with these suffixes are decompressed as they are read, by the first of
+# the commands which is installed. Multi-threaded decompressors preferred.
+DECOMPRESSORS = {
+  ".zst": [["zstd", "-dcq", "-T0"]],
+  ".xz": [["xz", "-dcq", "-T0"]],
+  ".gz": [["pigz", "-dc"], ["gzip", "-dc"]],
+}
+
+### Statistics
+# Used for error bars, and for deciding when results have converged
+CONFIDENCE_LEVEL = 0.95
+
 ### Convenience functions
 
 #For specifying files
@@ -41,10 +60,94 @@ def prefix_list(prefix, fnames):
 def prefix_dict(prefix, d):
   return {k : os.path.join(prefix, v) for (k,v) in d.items()}
 
-def graph_glob(pathname):
+class LazyFiles(collections.abc.Sequence):
+  '''List of files, computed the first time it is used. So only the datasets
+     of the test cases actually being run are ever looked up.'''
+  def __init__(self, compute):
+    self._compute = compute
+    self._files = None
+
+  def _resolve(self):
+    if self._files is None:
+      self._files = list(self._compute())
+    return self._files
+
+  def __getitem__(self, index):
+    return self._resolve()[index]
+
+  def __len__(self):
+    return len(self._resolve())
+
+  def __add__(self, other):
+    return LazyFiles(lambda : list(self) + list(other))
+
+  def __radd__(self, other):
+    return LazyFiles(lambda : list(other) + list(self))
+
+  def __repr__(self):
+    return repr(self._resolve())
+
+  def __reduce__(self):
+    # sent to workers as a plain list
+    return (list, (self._resolve(),))
+
+def _graph_glob(pathname):
   fnames = glob.glob(os.path.join(DATASET_ROOT, pathname))
+  found = set(fnames)
+  for suffix in DECOMPRESSORS:
+    for fname in glob.glob(os.path.join(DATASET_ROOT, pathname + suffix)):
+      if fname[:-len(suffix)] not in found:
+        found.add(fname[:-len(suffix)])
+        fnames.append(fname)
   return list(map(lambda x : os.path.relpath(x, DATASET_ROOT), fnames))
 
+_graph_glob_manifest = None
+
+def _cached_graph_glob(pathname):
+  global _graph_glob_manifest
+  path = os.path.join(DATASET_ROOT, pathname)
+  directory = os.path.dirname(path)
+  if glob.has_magic(directory):
+    # would have to check every directory matched
+    return _graph_glob(pathname)
+  try:
+    # adding or removing a file changes the mtime of its directory
+    mtime = os.stat(directory).st_mtime_ns
+  except OSError:
+    return []
+
+  if _graph_glob_manifest is None:
+    try:
+      with open(GRAPH_GLOB_MANIFEST) as f:
+        _graph_glob_manifest = json.load(f)
+    except (OSError, ValueError):
+      _graph_glob_manifest = {}
+  entry = _graph_glob_manifest.get(path)
+  if entry and entry["mtime"] == mtime:
+    return entry["files"]
+
+  fnames = _graph_glob(pathname)
+  _graph_glob_manifest[path] = {"mtime": mtime, "files": fnames}
+  try:
+    os.makedirs(os.path.dirname(GRAPH_GLOB_MANIFEST), exist_ok=True)
+    temp_path = GRAPH_GLOB_MANIFEST + "." + str(os.getpid())
+    with open(temp_path, 'w') as f:
+      json.dump(_graph_glob_manifest, f)
+    os.rename(temp_path, GRAPH_GLOB_MANIFEST)
+  except OSError:
+    # only a cache
+    pass
+  return fnames
+
+def graph_glob(pathname):
+  '''Also matches compressed versions of files (see DECOMPRESSORS). If a file
+     is present both compressed and uncompressed, only one is returned.
+     Returns a LazyFiles: the glob is only evaluated when the files are used.'''
+  return LazyFiles(functools.partial(_cached_graph_glob, pathname))
+
+def compressed_variants(path):
+  return [path + suffix for suffix in DECOMPRESSORS]
+
 # For merging dictionaries, and tagging elements
 def merge_dicts(dicts, prefix, tags=None, sep='_'):
   assert(len(dicts) == len(prefix))
@@ -65,6 +168,39 @@ def merge_dicts(dicts, prefix, tags=None, sep='_'):
   
   return result
 
+class LazyCases(collections.abc.Mapping):
+  '''Test cases by name. Each is built the first time it is looked up, so
+     only the cases actually being run are ever constructed.'''
+  def __init__(self, thunks):
+    '''thunks: dict of names -> function returning the case's config'''
+    self._thunks = thunks
+    self._cases = {}
+
+  def __getitem__(self, name):
+    if name not in self._cases:
+      self._cases[name] = self._thunks[name]()
+    return self._cases[name]
+
+  def __iter__(self):
+    return iter(self._thunks)
+
+  def __len__(self):
+    return len(self._thunks)
+
+def merge_cases(dicts, prefix, tags, sep='_'):
+  '''As merge_dicts, but returns a LazyCases. Cases in dicts may be given as
+     a function returning the case, to defer building it until it is used.'''
+  assert(len(dicts) == len(prefix) == len(tags))
+  def build(case, tag):
+    case = case() if callable(case) else case.copy()
+    case["type"] = tag
+    return case
+  thunks = {}
+  for (dict,tag,prefix) in zip(dicts,tags,prefix):
+    for (k,v) in dict.items():
+      thunks[prefix + sep + k] = functools.partial(build, v, tag)
+  return LazyCases(thunks)
+
 def extend_dict(d1, d2):
   d = d1.copy()
   d.update(d2)
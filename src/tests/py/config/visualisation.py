@@ -65,9 +65,6 @@ DEFAULT_APPEARANCE = {
   '2col': set_rcs_twocol,
 }
 
-### Miscellaneous settings
-CONFIDENCE_LEVEL = 0.95
-
 ### Paths
 
 DOC_PREFIX = "doc"
@@ -0,0 +1,86 @@
+'''Successive halving: finding the best of many candidates (e.g. sets of
+compiler flags, or values of a parameter) without running them all in full.
+
+Every candidate is first run on a small budget: the cheapest few files, and
+few iterations. Only the best 1/eta of them are promoted to the next round,
+which has a budget eta times larger, and so on. The final round runs the
+survivors on the full budget. So most of the time is spent measuring the
+candidates which are competitive.'''
+
+import math
+
+DEFAULT_ETA = 2
+
+# A case opts in by specifying "halving": a dict, which may be empty, with
+# optional keys:
+#  "eta": 1/eta of the candidates are promoted to each round (default 2)
+#  "survivors": number of candidates in the final round (default 1)
+#  "initial_files": files every candidate is run on in the first round, e.g.
+#                   those a figure needs. Default: the smallest files.
+def enabled(case_config):
+  return "halving" in case_config
+
+def options(case_config):
+  '''Returns (eta, survivors, initial_files) for the case'''
+  settings = case_config["halving"]
+  return (settings.get("eta", DEFAULT_ETA), settings.get("survivors", 1),
+          settings.get("initial_files", []))
+
+def schedule(num_candidates, num_files, iterations, eta=DEFAULT_ETA,
+             survivors=1, min_files=1):
+  '''Returns list of (candidates, files, iterations) for each round: how many
+     candidates it runs, on how many files, for how many iterations. Every
+     round runs at least min_files files. The last round runs survivors
+     candidates on all files, for all iterations.'''
+  assert(eta > 1 and survivors >= 1)
+  min_files = min(max(1, min_files), num_files)
+  counts = [num_candidates]
+  while counts[-1] > survivors:
+    counts.append(max(survivors, math.ceil(counts[-1] / eta)))
+  final_round = len(counts) - 1
+  rounds = []
+  for (r, count) in enumerate(counts):
+    scale = eta ** (r - final_round)
+    rounds.append((count, max(min_files, math.ceil(num_files * scale)),
+                          max(1, math.ceil(iterations * scale))))
+  return rounds
+
+def score(times):
+  '''times: dict mapping file to list of running times of a candidate, None
+     for a timeout. Returns geometric mean over files of the mean running
+     time, so each file counts equally however long it takes; infinite if
+     any run timed out. Lower is better.'''
+  if not times:
+    return float('+inf')
+  log_sum = 0
+  for file_times in times.values():
+    if not file_times or None in file_times:
+      return float('+inf')
+    mean = sum(file_times) / len(file_times)
+    # timer resolution: a run may take "0" seconds
+    log_sum += math.log(max(mean, 1e-9))
+  return math.exp(log_sum / len(times))
+
+def successiveHalving(candidates, rounds, evaluate):
+  '''rounds: as returned by schedule.
+     evaluate(candidates, num_files, iterations): runs candidates, returning
+     dict mapping each to its score.
+     Returns candidates of the final round, best first, and their scores.
+     Ties are broken in favour of candidates given first.'''
+  survivors = list(candidates)
+  for (r, (count, num_files, iterations)) in enumerate(rounds):
+    assert(len(survivors) == count)
+    scores = evaluate(survivors, num_files, iterations)
+    order = {candidate : index for (index, candidate) in enumerate(candidates)}
+    survivors.sort(key=lambda candidate : (scores[candidate], order[candidate]))
+    if r + 1 < len(rounds):
+      survivors = survivors[:rounds[r + 1][0]]
+  return (survivors, scores)
+
+def paretoFront(objectives):
+  '''objectives: dict mapping candidate to tuple of objectives, lower better.
+     Returns candidates not dominated by any other.'''
+  def dominates(x, y):
+    return all(a <= b for (a, b) in zip(x, y)) and x != y
+  return [candidate for (candidate, x) in objectives.items()
+          if not any(dominates(y, x) for y in objectives.values())]
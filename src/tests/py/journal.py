@@ -0,0 +1,65 @@
+'''Crash-safe record of progress through a test case, so an interrupted
+campaign can be resumed.
+
+The journal is an append-only log with one line per completed unit (e.g. a
+(test, file, iteration) run), recording the length of the result CSV once
+the unit's rows were written. Both files are fsync'd before the entry counts
+as committed. On resume, the CSV is truncated back to the last committed
+length, discarding rows of any partially completed unit, and committed units
+are not run again.'''
+
+import os, json
+
+class Journal(object):
+  def __init__(self, path, result_file, resume=False):
+    '''result_file must be opened for reading and writing. If resume is False,
+       or there is no journal to resume from, any existing results are
+       discarded.'''
+    self.result_file = result_file
+    self.entries = {}
+    offset = 0
+    if resume:
+      try:
+        with open(path) as f:
+          for line in f:
+            if not line.endswith("\n"):
+              # crashed partway through writing it: not committed
+              break
+            entry = json.loads(line)
+            self.entries[tuple(entry["unit"])] = entry["state"]
+            offset = entry["offset"]
+      except OSError:
+        pass
+
+    result_file.seek(offset)
+    result_file.truncate()
+    self.journal_file = open(path, 'a' if self.entries else 'w')
+
+  def done(self, *unit):
+    return unit in self.entries
+
+  def state(self, *unit):
+    '''Returns state committed with unit, or None if unit is not done.'''
+    return self.entries.get(unit)
+
+  def commit(self, *unit, **state):
+    '''Call once all rows for unit have been written to the result file.
+       state must be JSON serializable.'''
+    self.result_file.flush()
+    os.fsync(self.result_file.fileno())
+    entry = {"unit": unit,
+             "offset": self.result_file.tell(),
+             "state": state}
+    self.journal_file.write(json.dumps(entry) + "\n")
+    self.journal_file.flush()
+    os.fsync(self.journal_file.fileno())
+    self.entries[unit] = state
+
+  def close(self):
+    self.journal_file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
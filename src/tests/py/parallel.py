@@ -0,0 +1,266 @@
+import os, collections, multiprocessing, concurrent.futures
+
+### CPU topology
+
+SYSFS_NODE_ROOT = "/sys/devices/system/node"
+SYSFS_CPU_ROOT = "/sys/devices/system/cpu"
+
+def parseCpuList(cpulist):
+  '''parses Linux CPU list format, e.g. "0-3,8,10-11"'''
+  cpus = []
+  for chunk in cpulist.strip().split(","):
+    if not chunk:
+      continue
+    if "-" in chunk:
+      start, end = chunk.split("-")
+      cpus += range(int(start), int(end) + 1)
+    else:
+      cpus.append(int(chunk))
+  return cpus
+
+def _readCpuList(path):
+  try:
+    with open(path) as f:
+      return parseCpuList(f.read())
+  except OSError:
+    return None
+
+def _siblingOrder(cpus):
+  '''orders CPUs so that hyperthreads sharing a physical core are adjacent.
+     Contiguous slices of the result then never split a core between sets.'''
+  def coreKey(cpu):
+    path = os.path.join(SYSFS_CPU_ROOT, "cpu" + str(cpu),
+                        "topology", "thread_siblings_list")
+    siblings = _readCpuList(path)
+    return (min(siblings) if siblings else cpu, cpu)
+  return sorted(cpus, key=coreKey)
+
+def numaNodes():
+  '''Returns dict of NUMA node ID -> list of CPUs we are permitted to run on.
+     On machines without NUMA information, everything is on node 0.'''
+  available = os.sched_getaffinity(0)
+  nodes = {}
+  try:
+    entries = os.listdir(SYSFS_NODE_ROOT)
+  except OSError:
+    entries = []
+  for entry in entries:
+    if not (entry.startswith("node") and entry[4:].isdigit()):
+      continue
+    cpus = _readCpuList(os.path.join(SYSFS_NODE_ROOT, entry, "cpulist"))
+    cpus = [cpu for cpu in (cpus or []) if cpu in available]
+    if cpus:
+      nodes[int(entry[4:])] = _siblingOrder(cpus)
+
+  if not nodes:
+    nodes = {0: _siblingOrder(available)}
+  return nodes
+
+def availableCpus():
+  return len(os.sched_getaffinity(0))
+
+def partitionCpus(jobs):
+  '''Returns list of length jobs, of disjoint CPU sets. Each set lies within a
+     single NUMA node. Workers are spread across nodes in proportion to the
+     number of CPUs on each node.'''
+  nodes = numaNodes()
+  total = sum(len(cpus) for cpus in nodes.values())
+  if jobs > total:
+    raise ValueError("cannot run {0} pinned jobs on {1} CPUs".format(jobs, total))
+
+  allocation = {node : 0 for node in nodes}
+  for _ in range(jobs):
+    # give next worker to the node with the most CPUs left per worker
+    candidates = [node for node in nodes
+                  if allocation[node] < len(nodes[node])]
+    node = max(candidates,
+               key=lambda n : (len(nodes[n]) / (allocation[n] + 1), -n))
+    allocation[node] += 1
+
+  cpu_sets = []
+  for node in sorted(nodes):
+    cpus = nodes[node]
+    n = allocation[node]
+    start = 0
+    for i in range(n):
+      # sizes differ by at most one
+      size = len(cpus) // n + (1 if i < len(cpus) % n else 0)
+      cpu_sets.append({"node": node, "cpus": cpus[start:start+size]})
+      start += size
+  return cpu_sets
+
+def colocationCpus(instances, pin):
+  '''Returns list of CPUs for each of instances runs sharing the machine.
+     "isolated": each has its own disjoint set (see partitionCpus).
+     "shared": all may run on any CPU, leaving it to the scheduler.'''
+  if pin == "isolated":
+    return [cpu_set["cpus"] for cpu_set in partitionCpus(instances)]
+  elif pin == "shared":
+    return [sorted(os.sched_getaffinity(0))] * instances
+  raise ValueError("unknown pinning " + repr(pin))
+
+### Worker pool
+
+# A unit of work in a graph (see PinnedPool.graph). Any argument which is a
+# Result is replaced by the result of the job with that key, so the job
+# depends on it and is not started until it has completed.
+Job = collections.namedtuple("Job", ["function", "args", "resource"],
+                             defaults=[None])
+Result = collections.namedtuple("Result", ["key"])
+
+def _dependencies(job):
+  return [arg.key for arg in job.args if isinstance(arg, Result)]
+
+def _runGraph(executor, capacity, jobs, limits):
+  if limits is None:
+    limits = {}
+  for (key, job) in jobs.items():
+    for dependency in _dependencies(job):
+      if dependency not in jobs:
+        raise ValueError("{0} depends on unknown job {1}"
+                         .format(key, dependency))
+
+  results = {}
+  waiting = list(jobs)
+  running = {}
+  in_use = collections.Counter()
+  while waiting or running:
+    # jobs are started in the order given, as their inputs become available
+    for key in list(waiting):
+      if len(running) >= capacity:
+        break
+      job = jobs[key]
+      if any(dependency not in results for dependency in _dependencies(job)):
+        continue
+      if in_use[job.resource] >= limits.get(job.resource, capacity):
+        continue
+      args = [results[arg.key] if isinstance(arg, Result) else arg
+              for arg in job.args]
+      running[executor.submit(job.function, *args)] = key
+      in_use[job.resource] += 1
+      waiting.remove(key)
+
+    if not running:
+      # nothing can start: a dependency cycle
+      raise ValueError("jobs {0} can never start".format(waiting))
+    done, _ = concurrent.futures.wait(running,
+                  return_when=concurrent.futures.FIRST_COMPLETED)
+    for future in done:
+      key = running.pop(future)
+      in_use[jobs[key].resource] -= 1
+      results[key] = future.result()
+      yield (key, results[key])
+
+def _pinWorker(cpu_set_queue):
+  cpu_set = cpu_set_queue.get()
+  # Child processes (the solvers) inherit the affinity mask. Pinning to CPUs
+  # on a single node also keeps first-touch memory allocations local to it.
+  os.sched_setaffinity(0, cpu_set["cpus"])
+
+class PinnedPool(object):
+  '''Pool of worker processes, each pinned to its own disjoint CPU set.
+
+     Workers are forked, so they inherit the harness' global state (e.g. the
+     resolved implementations). Work functions must be module-level.'''
+  def __init__(self, jobs):
+    self.jobs = jobs
+    self.cpu_sets = partitionCpus(jobs)
+    # fork: workers must see the state set up by __main__
+    context = multiprocessing.get_context("fork")
+    cpu_set_queue = context.Queue()
+    for cpu_set in self.cpu_sets:
+      cpu_set_queue.put(cpu_set)
+    self.executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, mp_context=context,
+        initializer=_pinWorker, initargs=(cpu_set_queue,))
+
+  def map(self, function, units, skip=None, known=None):
+    '''Runs function(*unit) for each unit, concurrently. Yields (unit, result)
+       in the order of units, regardless of completion order.
+
+       If skip is specified, it is called on each unit before it is yielded;
+       units for which it returns True are cancelled (if not yet started)
+       and are not yielded.
+       
+       If known is specified, it is called on each unit before submitting it.
+       If it returns a result other than None, the unit is not run, and that
+       result is yielded instead.'''
+    def submit(unit):
+      result = known(unit) if known else None
+      if result is None:
+        return self.executor.submit(function, *unit)
+      future = concurrent.futures.Future()
+      future.set_result(result)
+      return future
+    futures = [(unit, submit(unit)) for unit in units]
+    for (index, (unit, future)) in enumerate(futures):
+      if skip and skip(unit):
+        future.cancel()
+        continue
+      yield (unit, future.result())
+
+      if skip:
+        # result may have made later units redundant: don't waste CPU on them
+        for (later_unit, later_future) in futures[index+1:]:
+          if skip(later_unit):
+            later_future.cancel()
+
+  def graph(self, jobs, limits=None):
+    '''Runs a graph of jobs, concurrently. jobs is a dict of key -> Job; a
+       job is started as soon as the jobs whose Results it takes have
+       completed, earlier jobs in jobs taking priority. Yields (key, result)
+       in order of completion.
+
+       If limits is specified, it is a dict of resource -> maximum number of
+       jobs using that resource which may run at once.'''
+    return _runGraph(self.executor, self.jobs, jobs, limits)
+
+  def shutdown(self):
+    self.executor.shutdown(wait=True)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.shutdown()
+
+class _SerialExecutor(object):
+  '''Runs each function as soon as it is submitted, in this process'''
+  def submit(self, function, *args):
+    future = concurrent.futures.Future()
+    try:
+      future.set_result(function(*args))
+    except Exception as e:
+      future.set_exception(e)
+    return future
+
+class SerialPool(object):
+  '''Drop-in replacement for PinnedPool, running everything in this process.'''
+  jobs = 1
+
+  def map(self, function, units, skip=None, known=None):
+    for unit in units:
+      if skip and skip(unit):
+        continue
+      result = known(unit) if known else None
+      if result is None:
+        result = function(*unit)
+      yield (unit, result)
+
+  def graph(self, jobs, limits=None):
+    return _runGraph(_SerialExecutor(), self.jobs, jobs, limits)
+
+  def shutdown(self):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.shutdown()
+
+def createPool(jobs):
+  if jobs > 1:
+    return PinnedPool(jobs)
+  else:
+    return SerialPool()
@@ -0,0 +1,55 @@
+'''Relative timeouts: once one test has solved a file, there is no point
+letting the others run for many times longer just to confirm they are slow.
+
+A full test case opts in by specifying "race_factor". Each run of a test on
+a file is then bounded by race_factor times the best total time of any
+other test on that file so far. Runs exceeding this are killed, and
+recorded as Timeout, with the bound in the race_bound field.
+
+Completed runs are posted to a RaceBoard. This lives in the filesystem, so
+runs in other workers see a new best time while they are still going.'''
+
+import os, hashlib, urllib.parse, shutil, contextlib
+
+class RaceBoard(object):
+  def __init__(self, root, race_factor):
+    self.root = root
+    self.race_factor = race_factor
+
+  def _directory(self, fname):
+    digest = hashlib.sha1(fname.encode('utf-8')).hexdigest()
+    return os.path.join(self.root, digest)
+
+  def clear(self):
+    shutil.rmtree(self.root, ignore_errors=True)
+
+  def post(self, fname, test_name, iteration, time_elapsed):
+    '''Records that test_name solved fname in time_elapsed seconds.'''
+    directory = self._directory(fname)
+    os.makedirs(directory, exist_ok=True)
+    # one file per run: no locking needed
+    path = os.path.join(directory, "{0}.{1}".format(
+             urllib.parse.quote(test_name, safe=""), iteration))
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+      f.write(repr(float(time_elapsed)))
+    os.rename(temp_path, path)
+
+  def bound(self, fname, test_name):
+    '''Limit on the total time of test_name on fname, in seconds: None if no
+       other test has solved it yet.'''
+    quoted_name = urllib.parse.quote(test_name, safe="")
+    best = None
+    with contextlib.suppress(FileNotFoundError):
+      for entry in os.scandir(self._directory(fname)):
+        if entry.name.endswith(".tmp") or \
+           entry.name.rpartition(".")[0] == quoted_name:
+          continue
+        with contextlib.suppress(FileNotFoundError, ValueError):
+          with open(entry.path) as f:
+            time_elapsed = float(f.read())
+          if best is None or time_elapsed < best:
+            best = time_elapsed
+    if best is None:
+      return None
+    return self.race_factor * best
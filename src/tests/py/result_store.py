@@ -0,0 +1,127 @@
+'''Content-addressed store of results from previous runs.
+
+A run is identified by everything which could affect its outcome: the commit
+and compiler configuration the solver was built with (and for PGO builds,
+what the profile was trained on), its arguments, the content of the input
+file, test parameters such as the timeout, and the machine it runs on. Results are stored under a hash of these, one line per
+iteration, so a case which is re-run only executes iterations which are not
+already in the store.'''
+
+import os, json, hashlib, platform, functools, tempfile, fcntl
+
+HASH_BUFFER_SIZE = 1024 * 1024
+INPUT_HASHES_FNAME = "input_hashes.json"
+INPUT_HASHES_LOCK_FNAME = ".input_hashes.lock"
+
+def _readFirst(path, prefix):
+  try:
+    with open(path) as f:
+      for line in f:
+        if line.startswith(prefix):
+          return line.split(":", 1)[1].strip()
+  except OSError:
+    pass
+  return None
+
+@functools.lru_cache(maxsize=None)
+def machineFingerprint():
+  '''Identifies the hardware and OS. Deliberately excludes the hostname, so
+     identically configured machines share results.'''
+  fingerprint = {
+    "cpu": _readFirst("/proc/cpuinfo", "model name"),
+    "cpus": os.cpu_count(),
+    "memory": _readFirst("/proc/meminfo", "MemTotal"),
+    "kernel": platform.release(),
+  }
+  return fingerprint
+
+def _atomicWrite(path, data):
+  directory = os.path.dirname(path)
+  fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp")
+  with os.fdopen(fd, 'w') as f:
+    f.write(data)
+  os.replace(temp_path, path)
+
+class ResultStore(object):
+  '''If use_stored is False, lookups always miss: everything is run again,
+     but results are still recorded.'''
+  def __init__(self, root, use_stored=True):
+    self.root = root
+    self.use_stored = use_stored
+    os.makedirs(root, exist_ok=True)
+
+  def _inputHashesPath(self):
+    return os.path.join(self.root, INPUT_HASHES_FNAME)
+
+  def _readInputHashes(self):
+    try:
+      with open(self._inputHashesPath()) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def inputHash(self, path):
+    '''SHA-256 of the file contents. Hashing multi-GB inputs is slow, so
+       hashes are remembered until the file's size or mtime changes.'''
+    stat = os.stat(path)
+    # N.B. realpath, so that different relative paths share an entry
+    entry_key = os.path.realpath(path)
+    signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+    # always replaced whole (see _atomicWrite): safe to read without the lock
+    entry = self._readInputHashes().get(entry_key)
+    if entry and entry["signature"] == signature:
+      return entry["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+      for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+        digest.update(chunk)
+    # re-read under the lock, so entries added by other workers meanwhile
+    # aren't lost
+    lock_path = os.path.join(self.root, INPUT_HASHES_LOCK_FNAME)
+    with open(lock_path, 'w') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      hashes = self._readInputHashes()
+      hashes[entry_key] = {"signature": signature,
+                           "sha256": digest.hexdigest()}
+      _atomicWrite(self._inputHashesPath(), json.dumps(hashes))
+    return digest.hexdigest()
+
+  def runKey(self, description, input_path, parameters):
+    '''description: identifies the solver (see benchmark.helperCreateTestInstance)
+       parameters: dict of test parameters affecting the result'''
+    key = {"solver": description,
+           "input": self.inputHash(input_path),
+           "parameters": parameters,
+           "machine": machineFingerprint()}
+    canonical = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+  def _path(self, key):
+    # fan out so no directory gets too large
+    return os.path.join(self.root, key[:2], key + ".jsonl")
+
+  def lookup(self, key, iteration):
+    '''Returns stored times for iteration, or None if not in the store.'''
+    if not self.use_stored:
+      return None
+    try:
+      with open(self._path(key)) as f:
+        records = [json.loads(line) for line in f if line.endswith("\n")]
+    except OSError:
+      return None
+    for record in reversed(records):
+      if record["iteration"] == iteration:
+        return [tuple(times) for times in record["times"]]
+    return None
+
+  def record(self, key, iteration, times):
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps({"iteration": iteration, "times": times}) + "\n"
+    # single O_APPEND write, so concurrent workers' records don't interleave
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+      os.write(fd, line.encode('utf-8'))
+    finally:
+      os.close(fd)
@@ -0,0 +1,737 @@
+'''Runs solver pipelines under asyncio.
+
+Each run is a Pipeline of processes (e.g. cat | snapshots | snapshot_solver),
+connected with pipes. The stderr of the final stage is streamed line by line,
+and statistics written to a FIFO are read without blocking. Timeouts are
+enforced by the event loop, not by SIGALRM, so many runs can be driven
+concurrently from one loop. Synchronous code can use iterate() to consume
+any of the async generators here.
+
+Processes are reaped with os.wait4, so the resource usage of each run is
+available (see RUSAGE_FIELDS).'''
+
+import asyncio, csv, io, itertools, os, signal, subprocess, time
+
+BUFFER_SIZE = 64 * 1024
+
+STARTTIME_LINE = "STARTTIME\n"
+ALGOTIME_PREFIX = "ALGOTIME: "
+
+# When the solver exits, how long to wait for a statistics batch in flight
+FIFO_GRACE_PERIOD = 1 # seconds
+# How often to check whether a run has exceeded a bound which may change
+BOUND_POLL_INTERVAL = 0.5 # seconds
+# How often the simulation watchdog checks for progress
+WATCHDOG_POLL_INTERVAL = 1 # seconds
+
+# Resource usage of a process, as reported by wait4. Fields of struct rusage
+# the kernel doesn't maintain (e.g. ru_ixrss) are omitted.
+RUSAGE_FIELDS = ["max_rss_kb", "utime", "stime", "minflt", "majflt",
+                 "nvcsw", "nivcsw"]
+
+def rusageDict(rusage):
+  return {"max_rss_kb": rusage.ru_maxrss, # kilobytes on Linux
+          "utime": rusage.ru_utime,
+          "stime": rusage.ru_stime,
+          "minflt": rusage.ru_minflt,
+          "majflt": rusage.ru_majflt,
+          "nvcsw": rusage.ru_nvcsw,
+          "nivcsw": rusage.ru_nivcsw}
+
+# Memory of a running solver, sampled from /proc at the end of each delta
+MEMORY_FIELDS = ["rss_kb", "anon_kb"]
+
+def _processTree(pid):
+  '''pid and all its descendants, e.g. solver children of snapshot_solver'''
+  pids = [pid]
+  for p in pids:
+    try:
+      for task in os.listdir("/proc/{0}/task".format(p)):
+        with open("/proc/{0}/task/{1}/children".format(p, task)) as f:
+          pids += map(int, f.read().split())
+    except OSError:
+      # process has exited
+      pass
+  return pids
+
+def _readKb(path, keys):
+  '''parses lines of the form "Key:   1234 kB" in /proc files'''
+  values = {}
+  with open(path) as f:
+    for line in f:
+      key, _, value = line.partition(":")
+      if key in keys:
+        values[key] = int(value.split()[0])
+  return values
+
+def memorySample(pipeline):
+  '''Resident and anonymous memory (kB) of the solver and its children.
+     Anonymous memory is heap and stack, excluding the binary and libraries:
+     growth in this across deltas indicates leaks or allocator bloat.'''
+  sample = {"rss_kb": 0, "anon_kb": 0}
+  for pid in _processTree(pipeline.processes[-1].pid):
+    try:
+      status = _readKb("/proc/{0}/status".format(pid), ["VmRSS", "RssAnon"])
+      if "VmRSS" not in status:
+        # zombie: memory already released
+        continue
+      try:
+        rollup = _readKb("/proc/{0}/smaps_rollup".format(pid), ["Anonymous"])
+        anon = rollup["Anonymous"]
+      except (OSError, KeyError):
+        # smaps_rollup needs Linux 4.14
+        anon = status.get("RssAnon", 0)
+      sample["rss_kb"] += status["VmRSS"]
+      sample["anon_kb"] += anon
+    except OSError:
+      # exited between listing and reading
+      pass
+  return sample
+
+class Process(object):
+  '''Child process, reaped by us with wait4 rather than by asyncio's child
+     watcher (which uses waitpid, discarding the resource usage).'''
+  def __init__(self, popen, stderr):
+    self.popen = popen
+    self.pid = popen.pid
+    self.stderr = stderr
+    self.returncode = None
+    self.rusage = None
+    self._exited = None
+
+  @classmethod
+  async def create(cls, argv, stdin, stdout, stderr, cpus=None):
+    loop = asyncio.get_running_loop()
+    pipe_stderr = stderr == subprocess.PIPE
+    pin = None
+    if cpus:
+      # set before exec, so threads the process starts are pinned too
+      pin = lambda : os.sched_setaffinity(0, cpus)
+    popen = subprocess.Popen(argv, stdin=stdin, stdout=stdout, stderr=stderr,
+                             preexec_fn=pin)
+    reader = None
+    if pipe_stderr:
+      reader = asyncio.StreamReader(limit=BUFFER_SIZE, loop=loop)
+      protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+      await loop.connect_read_pipe(lambda: protocol, popen.stderr)
+    process = cls(popen, reader)
+    process._exited = loop.create_task(process._reap())
+    return process
+
+  def _wait4(self):
+    _pid, status, rusage = os.wait4(self.pid, 0)
+    self.returncode = os.waitstatus_to_exitcode(status)
+    self.rusage = rusageDict(rusage)
+    # stop subprocess trying to reap it again
+    self.popen.returncode = self.returncode
+
+  async def _reap(self):
+    loop = asyncio.get_running_loop()
+    if not hasattr(os, "pidfd_open"):
+      # no pidfd support: block in a worker thread instead
+      await loop.run_in_executor(None, self._wait4)
+      return
+
+    pidfd = os.pidfd_open(self.pid)
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+      await exited
+    finally:
+      loop.remove_reader(pidfd)
+      os.close(pidfd)
+    self._wait4()
+
+  async def wait(self):
+    await asyncio.shield(self._exited)
+    return self.returncode
+
+  def terminate(self):
+    # only signal while unreaped: afterwards, the PID could have been reused
+    if self.returncode is None:
+      try:
+        os.kill(self.pid, signal.SIGTERM)
+      except ProcessLookupError:
+        pass
+
+  def kill(self):
+    '''SIGKILL to the process and any descendants, which would otherwise be
+       orphaned (e.g. a solver started by a simulator).'''
+    if self.returncode is None:
+      # descendants first, so none are started after the scan
+      for pid in reversed(_processTree(self.pid)):
+        try:
+          os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+          pass
+
+class Pipeline(object):
+  '''Processes with stdout of each stage feeding into stdin of the next.
+     stdin of the first stage is read from file descriptor stdin_fd if
+     specified: the pipeline takes ownership of it, closing it once passed
+     on. If stdin_pipe is True instead, it is a pipe, written to with
+     write().
+     Output of the final stage is written to out_path. Its stderr is written
+     to err_path if specified, otherwise it is available via readline().
+     If cpus is specified, every stage is pinned to that list of CPUs.'''
+  def __init__(self, stages, out_path, err_path=None, stdin_fd=None,
+               stdin_pipe=False, cpus=None):
+    assert(stages)
+    assert(not (stdin_fd is not None and stdin_pipe))
+    self.stages = stages
+    self.out_path = out_path
+    self.err_path = err_path
+    self.stdin_fd = stdin_fd
+    self.stdin_pipe = stdin_pipe
+    self.cpus = cpus
+    self.stdin = None
+    self.processes = []
+    # True if we stopped it (e.g. on a timeout) rather than it exiting by
+    # itself: its exit code is then no indication of failure
+    self.killed = False
+
+  async def start(self):
+    out_file = open(self.out_path, 'wb')
+    err_file = open(self.err_path, 'wb') if self.err_path else None
+    try:
+      stdin = subprocess.DEVNULL
+      if self.stdin_fd is not None:
+        stdin = self.stdin_fd
+        self.stdin_fd = None
+      elif self.stdin_pipe:
+        stdin, write_fd = os.pipe()
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.connect_write_pipe(
+                                asyncio.streams.FlowControlMixin,
+                                os.fdopen(write_fd, 'wb', buffering=0))
+        self.stdin = asyncio.StreamWriter(transport, protocol, None, loop)
+      for index, argv in enumerate(self.stages):
+        last = index == len(self.stages) - 1
+        if last:
+          stdout = out_file
+          stderr = err_file or subprocess.PIPE
+        else:
+          read_fd, stdout = os.pipe()
+          stderr = subprocess.DEVNULL
+        process = await Process.create(argv, stdin, stdout, stderr, self.cpus)
+        self.processes.append(process)
+
+        # the children have their own copies now
+        if stdin != subprocess.DEVNULL:
+          os.close(stdin)
+        if not last:
+          os.close(stdout)
+          stdin = read_fd
+    finally:
+      out_file.close()
+      if err_file:
+        err_file.close()
+
+  async def write(self, data):
+    '''Writes data to stdin of the first stage. Returns once the pipe has
+       accepted it. Raises BrokenPipeError (or ConnectionResetError) if the
+       pipeline has exited.'''
+    self.stdin.write(data)
+    await self.stdin.drain()
+
+  def closeStdin(self):
+    if self.stdin and not self.stdin.is_closing():
+      self.stdin.close()
+
+  async def readline(self):
+    '''Returns next line of stderr from the final stage, '' on EOF.'''
+    line = await self.processes[-1].stderr.readline()
+    return line.decode('utf-8')
+
+  async def wait(self):
+    for process in self.processes:
+      await process.wait()
+    return self.exit_code
+
+  def terminate(self):
+    '''Stops any stages still running. Once every stage has exited by
+       itself, this is just cleanup: the pipeline does not count as killed.'''
+    if self.processes and self.exit_code is None:
+      self.killed = True
+    self.closeStdin()
+    for process in self.processes:
+      process.terminate()
+
+  def kill(self):
+    '''As terminate, but also kills processes the stages started'''
+    if self.processes and self.exit_code is None:
+      self.killed = True
+    self.closeStdin()
+    for process in self.processes:
+      process.kill()
+
+  @property
+  def rusage(self):
+    '''resource usage of the final stage (the solver), including any
+       children it waited for (e.g. solvers launched by snapshot_solver)'''
+    return self.processes[-1].rusage
+
+  @property
+  def exit_code(self):
+    '''first non-zero exit code of any stage; None if still running'''
+    codes = [process.returncode for process in self.processes]
+    if None in codes:
+      return None
+    for code in codes:
+      if code != 0:
+        return code
+    return 0
+
+def _remaining(loop, *deadlines):
+  deadlines = [d for d in deadlines if d is not None]
+  return max(0, min(deadlines) - loop.time())
+
+async def algorithmTimes(pipeline, err_file, delta_timeout, run_timeout=None,
+                         sampler=None, run_bound=None):
+  '''Starts pipeline, yielding (algorithm time, total time, samples) for each
+     ALGOTIME reported by the solver. Other stderr output is copied to err_file.
+     samples is the dict returned by sampler(pipeline) when the ALGOTIME line
+     was received, or empty if no sampler is specified.
+
+     If no ALGOTIME arrives within delta_timeout seconds, or the run as a whole
+     exceeds run_timeout seconds, the pipeline is killed and
+     ("Timeout", "Timeout", {}) is yielded.
+     
+     run_bound: returns a limit on the total time, in seconds, or None. It
+     may change as the solver runs (see racing), so is polled every
+     BOUND_POLL_INTERVAL. If exceeded, the pipeline is killed and
+     ("Timeout", "Timeout", {"race_bound": limit}) is yielded.'''
+  loop = asyncio.get_running_loop()
+  run_deadline = loop.time() + run_timeout if run_timeout else None
+
+  await pipeline.start()
+  next_line = None
+  try:
+    start_time = time.time()
+    start_loop_time = loop.time()
+    delta_deadline = loop.time() + delta_timeout
+    while True:
+      if not next_line:
+        next_line = asyncio.ensure_future(pipeline.readline())
+      bound = run_bound() if run_bound else None
+      bound_deadline = start_loop_time + bound if bound is not None else None
+      remaining = _remaining(loop, delta_deadline, run_deadline, bound_deadline)
+      if run_bound:
+        remaining = min(remaining, BOUND_POLL_INTERVAL)
+      # N.B. not wait_for: line must not be lost if we just poll run_bound
+      done, _ = await asyncio.wait([next_line], timeout=remaining)
+      if not done:
+        if _remaining(loop, delta_deadline, run_deadline, bound_deadline) > 0:
+          continue
+        pipeline.terminate()
+        await pipeline.wait()
+        if bound_deadline is not None and loop.time() >= bound_deadline:
+          yield ("Timeout", "Timeout", {"race_bound": bound})
+        else:
+          yield ("Timeout", "Timeout", {})
+        return
+      line = next_line.result()
+      next_line = None
+
+      if not line:
+        # EOF: solver has finished
+        break
+      elif line == STARTTIME_LINE:
+        # Reset timer. We will not always receive STARTTIME, only when there
+        # is some overhead we want to discount. For example, snapshot_solver
+        # outputs STARTTIME immediately before launching the solver. This way,
+        # we can discount the time taken to generate the snapshots themselves.
+        start_time = time.time()
+        start_loop_time = loop.time()
+      elif line.startswith(ALGOTIME_PREFIX):
+        algorithm_running_time = line[len(ALGOTIME_PREFIX):].strip()
+        # total time includes parsing, etc.
+        time_elapsed = time.time() - start_time
+        samples = sampler(pipeline) if sampler else {}
+
+        yield (algorithm_running_time, time_elapsed, samples)
+
+        # reset timer and timeout
+        start_time = time.time()
+        start_loop_time = loop.time()
+        delta_deadline = loop.time() + delta_timeout
+      else:
+        err_file.write(line)
+
+    await pipeline.wait()
+  finally:
+    if next_line and not next_line.done():
+      next_line.cancel()
+      await asyncio.gather(next_line, return_exceptions=True)
+    # also reached if consumer stops iterating early
+    pipeline.terminate()
+    await pipeline.wait()
+
+class StatisticsFifo(object):
+  '''Reads CSV statistics from a FIFO. The writer opens the FIFO, writes one
+     batch of rows, and closes it; read() returns the rows of the next batch.'''
+  def __init__(self, fifo_path):
+    self.fifo_path = fifo_path
+    # Non-blocking, so open succeeds without a writer. Linux does not report
+    # the FIFO as readable until a writer has connected.
+    self.fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+
+  async def _readUntilEof(self):
+    loop = asyncio.get_running_loop()
+    chunks = []
+    done = loop.create_future()
+    def readable():
+      try:
+        while True:
+          chunk = os.read(self.fd, BUFFER_SIZE)
+          if not chunk:
+            loop.remove_reader(self.fd)
+            if not done.done():
+              done.set_result(b"".join(chunks))
+            return
+          chunks.append(chunk)
+      except BlockingIOError:
+        # drained for now; wait for more
+        pass
+    loop.add_reader(self.fd, readable)
+    try:
+      return await done
+    finally:
+      loop.remove_reader(self.fd)
+
+  async def read(self):
+    data = await self._readUntilEof()
+    # Reopen before closing the old descriptor: there is then always a reader,
+    # so a writer starting the next batch never gets EPIPE.
+    fd = os.open(self.fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+    os.close(self.fd)
+    self.fd = fd
+    return list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+
+  def close(self):
+    os.close(self.fd)
+
+class StatisticsStream(object):
+  '''Reads CSV statistics from a FIFO which one writer keeps open for the
+     whole run, writing a row at a time. read() returns the rows received
+     since the last call, waiting for at least one, or None once the writer
+     has closed the FIFO.'''
+  def __init__(self, fifo_path):
+    # Non-blocking, as for StatisticsFifo: readable only once a writer has
+    # connected, so an empty read is EOF.
+    self.fd = os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK)
+    self.buffer = b""
+    self.fieldnames = None
+    self.eof = False
+
+  def _readAvailable(self):
+    try:
+      while True:
+        chunk = os.read(self.fd, BUFFER_SIZE)
+        if not chunk:
+          self.eof = True
+          return
+        self.buffer += chunk
+    except BlockingIOError:
+      pass
+
+  def _completeRows(self):
+    end = len(self.buffer) if self.eof else self.buffer.rfind(b"\n") + 1
+    lines = self.buffer[:end].decode('utf-8').splitlines()
+    self.buffer = self.buffer[end:]
+    rows = []
+    for fields in csv.reader(lines):
+      if self.fieldnames is None:
+        self.fieldnames = fields
+      else:
+        rows.append(dict(zip(self.fieldnames, fields)))
+    return rows
+
+  async def read(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      rows = self._completeRows()
+      if rows:
+        return rows
+      elif self.eof:
+        return None
+      readable = loop.create_future()
+      loop.add_reader(self.fd,
+                      lambda: readable.done() or readable.set_result(None))
+      try:
+        await readable
+      finally:
+        loop.remove_reader(self.fd)
+      self._readAvailable()
+
+  def close(self):
+    os.close(self.fd)
+
+async def statistics(pipeline, fifo_path, delta_timeout, run_timeout=None):
+  '''Starts pipeline, yielding list of CSV rows for each batch of statistics
+     the solver writes to fifo_path. Timeouts as for algorithmTimes, but
+     "Timeout" is yielded.'''
+  loop = asyncio.get_running_loop()
+  run_deadline = loop.time() + run_timeout if run_timeout else None
+
+  fifo = StatisticsFifo(fifo_path)
+  await pipeline.start()
+  exited = asyncio.ensure_future(pipeline.wait())
+  next_batch = None
+  try:
+    delta_deadline = loop.time() + delta_timeout
+    while True:
+      next_batch = asyncio.ensure_future(fifo.read())
+      remaining = _remaining(loop, delta_deadline, run_deadline)
+      done, _ = await asyncio.wait([next_batch, exited], timeout=remaining,
+                                   return_when=asyncio.FIRST_COMPLETED)
+      if next_batch in done:
+        yield next_batch.result()
+        delta_deadline = loop.time() + delta_timeout
+      elif exited in done:
+        # process has terminated: pick up any batch still being written
+        try:
+          rows = await asyncio.wait_for(next_batch, FIFO_GRACE_PERIOD)
+          yield rows
+        except asyncio.TimeoutError:
+          pass
+        return
+      else:
+        pipeline.terminate()
+        await exited
+        yield "Timeout"
+        return
+  finally:
+    if next_batch and not next_batch.done():
+      next_batch.cancel()
+      await asyncio.gather(next_batch, return_exceptions=True)
+    fifo.close()
+    pipeline.terminate()
+    await exited
+
+async def simulation(pipeline, fifo_path, err_file, stall_timeout,
+                     progress_path=None):
+  '''Starts pipeline, a cluster simulator, yielding the list of rows of
+     statistics received each time some arrive on fifo_path, if specified.
+     Its stderr is copied to err_file. The FIFO, stderr and exit of the
+     simulator are waited on together, so none can block the others.
+
+     If the simulator makes no progress for stall_timeout seconds -- no
+     statistics, no stderr output and no growth of the file at progress_path
+     -- it is killed, along with any processes it started, and "Timeout" is
+     yielded. Otherwise returns once it has exited and its output is read,
+     with pipeline.exit_code set.'''
+  loop = asyncio.get_running_loop()
+  fifo = StatisticsStream(fifo_path) if fifo_path else None
+  await pipeline.start()
+  exited = asyncio.ensure_future(pipeline.wait())
+  next_line = asyncio.ensure_future(pipeline.readline())
+  next_rows = asyncio.ensure_future(fifo.read()) if fifo else None
+  last_progress = loop.time()
+  progress_size = None
+  exit_time = None
+  try:
+    while not (exited.done() and next_line is None and next_rows is None):
+      streams = [f for f in [next_line, next_rows] if f is not None]
+      if not any(f.done() for f in streams):
+        waiting = streams if exited.done() else streams + [exited]
+        await asyncio.wait(waiting, timeout=WATCHDOG_POLL_INTERVAL,
+                           return_when=asyncio.FIRST_COMPLETED)
+      if next_rows and next_rows.done():
+        rows = next_rows.result()
+        next_rows = None
+        if rows is not None:
+          last_progress = loop.time()
+          next_rows = asyncio.ensure_future(fifo.read())
+          yield rows
+      if next_line and next_line.done():
+        line = next_line.result()
+        next_line = None
+        if line:
+          last_progress = loop.time()
+          err_file.write(line)
+          next_line = asyncio.ensure_future(pipeline.readline())
+
+      if exited.done():
+        # Output in flight is picked up, but not waited on for ever:
+        # descendants may hold stderr open.
+        exit_time = exit_time or loop.time()
+        if loop.time() - exit_time > FIFO_GRACE_PERIOD:
+          break
+        continue
+      if progress_path:
+        try:
+          size = os.path.getsize(progress_path)
+        except OSError:
+          size = None
+        if size != progress_size:
+          progress_size = size
+          last_progress = loop.time()
+      if loop.time() - last_progress > stall_timeout:
+        pipeline.kill()
+        await exited
+        yield "Timeout"
+        return
+    await exited
+  finally:
+    for future in [next_line, next_rows]:
+      if future and not future.done():
+        future.cancel()
+        await asyncio.gather(future, return_exceptions=True)
+    if fifo:
+      fifo.close()
+    # also reached if consumer stops iterating early
+    pipeline.kill()
+    await exited
+
+async def replay(pipeline, deltas, arrivals, err_file, delta_timeout):
+  '''Starts pipeline, and feeds it deltas open loop: each is written at its
+     arrival time, whether or not the solver has finished the previous one.
+
+     deltas: iterator of bytes, the initial graph followed by each delta. It
+     may block (e.g. reading from disk): it is read ahead, off the loop.
+     arrivals: iterator of the arrival time of each delta after the initial
+     graph, in seconds after the solver finished solving the initial graph
+     (which arrives at once).
+
+     The solver reports ALGOTIME as it finishes each delta. It solves deltas
+     in order, so delta k starts once it has arrived and delta k-1 is done.
+     Yields (algorithm time, arrival, queueing delay, response time) for each
+     delta: arrival is relative to the start of the pipeline; queueing delay
+     is from arrival to start, and response time from arrival to finish.
+     Other stderr output is copied to err_file.
+
+     If the solver spends more than delta_timeout seconds on one delta, it is
+     killed and ("Timeout", arrival, "Timeout", "Timeout") is yielded.'''
+  loop = asyncio.get_running_loop()
+  await pipeline.start()
+  origin = loop.time()
+  deltas = iter(deltas)
+  # loop time at which each delta written so far arrived
+  arrived = []
+  # loop time at which solver finished the initial graph
+  ready = loop.create_future()
+
+  async def feed():
+    try:
+      next_delta = loop.run_in_executor(None, next, deltas, None)
+      delta = await next_delta
+      for arrival in itertools.chain([None], arrivals):
+        if delta is None:
+          break
+        if arrival is not None:
+          ready_time = await ready
+          await asyncio.sleep(max(0, ready_time + arrival - loop.time()))
+        # Nominal arrival time, even if we are late writing the delta (e.g.
+        # the pipe is full): that is part of the delay the solver causes.
+        arrived.append(origin if arrival is None else ready_time + arrival)
+        # read next delta while this one is written, and until it arrives
+        next_delta = loop.run_in_executor(None, next, deltas, None)
+        await pipeline.write(delta)
+        delta = await next_delta
+    except (BrokenPipeError, ConnectionResetError):
+      # solver has exited: reported by the reader
+      pass
+    finally:
+      pipeline.closeStdin()
+
+  feeder = asyncio.ensure_future(feed())
+  next_line = None
+  try:
+    # time the solver finished the previous delta
+    previous_finish = origin
+    index = 0
+    while True:
+      if not next_line:
+        next_line = asyncio.ensure_future(pipeline.readline())
+      if index < len(arrived):
+        start_time = max(arrived[index], previous_finish)
+        remaining = _remaining(loop, start_time + delta_timeout)
+      else:
+        # solver is idle until the delta arrives
+        remaining = BOUND_POLL_INTERVAL
+      done, _ = await asyncio.wait([next_line], timeout=remaining)
+      if not done:
+        if index >= len(arrived) or \
+           _remaining(loop, start_time + delta_timeout) > 0:
+          continue
+        pipeline.terminate()
+        await pipeline.wait()
+        yield ("Timeout", arrived[index] - origin, "Timeout", "Timeout")
+        return
+      line = next_line.result()
+      next_line = None
+
+      if not line:
+        # EOF: solver has finished
+        break
+      elif line.startswith(ALGOTIME_PREFIX):
+        algorithm_running_time = line[len(ALGOTIME_PREFIX):].strip()
+        finish_time = loop.time()
+        arrival = arrived[index]
+        start_time = max(arrival, previous_finish)
+        if not ready.done():
+          ready.set_result(finish_time)
+
+        yield (algorithm_running_time, arrival - origin,
+               start_time - arrival, finish_time - arrival)
+
+        previous_finish = finish_time
+        index += 1
+      elif line != STARTTIME_LINE:
+        err_file.write(line)
+
+    await pipeline.wait()
+    # raises if reading the deltas failed
+    await feeder
+  finally:
+    for task in [next_line, feeder]:
+      if task and not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    pipeline.terminate()
+    await pipeline.wait()
+
+async def _collectAll(async_iterables):
+  async def collect(async_iterable):
+    return [item async for item in async_iterable]
+  return await asyncio.gather(*[collect(a) for a in async_iterables])
+
+# Event loop of this process (see eventLoop), and the process it belongs to:
+# a worker forked from us must not drive our loop.
+_loop = None
+_loop_pid = None
+
+def eventLoop():
+  '''The event loop all runs of this process are driven by. Created on first
+     use, and kept for the life of the process: runs started from anywhere
+     in the harness share it, rather than each setting up its own.'''
+  global _loop, _loop_pid
+  if _loop is None or _loop_pid != os.getpid():
+    _loop = asyncio.new_event_loop()
+    _loop_pid = os.getpid()
+  return _loop
+
+def concurrently(async_iterables):
+  '''Consumes async_iterables concurrently from synchronous code, on the
+     event loop of this process. Returns list of the items yielded by each.'''
+  return eventLoop().run_until_complete(_collectAll(async_iterables))
+
+def iterate(async_iterable):
+  '''Consumes async_iterable from synchronous code, on the event loop of
+     this process.'''
+  loop = eventLoop()
+  iterator = async_iterable.__aiter__()
+  try:
+    while True:
+      try:
+        item = loop.run_until_complete(iterator.__anext__())
+      except StopAsyncIteration:
+        return
+      yield item
+  finally:
+    if loop.is_running():
+      # abandoned, and collected while another run is being driven
+      loop.create_task(iterator.aclose())
+    else:
+      loop.run_until_complete(iterator.aclose())
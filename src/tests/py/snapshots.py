@@ -0,0 +1,193 @@
+'''Snapshots of incremental inputs, written out once so that a full solver can
+solve them independently of one another.
+
+incremental_snapshots turns an incremental input (a full graph followed by
+deltas) into a stream of full graphs, separated by "c EOI" lines. The
+stream is split into one file per snapshot. Empty snapshots are dropped, as
+in snapshot_solver, so the n'th file corresponds to delta n of a run of
+the wrapped full solver.
+
+When the total size of the snapshots exceeds the quota, those of the least
+recently used inputs are removed, as are those of inputs which have since
+changed. Snapshots in use are pinned with a shared lock, and never removed.'''
+
+import os, shutil, hashlib, subprocess, fcntl, contextlib
+
+END_OF_ITERATION = b"c EOI\n"
+COMPLETE_FNAME = "complete"
+# path of the input the snapshots were made from
+SOURCE_FNAME = "source"
+LOCK_FNAME = ".lock"
+LOCK_SUFFIX = ".lock"
+
+class SnapshotCache(object):
+  def __init__(self, root, creator, input_stages=lambda path : [],
+               quota=None):
+    '''creator: argv of incremental_snapshots
+       input_stages: returns list of argv of commands to pipe path through
+       before creator, e.g. to decompress it
+       quota: maximum total size of snapshots, in bytes (None: unlimited)'''
+    self.root = root
+    self.creator = creator
+    self.input_stages = input_stages
+    self.quota = quota
+
+  @contextlib.contextmanager
+  def _locked(self):
+    os.makedirs(self.root, exist_ok=True)
+    with open(os.path.join(self.root, LOCK_FNAME), 'w') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      yield
+
+  def _openLock(self, directory, operation):
+    '''Opens the lock file of directory, and locks it. Returns None if
+       operation is non-blocking and it is held by someone else.'''
+    while True:
+      lock_file = open(directory + LOCK_SUFFIX, 'a')
+      try:
+        fcntl.flock(lock_file, operation)
+      except BlockingIOError:
+        lock_file.close()
+        return None
+      # removed by collect while we waited: lock the new one
+      try:
+        linked = os.stat(lock_file.name).st_ino
+        if linked == os.fstat(lock_file.fileno()).st_ino:
+          return lock_file
+      except FileNotFoundError:
+        pass
+      lock_file.close()
+
+  def _directory(self, path):
+    # new version of input gets a new directory: no need to check contents
+    stat = os.stat(path)
+    signature = "{0}:{1}:{2}".format(os.path.realpath(path),
+                                     stat.st_size, stat.st_mtime_ns)
+    digest = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+    return os.path.join(self.root, digest + "-" + os.path.basename(path))
+
+  def _listing(self, directory):
+    with open(os.path.join(directory, COMPLETE_FNAME)) as f:
+      fnames = f.read().split()
+    return [os.path.join(directory, fname) for fname in fnames]
+
+  def materialise(self, path):
+    '''Returns list of paths of snapshot files of incremental input path,
+       creating them if they don't exist already.'''
+    directory = self._directory(path)
+    try:
+      return self._listing(directory)
+    except OSError:
+      pass
+
+    os.makedirs(self.root, exist_ok=True)
+    with self._openLock(directory, fcntl.LOCK_EX):
+      # another harness may have written them while we waited for the lock
+      try:
+        return self._listing(directory)
+      except OSError:
+        pass
+
+      shutil.rmtree(directory, ignore_errors=True)
+      os.makedirs(directory)
+      fnames = []
+      with open(path, 'rb') as input_file:
+        stages = []
+        stdin = input_file
+        for argv in self.input_stages(path):
+          stages.append(subprocess.Popen(argv, stdin=stdin,
+                                         stdout=subprocess.PIPE))
+          stdin = stages[-1].stdout
+        creator = subprocess.Popen(self.creator, stdin=stdin,
+                                   stdout=subprocess.PIPE)
+        for stage in stages:
+          # creator has its own copy
+          stage.stdout.close()
+        snapshot = None
+        for line in creator.stdout:
+          if line == END_OF_ITERATION:
+            if snapshot:
+              snapshot.close()
+              snapshot = None
+            continue
+          if not snapshot:
+            fname = "{0:06d}.min".format(len(fnames))
+            fnames.append(fname)
+            snapshot = open(os.path.join(directory, fname), 'wb')
+          snapshot.write(line)
+        if snapshot:
+          snapshot.close()
+        for process in stages + [creator]:
+          if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode,
+                                                process.args)
+
+      with open(os.path.join(directory, SOURCE_FNAME), 'w') as f:
+        f.write(os.path.realpath(path))
+      # written last: directory is only used once every snapshot is there
+      with open(os.path.join(directory, COMPLETE_FNAME), 'w') as f:
+        f.write("\n".join(fnames))
+      return self._listing(directory)
+
+  @contextlib.contextmanager
+  def pin(self, path):
+    '''Context manager: materialises the snapshots of path, and returns
+       their paths. They are not removed by collect until exit.'''
+    directory = self._directory(path)
+    while True:
+      snapshot_paths = self.materialise(path)
+      with self._locked():
+        # collect may have removed them since
+        if os.path.exists(os.path.join(directory, COMPLETE_FNAME)):
+          lock_file = self._openLock(directory, fcntl.LOCK_SH)
+          # mtime records when they were last used
+          os.utime(directory)
+          break
+    try:
+      yield snapshot_paths
+    finally:
+      lock_file.close()
+
+  def _superseded(self, directory):
+    '''True if the input directory was made from has changed or gone'''
+    try:
+      with open(os.path.join(directory, SOURCE_FNAME)) as f:
+        source = f.read()
+      return self._directory(source) != directory
+    except OSError:
+      return True
+
+  def _remove(self, directory):
+    '''Removes directory, unless it is pinned or being written. Returns True
+       if it was removed.'''
+    lock_file = self._openLock(directory, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    if lock_file is None:
+      return False
+    with lock_file:
+      shutil.rmtree(directory, ignore_errors=True)
+      os.unlink(directory + LOCK_SUFFIX)
+    return True
+
+  def collect(self):
+    '''Removes snapshots of inputs which have changed since, then those of
+       the least recently used inputs until the total size is within quota.
+       Pinned snapshots are skipped, so the total may still exceed it.'''
+    with self._locked():
+      entries = []
+      for entry in os.scandir(self.root):
+        if not entry.is_dir():
+          continue
+        if self._superseded(entry.path):
+          self._remove(entry.path)
+          continue
+        size = sum(f.stat().st_size for f in os.scandir(entry.path))
+        entries.append((entry.stat().st_mtime, size, entry.path))
+      if self.quota is None:
+        return
+      entries.sort()
+      used = sum(size for (_, size, _) in entries)
+      for (_, size, directory) in entries:
+        if used <= self.quota:
+          break
+        if self._remove(directory):
+          used -= size
@@ -0,0 +1,85 @@
+'''Staging of input files in memory, so each is read from disk once per
+campaign rather than once per run.
+
+Inputs are copied to a tmpfs directory (e.g. /dev/shm), and solvers are given
+the staged file, already open, as stdin. Staged files are shared between workers and with
+later invocations of the harness: all state lives in the filesystem. When
+the total size exceeds the budget, the least recently used files are evicted.
+Evicting a file which is still being read is safe: the reader keeps its
+contents alive until it closes it, although until then the memory is not
+reclaimed.'''
+
+import os, shutil, hashlib, fcntl, contextlib
+
+LOCK_FNAME = ".lock"
+
+class StagingArea(object):
+  def __init__(self, root, budget):
+    '''budget: maximum total size of staged files, in bytes. If 0, nothing is
+       staged, and inputs are read from where they are.'''
+    self.root = root
+    self.budget = budget
+    if budget:
+      os.makedirs(root, exist_ok=True)
+
+  @contextlib.contextmanager
+  def _locked(self):
+    with open(os.path.join(self.root, LOCK_FNAME), 'w') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      yield
+
+  def _stagedPath(self, path, stat):
+    # new version of input gets a new name: no need to check staged copy
+    signature = "{0}:{1}:{2}".format(os.path.realpath(path),
+                                     stat.st_size, stat.st_mtime_ns)
+    digest = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+    return os.path.join(self.root, digest + "-" + os.path.basename(path))
+
+  def _staged(self):
+    '''Returns list of (last used, size, path) for all staged files.'''
+    files = []
+    for entry in os.scandir(self.root):
+      if entry.name.startswith("."):
+        continue
+      stat = entry.stat()
+      files.append((stat.st_mtime, stat.st_size, entry.path))
+    return files
+
+  def _evict(self, required):
+    '''Removes least recently used files until required bytes are free.'''
+    files = sorted(self._staged())
+    used = sum(size for (_, size, _) in files)
+    for (_, size, path) in files:
+      if used + required <= self.budget:
+        break
+      os.unlink(path)
+      used -= size
+
+  def open(self, path):
+    '''Returns a file descriptor, open for reading, of an in-memory copy of
+       path. If path is too big for the budget, or can't be staged, it is of
+       path itself. The copy is opened while holding the lock, so another
+       harness can't evict it before then.'''
+    stat = os.stat(path)
+    if not self.budget or stat.st_size > self.budget:
+      return os.open(path, os.O_RDONLY)
+
+    staged_path = self._stagedPath(path, stat)
+    with self._locked():
+      if os.path.exists(staged_path):
+        # mtime records when it was last used
+        os.utime(staged_path)
+        return os.open(staged_path, os.O_RDONLY)
+
+      self._evict(stat.st_size)
+      temp_path = os.path.join(self.root, ".tmp-" + os.path.basename(staged_path))
+      try:
+        # N.B. copyfile uses sendfile: contents are not copied through Python
+        shutil.copyfile(path, temp_path)
+      except OSError as e:
+        print("WARNING: could not stage ", path, ": ", e, sep="")
+        with contextlib.suppress(OSError):
+          os.unlink(temp_path)
+        return os.open(path, os.O_RDONLY)
+      os.rename(temp_path, staged_path)
+      return os.open(staged_path, os.O_RDONLY)
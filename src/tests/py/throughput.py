@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+'''Sustained throughput of incremental solvers: how many deltas (and changes)
+per second a solver keeps up with, when deltas are streamed to it as fast as
+it will read them.
+
+A trace may be too short to reach a steady state, or too small to load the
+solver. When run as a script, this module amplifies an incremental graph on
+stdin, writing the result to stdout. This is done ahead of time, so the
+solver is never kept waiting by it:
+
+  copies: the cluster is replicated, each copy sharing the sink. Every line
+  of a delta is applied to each copy in turn, so deltas are copies times
+  larger.
+  loops: the trace is played loops times. Between passes, a transition delta
+  removes every node other than the sink, and adds the initial graph back.
+
+Solvers require node IDs to be allocated densely: a new node takes a free ID,
+or extends the graph by one if there are none (see ResidualNetwork::addNode).
+So IDs are not simply offset for each copy: the allocator is mirrored here,
+and each node of each copy is mapped to the ID it gets in the solver.
+
+Throughput is measured over sliding windows of completion times, excluding
+the first few deltas of each pass while the solver warms up, and transition
+deltas.'''
+
+import sys, tempfile
+
+SINK_NODE = 1
+EOI_LINE = b"c EOI\n"
+
+class NodeAllocator(object):
+  '''Mirrors node IDs in the solver: returns the ID of each new node.'''
+  def __init__(self, num_nodes):
+    # IDs 1 .. num_nodes created by the initial graph
+    self.next_id = num_nodes + 1
+    self.free = set()
+
+  def add(self, preferred):
+    '''Keeps preferred ID if possible, so one copy, one pass is unchanged.'''
+    if preferred in self.free:
+      self.free.remove(preferred)
+      return preferred
+    elif self.free:
+      return self.free.pop()
+    else:
+      self.next_id += 1
+      return self.next_id - 1
+
+  def remove(self, node_id):
+    self.free.add(node_id)
+
+class Amplifier(object):
+  def __init__(self, out, copies, loops):
+    self.out = out
+    self.copies = copies
+    self.loops = loops
+    # (copy, node in input) -> node in output
+    self.nodes = {}
+    self.allocator = None
+    # initial graph: number of nodes, supply of each, arcs
+    self.num_nodes = None
+    self.supplies = {}
+    self.initial_arcs = None
+
+  def _write(self, *fields):
+    self.out.write(b" ".join(fields) + b"\n")
+
+  def _node(self, copy, node_id):
+    if node_id == SINK_NODE:
+      return node_id
+    return self.nodes[(copy, node_id)]
+
+  def _header(self, fields):
+    # p min <nodes> <arcs>
+    self.num_nodes = int(fields[2])
+    self.allocator = NodeAllocator(1 + self.copies * (self.num_nodes - 1))
+    for copy in range(self.copies):
+      for node_id in range(2, self.num_nodes + 1):
+        self.nodes[(copy, node_id)] = copy * (self.num_nodes - 1) + node_id
+    self._write(b"p", fields[1], str(self.allocator.next_id - 1).encode(),
+                str(int(fields[3]) * self.copies).encode())
+
+  def _initialLine(self, line):
+    fields = line.split()
+    if not fields:
+      return
+    elif fields[0] == b"p":
+      self._header(fields)
+    elif fields[0] == b"n":
+      node_id, supply = int(fields[1]), int(fields[2])
+      self.supplies[node_id] = supply
+      if node_id == SINK_NODE:
+        # sink demand of every copy
+        self._write(b"n", fields[1], str(supply * self.copies).encode())
+      else:
+        for copy in range(self.copies):
+          self._write(b"n", str(self._node(copy, node_id)).encode(),
+                      *fields[2:])
+    elif fields[0] == b"a":
+      if self.initial_arcs is not None:
+        self.initial_arcs.write(line)
+      self._arc(fields)
+    elif fields[0] != b"c":
+      self.out.write(line)
+
+  def _arc(self, fields):
+    src, dst = int(fields[1]), int(fields[2])
+    for copy in range(self.copies):
+      self._write(fields[0], str(self._node(copy, src)).encode(),
+                  str(self._node(copy, dst)).encode(), *fields[3:])
+
+  def _deltaLine(self, line):
+    fields = line.split()
+    if not fields or fields[0] == b"c":
+      return
+    elif fields[0] == b"n":
+      node_id = int(fields[1])
+      for copy in range(self.copies):
+        new_id = self.allocator.add(node_id)
+        self.nodes[(copy, node_id)] = new_id
+        self._write(b"n", str(new_id).encode(), *fields[2:])
+    elif fields[0] == b"r":
+      node_id = int(fields[1])
+      for copy in range(self.copies):
+        new_id = self.nodes.pop((copy, node_id))
+        self.allocator.remove(new_id)
+        self._write(b"r", str(new_id).encode())
+    elif fields[0] in [b"a", b"x"]:
+      self._arc(fields)
+    else:
+      self.out.write(line)
+
+  def _transition(self):
+    '''Delta replacing the graph with the initial graph'''
+    for new_id in self.nodes.values():
+      self.allocator.remove(new_id)
+      self._write(b"r", str(new_id).encode())
+    self.nodes = {}
+    for copy in range(self.copies):
+      for node_id in range(2, self.num_nodes + 1):
+        new_id = self.allocator.add(node_id)
+        self.nodes[(copy, node_id)] = new_id
+        self._write(b"n", str(new_id).encode(),
+                    str(self.supplies.get(node_id, 0)).encode())
+    self.initial_arcs.seek(0)
+    for line in self.initial_arcs:
+      self._arc(line.split())
+    self.out.write(EOI_LINE)
+
+  def run(self, f):
+    with tempfile.TemporaryFile() as initial_arcs:
+      if self.loops > 1:
+        # replayed by each transition
+        self.initial_arcs = initial_arcs
+      initial = True
+      deltas = None
+      line = EOI_LINE
+      for line in f:
+        if line == EOI_LINE:
+          self.out.write(line)
+          if initial:
+            initial = False
+            # all replayed from here on
+            deltas = tempfile.TemporaryFile() if self.loops > 1 else None
+          elif deltas is not None:
+            deltas.write(line)
+        elif initial:
+          self._initialLine(line)
+        else:
+          self._deltaLine(line)
+          if deltas is not None:
+            deltas.write(line)
+      if line != EOI_LINE and self.loops > 1:
+        # last delta need not be terminated, but is followed by a transition
+        self.out.write(EOI_LINE)
+        deltas.write(EOI_LINE)
+      for _ in range(self.loops - 1):
+        self._transition()
+        deltas.seek(0)
+        for line in deltas:
+          if line == EOI_LINE:
+            self.out.write(line)
+          else:
+            self._deltaLine(line)
+      if deltas is not None:
+        deltas.close()
+
+def deltaChanges(row):
+  '''Changes made by a delta, given its row of incremental_statistics output:
+     node and arc mutations, excluding no-ops.'''
+  fields = ["n_additions", "n_deletions", "a_additions", "a_deletions",
+            "a_changes"]
+  return sum(int(row[field]) for field in fields)
+
+def spans(num_deltas, loops, warmup):
+  '''Indices (from 0, excluding the initial graph) of deltas measured in each
+     pass of an amplified trace, with num_deltas deltas per pass, as ranges.
+     Each pass after the first is preceded by a transition delta.'''
+  result = []
+  start = 0
+  for _ in range(loops):
+    result.append(range(min(start + warmup, start + num_deltas),
+                        start + num_deltas))
+    # skip transition delta
+    start += num_deltas + 1
+  return result
+
+def windows(completions, changes, span, window, step):
+  '''completions: time each delta was solved, in seconds, indexed as in span.
+     changes: number of changes in each delta, likewise.
+     Yields (start, end, deltas, changes) for windows of window seconds,
+     starting every step seconds, from when the delta before the span was
+     solved until the last delta in the span. If the span is shorter than
+     window, yields it as a single window.'''
+  if not span:
+    return
+  origin = completions[span.start - 1] if span.start > 0 else 0
+  end = completions[span.stop - 1]
+  if end - origin < window:
+    yield (origin, end, len(span), sum(changes[k] for k in span))
+    return
+  window_start = origin
+  first = span.start
+  while window_start + window <= end:
+    window_end = window_start + window
+    while first < span.stop and completions[first] <= window_start:
+      first += 1
+    last = first
+    num_changes = 0
+    while last < span.stop and completions[last] <= window_end:
+      num_changes += changes[last]
+      last += 1
+    yield (window_start, window_end, last - first, num_changes)
+    window_start += step
+
+if __name__ == "__main__":
+  if len(sys.argv) != 3:
+    print("usage: ", sys.argv[0], "<copies> <loops>", file=sys.stderr)
+    sys.exit(1)
+  amplifier = Amplifier(sys.stdout.buffer, int(sys.argv[1]), int(sys.argv[2]))
+  amplifier.run(sys.stdin.buffer)
@@ -0,0 +1,182 @@
+'''Cache of the traces generated by the simulator for hybrid tests, shared
+between commits and with later invocations of the harness.
+
+A trace is determined by the solver the simulator runs and the flags it is
+run with. Entries are keyed on a hash of the contents of the solver and the
+simulator (including any modules it imports), rather than their paths: the
+path of a solver includes its commit, and the reference solver builds
+identically at most commits.
+
+Traces are written to a temporary file, and renamed into place once the
+simulator exits successfully, so a partially written trace is never used.
+When the total size exceeds the quota, the least recently used traces are
+evicted. Traces in use are pinned with a shared lock, and are never evicted.
+Each entry has a .json file alongside it, describing what generated it, and
+may have sidecar files the simulator's output was accompanied by.'''
+
+import os, json, hashlib, fcntl, contextlib
+
+LOCK_FNAME = ".lock"
+TEMP_PREFIX = ".tmp-"
+SUFFIX = ".imin"
+DESCRIPTION_SUFFIX = ".json"
+# Files alongside a trace, named by appending a suffix, which move with it:
+# the cluster timestamp of each delta (see benchmark.replayArrivals)
+SIDECAR_SUFFIXES = [".timestamps"]
+
+def traceKey(solver_hash, simulator_hashes, flags):
+  '''simulator_hashes: of each file the simulator's behaviour depends on
+     flags: normalised, so they don't depend on where files are'''
+  key = {"solver": solver_hash,
+         "simulator": simulator_hashes,
+         "flags": [str(flag) for flag in flags]}
+  canonical = json.dumps(key, sort_keys=True)
+  return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def _pidAlive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+class TraceCache(object):
+  def __init__(self, root, quota, compressed_variants=lambda path : []):
+    '''quota: maximum total size of cached traces, in bytes.
+       compressed_variants: returns paths path may have been compressed to.
+       Entries may be compressed in place to save space.'''
+    self.root = root
+    self.quota = quota
+    self.compressed_variants = compressed_variants
+    os.makedirs(root, exist_ok=True)
+
+  @contextlib.contextmanager
+  def _locked(self):
+    with open(os.path.join(self.root, LOCK_FNAME), 'w') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      yield
+
+  def path(self, key):
+    '''Where the trace of key is published, if not compressed since'''
+    return os.path.join(self.root, key + SUFFIX)
+
+  def lookup(self, key):
+    '''Returns path of the trace of key, or None if it is not cached.'''
+    path = self.path(key)
+    for cached_path in [path] + self.compressed_variants(path):
+      if os.path.exists(cached_path):
+        return cached_path
+    return None
+
+  def temporaryPath(self, key, suffix=SUFFIX):
+    '''Path to generate the trace of key at, before publishing it. Unique to
+       this process, so concurrent harnesses never write to the same file.'''
+    return os.path.join(self.root, "{0}{1}-{2}{3}".format(TEMP_PREFIX, key,
+                                                         os.getpid(), suffix))
+
+  def publish(self, key, temp_path, description):
+    '''Moves the complete trace at temp_path, and any sidecar files next to
+       it, into the cache.
+       description: JSON serializable, shown by entries()'''
+    description_temp_path = self.temporaryPath(key, DESCRIPTION_SUFFIX)
+    with open(description_temp_path, 'w') as f:
+      json.dump(description, f, sort_keys=True)
+    with self._locked():
+      os.rename(description_temp_path,
+                os.path.join(self.root, key + DESCRIPTION_SUFFIX))
+      # trace last: once it's there, so is everything else
+      for suffix in SIDECAR_SUFFIXES:
+        if os.path.exists(temp_path + suffix):
+          os.rename(temp_path + suffix, self.path(key) + suffix)
+      os.rename(temp_path, self.path(key))
+
+  @contextlib.contextmanager
+  def pin(self, path):
+    '''Context manager: the trace at path is not evicted until exit. Raises
+       FileNotFoundError if it has been evicted already.'''
+    with self._locked():
+      f = open(path, 'rb')
+      fcntl.flock(f, fcntl.LOCK_SH)
+      # mtime records when it was last used
+      os.utime(path)
+    try:
+      yield path
+    finally:
+      f.close()
+
+  def entries(self):
+    '''Returns list of dicts describing each cached trace, least recently
+       used first.'''
+    entries = []
+    for entry in os.scandir(self.root):
+      if entry.name.startswith(".") or entry.name.endswith(DESCRIPTION_SUFFIX) \
+         or entry.name.endswith(tuple(SIDECAR_SUFFIXES)):
+        continue
+      key = entry.name.split(".")[0]
+      stat = entry.stat()
+      try:
+        with open(os.path.join(self.root, key + DESCRIPTION_SUFFIX)) as f:
+          description = json.load(f)
+      except (OSError, ValueError):
+        description = None
+      entries.append({"key": key,
+                      "path": entry.path,
+                      "size": stat.st_size,
+                      "last_used": stat.st_mtime,
+                      "description": description})
+    entries.sort(key=lambda entry : entry["last_used"])
+    return entries
+
+  def _evict(self, path):
+    '''Removes the trace at path, unless it is pinned. Returns True if it
+       was removed.'''
+    with open(path, 'rb') as f:
+      try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except BlockingIOError:
+        return False
+      os.unlink(path)
+    key = os.path.basename(path).split(".")[0]
+    for leftover in [os.path.join(self.root, key + DESCRIPTION_SUFFIX)] \
+                  + [self.path(key) + suffix for suffix in SIDECAR_SUFFIXES]:
+      with contextlib.suppress(OSError):
+        os.unlink(leftover)
+    return True
+
+  def _removeOrphans(self):
+    '''Removes temporary files of harnesses which have exited'''
+    for entry in os.scandir(self.root):
+      if not entry.name.startswith(TEMP_PREFIX):
+        continue
+      try:
+        pid = int(entry.name.split(".")[1].rsplit("-", 1)[1])
+      except (IndexError, ValueError):
+        continue
+      if not _pidAlive(pid):
+        with contextlib.suppress(OSError):
+          os.unlink(entry.path)
+
+  def collect(self, quota=None):
+    '''Evicts least recently used traces until the total size is within
+       quota (by default, the cache's quota). Pinned traces are skipped, so
+       the total may still exceed it. Returns list of entries evicted.'''
+    if quota is None:
+      quota = self.quota
+    evicted = []
+    with self._locked():
+      self._removeOrphans()
+      entries = self.entries()
+      used = sum(entry["size"] for entry in entries)
+      for entry in entries:
+        if used <= quota:
+          break
+        try:
+          if not self._evict(entry["path"]):
+            continue
+        except FileNotFoundError:
+          pass
+        used -= entry["size"]
+        evicted.append(entry)
+    return evicted
@@ -0,0 +1,848 @@
+#!/usr/bin/env python3
+'''Stand-in for firmament's google_trace_simulator, needing only Python.
+
+Replays a trace of task events in the format of the Google cluster trace,
+scheduling tasks with a flow solver. Accepts the flags runSimulator passes
+to google_trace_simulator, and produces the same outputs:
+
+  -graph_output_file: the initial flow network, followed by a delta for each
+  scheduling round, in the incremental DIMACS format.
+  -stats_file: a CSV row of timings and changes for each scheduling round.
+
+The network follows firmament's: each pending task has an arc to the
+unscheduled aggregator of its job, to the cluster aggregator, and to any
+machines it prefers. The cluster aggregator has an arc to every machine, and
+each machine to the sink. A running task has a single arc, to its machine.
+Costs are set by a cost model, selected by -flow_scheduling_cost_model using
+firmament's numbering. Only some of firmament's models are provided.
+
+Events are applied in batches, a scheduling round at a time: every
+-batch_step microseconds of trace time, or in online mode (-online_factor),
+after as much trace time as the round took, scaled by online_factor. Costs
+are recomputed once per round, after every event in the batch, so each arc
+appears at most once in a delta.
+
+-trace_path may be a store converted by trace_store.py, for replays which
+start late in the trace (-start_time). Run with 'synthesise' as the first
+argument to write a synthetic trace.'''
+
+import csv, heapq, itertools, os, queue, random, selectors, subprocess, sys, \
+       threading, time, zlib
+
+import throughput, trace_store
+from trace_store import MACHINE_ADD, MACHINE_REMOVE, TASK_SUBMIT, \
+                        TASK_SCHEDULE, TASK_FINISH
+
+SINK_NODE = throughput.SINK_NODE
+EOI_LINE = b"c EOI\n"
+
+# Node types, as in firmament's output. The solvers ignore these.
+OTHER_NODE, TASK_NODE, MACHINE_NODE, SINK_NODE_TYPE = 0, 1, 2, 3
+
+# Slots per machine, by firmament machine template
+MACHINE_SLOTS = {
+  "machine_topo.pbin": 8,
+  "michael.pbin": 24,
+}
+DEFAULT_MACHINE_SLOTS = 24
+# Time-dependent costs are recomputed at least this often (microseconds) when
+# tasks are waiting, even if no events arrive.
+COST_REFRESH = 10**6
+
+STATS_FIELDS = ["cluster_timestamp", "scheduling_latency", "algorithm_time",
+                "flowsolver_time", "total_time", "total_changes", "new_node",
+                "remove_node", "new_arc", "change_arc", "remove_arc"]
+CHANGE_FIELDS = STATS_FIELDS[-5:]
+
+def parseBool(value):
+  return value.lower() in ["true", "1", "yes"]
+
+# name: (type, default). Integer flags may be given in floating point.
+FLAG_TYPES = {
+  "logtostderr": (parseBool, False),
+  "batch_step": (int, 0),
+  "online_factor": (float, 0.0),
+  "online_max_time": (float, 5.0),
+  "flow_scheduling_cost_model": (int, 8),
+  "machine_tmpl_file": (str, ""),
+  "solver": (str, "custom"),
+  "solver_timeout": (float, 0.0),
+  "flow_scheduling_binary": (str, ""),
+  "custom_flow_scheduling_args": (str, ""),
+  "incremental_flow": (parseBool, False),
+  "trace_path": (str, ""),
+  "num_files_to_process": (int, 500),
+  "runtime": (int, 2**64 - 1),
+  # Not in google_trace_simulator. Tasks submitted earlier are skipped.
+  "start_time": (int, 0),
+  "max_events": (int, 2**64 - 1),
+  "max_scheduling_rounds": (int, 2**64 - 1),
+  "percentage": (float, 100.0),
+  "graph_output_file": (str, ""),
+  "stats_file": (str, ""),
+  "simulated_quincy_random_seed": (int, 42),
+}
+
+def parseFlags(argv):
+  '''gflags syntax: -flag value, -flag=value, or -flag for booleans.'''
+  flags = {name: default for name, (_, default) in FLAG_TYPES.items()}
+  args = iter(argv)
+  for arg in args:
+    if not arg.startswith("-"):
+      raise ValueError("unexpected argument " + arg)
+    name, sep, value = arg.lstrip("-").partition("=")
+    if name not in FLAG_TYPES:
+      raise ValueError("unknown flag " + name)
+    kind = FLAG_TYPES[name][0]
+    if not sep:
+      value = "true" if kind is parseBool else next(args)
+    if kind is int:
+      flags[name] = int(float(value))
+    else:
+      flags[name] = kind(value)
+  return flags
+
+### Trace
+
+def synthesise(directory, num_machines, num_jobs, tasks_per_job, duration,
+               mean_runtime, seed):
+  '''Writes a trace of num_machines machines present from the start, and
+     num_jobs jobs of tasks_per_job tasks arriving uniformly over duration
+     seconds, with exponentially distributed runtimes.'''
+  rng = random.Random(seed)
+  second = 10**6
+  for table in ["machine_events", "task_events"]:
+    os.makedirs(os.path.join(directory, table), exist_ok=True)
+  machine_path = os.path.join(directory, "machine_events",
+                              "part-00000-of-00001.csv")
+  with open(machine_path, 'w', newline='') as f:
+    writer = csv.writer(f)
+    for machine in range(num_machines):
+      writer.writerow([0, machine + 1, MACHINE_ADD, "", 0.5, 0.5])
+  events = []
+  for job in range(num_jobs):
+    arrival = int(rng.uniform(0, duration) * second)
+    for index in range(tasks_per_job):
+      runtime = int(rng.expovariate(1.0 / mean_runtime) * second) + 1
+      for event_time, event_type in [(arrival, TASK_SUBMIT),
+                                     (arrival, TASK_SCHEDULE),
+                                     (arrival + runtime, TASK_FINISH)]:
+        events.append((event_time, job + 1, index, event_type))
+  events.sort()
+  task_path = os.path.join(directory, "task_events", "part-00000-of-00001.csv")
+  with open(task_path, 'w', newline='') as f:
+    writer = csv.writer(f)
+    for event_time, job, index, event_type in events:
+      writer.writerow([event_time, "", job, index, "", event_type, "", 0, 0,
+                       0.01, 0.01, 0.0, 0])
+
+### Cluster state
+
+class Machine(object):
+  __slots__ = ["key", "node", "slots", "running"]
+
+  def __init__(self, key, node, slots):
+    self.key = key
+    self.node = node
+    self.slots = slots
+    self.running = set()
+
+class Job(object):
+  __slots__ = ["key", "node", "pending", "running"]
+
+  def __init__(self, key, node):
+    self.key = key
+    self.node = node
+    self.pending = 0
+    self.running = 0
+
+class Task(object):
+  __slots__ = ["key", "job", "node", "submit_time", "runtime", "machine",
+               "preferences", "attributes", "generation"]
+
+  def __init__(self, key, job, node, submit_time, runtime):
+    self.key = key
+    self.job = job
+    self.node = node
+    self.submit_time = submit_time
+    self.runtime = runtime
+    self.machine = None
+    # machine key -> cost
+    self.preferences = {}
+    # set by the cost model
+    self.attributes = None
+    # incremented when evicted, invalidating its scheduled completion
+    self.generation = 0
+
+### Cost models
+
+class CostModel(object):
+  '''Costs of arcs in the flow network. Task costs are recomputed every round
+     when TIME_DEPENDENT, machine costs whenever a machine's load changes
+     when LOAD_DEPENDENT.'''
+  TIME_DEPENDENT = False
+  LOAD_DEPENDENT = False
+
+  def __init__(self, seed):
+    self.random = random.Random(seed)
+
+  def submit(self, task, machines):
+    '''Sets task.attributes and task.preferences on submission.
+       machines: list of keys of machines in the cluster.'''
+    pass
+
+  def unscheduledCost(self, task, now):
+    return 0
+
+  def clusterCost(self, task, now):
+    return 0
+
+  def machineCost(self, machine):
+    return 0
+
+def waitSeconds(task, now):
+  return (now - task.submit_time) // 10**6
+
+class TrivialCostModel(CostModel):
+  def unscheduledCost(self, task, now):
+    return 5
+
+  def clusterCost(self, task, now):
+    return 2
+
+class RandomCostModel(CostModel):
+  def submit(self, task, machines):
+    task.attributes = (self.random.randint(100, 200),
+                       self.random.randint(0, 100))
+
+  def unscheduledCost(self, task, now):
+    return task.attributes[0]
+
+  def clusterCost(self, task, now):
+    return task.attributes[1]
+
+  def machineCost(self, machine):
+    return zlib.crc32(machine.key.encode()) % 100
+
+class SjfCostModel(CostModel):
+  '''Shortest job first: tasks known to be short are cheaper to schedule.'''
+  TIME_DEPENDENT = True
+  MAX_COST = 1000
+
+  def unscheduledCost(self, task, now):
+    return self.MAX_COST + waitSeconds(task, now)
+
+  def clusterCost(self, task, now):
+    if task.runtime is None:
+      return self.MAX_COST
+    return min(task.runtime // 10**6, self.MAX_COST)
+
+class SimulatedQuincyCostModel(CostModel):
+  '''Quincy, with the data of each task on randomly chosen machines: the
+     cost of leaving a task unscheduled grows with how long it has waited.'''
+  TIME_DEPENDENT = True
+  UNSCHEDULED_COST = 400
+  WAIT_COST = 10
+  CLUSTER_COST = 200
+  PREFERRED_MACHINES = 3
+
+  def submit(self, task, machines):
+    num_preferences = min(self.PREFERRED_MACHINES, len(machines))
+    for key in self.random.sample(machines, num_preferences):
+      task.preferences[key] = self.random.randint(0, self.CLUSTER_COST)
+
+  def unscheduledCost(self, task, now):
+    return self.UNSCHEDULED_COST + self.WAIT_COST * waitSeconds(task, now)
+
+  def clusterCost(self, task, now):
+    return self.CLUSTER_COST
+
+class OctopusCostModel(CostModel):
+  '''Load balancing: machines cost more the more tasks they run.'''
+  LOAD_DEPENDENT = True
+  UNSCHEDULED_COST = 1000000
+
+  def unscheduledCost(self, task, now):
+    return self.UNSCHEDULED_COST
+
+  def machineCost(self, machine):
+    return len(machine.running) * 100 // machine.slots
+
+# By firmament's number for each cost model, as in config.COST_MODELS.
+# There is no distributed filesystem to give Quincy its preferences.
+COST_MODELS = {
+  0: TrivialCostModel,
+  1: RandomCostModel,
+  2: SjfCostModel,
+  3: SimulatedQuincyCostModel,
+  6: OctopusCostModel,
+  8: SimulatedQuincyCostModel,
+}
+
+### Flow network
+
+class FlowNetwork(object):
+  '''The network as the solver sees it, recording each change in a delta.
+     Arcs of zero capacity do not exist, as in the solvers.'''
+  def __init__(self):
+    self.allocator = throughput.NodeAllocator(0)
+    self.supplies = {}
+    self.types = {}
+    self.labels = {}
+    # (src, dst) -> (capacity, cost)
+    self.arcs = {}
+    self.adjacent = {}
+    self.delta = []
+    self.changes = dict.fromkeys(CHANGE_FIELDS, 0)
+
+  def addNode(self, supply, node_type, label):
+    node = self.allocator.add(None)
+    self.supplies[node] = supply
+    self.types[node] = node_type
+    self.labels[node] = label
+    self.adjacent[node] = set()
+    if node != SINK_NODE:
+      # solvers add the demand to the sink
+      self.supplies[SINK_NODE] -= supply
+    self.delta.append("n {} {} {}\n".format(node, supply, node_type))
+    self.changes["new_node"] += 1
+    return node
+
+  def removeNode(self, node):
+    '''Removes node, and implicitly all its arcs'''
+    for other in self.adjacent.pop(node):
+      self.adjacent[other].discard(node)
+      self.arcs.pop((node, other), None)
+      self.arcs.pop((other, node), None)
+    self.supplies[SINK_NODE] += self.supplies.pop(node)
+    del self.types[node]
+    del self.labels[node]
+    self.allocator.remove(node)
+    self.delta.append("r {}\n".format(node))
+    self.changes["remove_node"] += 1
+
+  def setArc(self, src, dst, capacity, cost):
+    '''Adds, changes or (if capacity is zero) removes the arc src->dst'''
+    key = (src, dst)
+    current = self.arcs.get(key)
+    if current == (capacity, cost) or (current is None and capacity == 0):
+      return
+    elif capacity == 0:
+      del self.arcs[key]
+      if (dst, src) not in self.arcs:
+        self.adjacent[src].discard(dst)
+        self.adjacent[dst].discard(src)
+      self.changes["remove_arc"] += 1
+    elif current is None:
+      self.arcs[key] = (capacity, cost)
+      self.adjacent[src].add(dst)
+      self.adjacent[dst].add(src)
+      self.changes["new_arc"] += 1
+    else:
+      self.arcs[key] = (capacity, cost)
+      self.changes["change_arc"] += 1
+    operation = "x" if current is not None else "a"
+    self.delta.append("{} {} {} 0 {} {}\n".format(operation, src, dst,
+                                                   capacity, cost))
+
+  def takeDelta(self):
+    '''Returns (delta, changes) since the last call'''
+    delta, changes = "".join(self.delta), self.changes
+    self.delta = []
+    self.changes = dict.fromkeys(CHANGE_FIELDS, 0)
+    return (delta, changes)
+
+  def export(self, initial=False):
+    '''The whole network in DIMACS format. If initial, it becomes the first
+       graph of the incremental trace: the solver will consider every ID up
+       to the largest in use to be taken, so free IDs are not reused.'''
+    num_nodes = self.allocator.next_id - 1
+    lines = ["c ===========================\n",
+             "p min {} {}\n".format(num_nodes, len(self.arcs)),
+             "c ===========================\n",
+             "c === ALL NODES FOLLOW ===\n"]
+    for node in sorted(self.supplies):
+      lines.append("c nd {}\nn {} {} {}\n".format(self.labels[node], node,
+                                                  self.supplies[node],
+                                                  self.types[node]))
+    lines.append("c === ALL ARCS FOLLOW ===\n")
+    lines.extend("a {} {} 0 {} {}\n".format(src, dst, capacity, cost)
+                 for (src, dst), (capacity, cost) in self.arcs.items())
+    if initial:
+      self.allocator.free.clear()
+      self.takeDelta()
+    return "".join(lines)
+
+### Solvers
+
+class SolverTimeout(Exception):
+  pass
+
+def parseFlows(lines):
+  '''(src, dst) -> flow, from "f src dst flow" lines of solver output'''
+  flows = {}
+  for line in lines:
+    fields = line.split()
+    if fields and fields[0] == b"f" and fields[3] != b"0":
+      flows[(int(fields[1]), int(fields[2]))] = int(fields[3])
+  return flows
+
+def parseAlgorithmTime(line):
+  if line.startswith(b"ALGOTIME:"):
+    return float(line.split()[1])
+  return None
+
+class FullSolver(object):
+  '''Solves the whole network from scratch every round.'''
+  def __init__(self, command, timeout):
+    self.command = command
+    self.timeout = timeout or None
+
+  def solve(self, network, text):
+    process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+      out, err = process.communicate(network.export().encode(),
+                                     timeout=self.timeout)
+    except subprocess.TimeoutExpired:
+      process.kill()
+      process.communicate()
+      raise SolverTimeout()
+    if process.returncode != 0:
+      sys.stderr.buffer.write(err)
+      raise RuntimeError("solver exited with status {}"
+                         .format(process.returncode))
+    sys.stderr.buffer.write(err)
+    # some solvers, such as cs2, report it on stdout
+    algorithm_time = None
+    for line in out.splitlines() + err.splitlines():
+      parsed = parseAlgorithmTime(line)
+      if parsed is not None:
+        algorithm_time = parsed
+    return (parseFlows(out.splitlines()), algorithm_time)
+
+  def close(self):
+    pass
+
+class IncrementalSolver(object):
+  '''A solver process kept running, sent the initial network then a delta
+     each round.'''
+  def __init__(self, command, timeout):
+    self.timeout = timeout or None
+    self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+    self.algorithm_times = queue.Queue()
+    self.stderr_thread = threading.Thread(target=self._readStderr, daemon=True)
+    self.stderr_thread.start()
+    os.set_blocking(self.process.stdout.fileno(), False)
+    self.selector = selectors.DefaultSelector()
+    self.selector.register(self.process.stdout, selectors.EVENT_READ)
+    self.buffer = b""
+    # seconds to wait for ALGOTIME; stops waiting if the solver never reports
+    self.report_timeout = 1
+
+  def _readStderr(self):
+    for line in self.process.stderr:
+      algorithm_time = parseAlgorithmTime(line)
+      if algorithm_time is None:
+        sys.stderr.buffer.write(line)
+      else:
+        self.algorithm_times.put(algorithm_time)
+
+  def _readSolution(self, deadline):
+    '''Lines of output up to and excluding the next "c EOI"'''
+    while EOI_LINE not in self.buffer:
+      remaining = None if deadline is None else deadline - time.time()
+      if remaining is not None and remaining <= 0:
+        raise SolverTimeout()
+      if not self.selector.select(remaining):
+        continue
+      chunk = self.process.stdout.read()
+      if chunk == b"":
+        raise RuntimeError("solver exited with status {}"
+                           .format(self.process.wait()))
+      elif chunk:
+        self.buffer += chunk
+    end = self.buffer.index(EOI_LINE)
+    solution = self.buffer[:end]
+    self.buffer = self.buffer[end + len(EOI_LINE):]
+    return solution.splitlines()
+
+  def solve(self, network, text):
+    deadline = None if self.timeout is None else time.time() + self.timeout
+    self.process.stdin.write(text.encode())
+    self.process.stdin.write(EOI_LINE)
+    self.process.stdin.flush()
+    flows = parseFlows(self._readSolution(deadline))
+    try:
+      # reported before the solution is written
+      algorithm_time = self.algorithm_times.get(timeout=self.report_timeout)
+    except queue.Empty:
+      algorithm_time = None
+      self.report_timeout = 0
+    return (flows, algorithm_time)
+
+  def close(self):
+    if self.process.poll() is None:
+      self.process.stdin.close()
+      try:
+        self.process.wait(timeout=1)
+      except subprocess.TimeoutExpired:
+        self.process.kill()
+        self.process.wait()
+    self.selector.close()
+
+### Simulation
+
+class Simulator(object):
+  def __init__(self, flags, cost_model, solver, graph_file, stats_writer):
+    self.flags = flags
+    self.cost_model = cost_model
+    self.solver = solver
+    self.graph_file = graph_file
+    self.stats_writer = stats_writer
+    slots = os.path.basename(flags["machine_tmpl_file"])
+    self.slots = MACHINE_SLOTS.get(slots, DEFAULT_MACHINE_SLOTS)
+
+    self.network = FlowNetwork()
+    sink = self.network.addNode(0, SINK_NODE_TYPE, "0 SINK")
+    assert(sink == SINK_NODE)
+    self.cluster = self.network.addNode(0, OTHER_NODE, "0 CLUSTER_AGG")
+    self.machines = {}
+    # keys of self.machines, for cost models to sample
+    self.machine_keys = []
+    self.jobs = {}
+    self.tasks = {}
+    self.pending = {}
+    # (time, sequence, task, generation) of running tasks
+    self.completions = []
+    self.sequence = itertools.count()
+    # changed since costs were last recomputed
+    self.dirty_jobs = set()
+    self.dirty_machines = set()
+    self.placed = []
+
+  ### Events
+
+  def addMachine(self, key):
+    if key in self.machines:
+      return
+    node = self.network.addNode(0, MACHINE_NODE, "0 " + key)
+    machine = Machine(key, node, self.slots)
+    self.machines[key] = machine
+    self.machine_keys.append(key)
+    self.network.setArc(self.cluster, node, machine.slots,
+                        self.cost_model.machineCost(machine))
+    self.network.setArc(node, SINK_NODE, machine.slots, 0)
+
+  def removeMachine(self, key, now):
+    machine = self.machines.pop(key, None)
+    if machine is None:
+      return
+    self.machine_keys.remove(key)
+    self.dirty_machines.discard(machine)
+    self.network.removeNode(machine.node)
+    for task in machine.running:
+      # evicted: pending once more
+      task.machine = None
+      task.generation += 1
+      task.job.running -= 1
+      self._pend(task, now)
+
+  def _job(self, key):
+    job = self.jobs.get(key)
+    if job is None:
+      node = self.network.addNode(0, OTHER_NODE, "0 UNSCHED_AGG_for_" + key)
+      job = Job(key, node)
+      self.jobs[key] = job
+    return job
+
+  def _releaseJob(self, job):
+    self.dirty_jobs.add(job)
+    if job.pending == 0 and job.running == 0:
+      self.network.removeNode(job.node)
+      del self.jobs[job.key]
+      self.dirty_jobs.discard(job)
+
+  def _pend(self, task, now):
+    '''Arcs of a task waiting to be scheduled'''
+    network = self.network
+    network.setArc(task.node, task.job.node, 1,
+                   self.cost_model.unscheduledCost(task, now))
+    network.setArc(task.node, self.cluster, 1,
+                   self.cost_model.clusterCost(task, now))
+    for key, cost in task.preferences.items():
+      machine = self.machines.get(key)
+      if machine is not None:
+        network.setArc(task.node, machine.node, 1, cost)
+    task.job.pending += 1
+    self.dirty_jobs.add(task.job)
+    self.pending[task.node] = task
+
+  def submitTask(self, key, runtime, now):
+    if key in self.tasks:
+      # resubmitted in the trace: the simulator has it already
+      return
+    job = self._job(key[0])
+    node = self.network.addNode(1, TASK_NODE, "T_{}_{}".format(*key))
+    task = Task(key, job, node, now, runtime)
+    self.cost_model.submit(task, self.machine_keys)
+    self.tasks[key] = task
+    self._pend(task, now)
+
+  def withdrawTask(self, key):
+    '''Task killed or failed in the trace before being scheduled'''
+    task = self.tasks.get(key)
+    if task is None or task.machine is not None:
+      return
+    del self.tasks[key]
+    del self.pending[task.node]
+    self.network.removeNode(task.node)
+    task.job.pending -= 1
+    self._releaseJob(task.job)
+
+  def place(self, task, machine, now):
+    network = self.network
+    del self.pending[task.node]
+    network.setArc(task.node, task.job.node, 0, 0)
+    network.setArc(task.node, self.cluster, 0, 0)
+    for key in task.preferences:
+      other = self.machines.get(key)
+      if other is not None and other is not machine:
+        network.setArc(task.node, other.node, 0, 0)
+    network.setArc(task.node, machine.node, 1, 0)
+    task.machine = machine
+    machine.running.add(task)
+    task.job.pending -= 1
+    task.job.running += 1
+    self.dirty_jobs.add(task.job)
+    self.dirty_machines.add(machine)
+    self.placed.append(task)
+    if task.runtime is not None:
+      heapq.heappush(self.completions, (now + task.runtime,
+                                        next(self.sequence), task,
+                                        task.generation))
+
+  def complete(self, task):
+    machine = task.machine
+    machine.running.discard(task)
+    self.dirty_machines.add(machine)
+    del self.tasks[task.key]
+    self.network.removeNode(task.node)
+    task.job.running -= 1
+    self._releaseJob(task.job)
+
+  def applyEvent(self, event):
+    now, kind, event_type, key, runtime = event
+    if kind == "machine":
+      if event_type == MACHINE_ADD:
+        self.addMachine(key)
+      elif event_type == MACHINE_REMOVE:
+        self.removeMachine(key, now)
+    elif event_type == TASK_SUBMIT:
+      self.submitTask(key, runtime, now)
+    else:
+      self.withdrawTask(key)
+
+  def completeUntil(self, now):
+    while self.completions and self.completions[0][0] <= now:
+      _, _, task, generation = heapq.heappop(self.completions)
+      if task.generation == generation and task.machine is not None:
+        self.complete(task)
+
+  ### Scheduling rounds
+
+  def updateCosts(self, now):
+    '''Batched: costs that changed over the round, each arc updated once'''
+    network = self.network
+    cost_model = self.cost_model
+    if cost_model.TIME_DEPENDENT:
+      cluster = self.cluster
+      costs = [(task.node, task.job.node,
+                cost_model.unscheduledCost(task, now),
+                cost_model.clusterCost(task, now))
+               for task in self.pending.values()]
+      for node, job_node, unscheduled_cost, cluster_cost in costs:
+        network.setArc(node, job_node, 1, unscheduled_cost)
+        network.setArc(node, cluster, 1, cluster_cost)
+    for job in self.dirty_jobs:
+      network.setArc(job.node, SINK_NODE, job.pending, 0)
+    self.dirty_jobs.clear()
+    if cost_model.LOAD_DEPENDENT:
+      for machine in self.dirty_machines:
+        network.setArc(self.cluster, machine.node, machine.slots,
+                       cost_model.machineCost(machine))
+    self.dirty_machines.clear()
+
+  def placeAll(self, flows, now):
+    '''Schedules pending tasks as the flow does. Tasks routed through the
+       cluster aggregator take whichever machines it sends flow to.'''
+    machines_by_node = {machine.node: machine
+                        for machine in self.machines.values()}
+    via_cluster = []
+    for node, task in list(self.pending.items()):
+      if flows.get((node, self.cluster)):
+        via_cluster.append(task)
+        continue
+      for key in task.preferences:
+        machine = self.machines.get(key)
+        if machine is not None and flows.get((node, machine.node)):
+          self.place(task, machine, now)
+          break
+    free = [(machines_by_node[dst], flow)
+            for (src, dst), flow in flows.items()
+            if src == self.cluster and dst in machines_by_node]
+    tasks = iter(via_cluster)
+    for machine, flow in free:
+      for task in itertools.islice(tasks, flow):
+        self.place(task, machine, now)
+
+  def schedulingRound(self, now, first):
+    '''Returns the time the round took, in seconds, or None on timeout'''
+    start = time.time()
+    self.updateCosts(now)
+    if first:
+      text = self.network.export(initial=True)
+      changes = dict.fromkeys(CHANGE_FIELDS, 0)
+    else:
+      text, changes = self.network.takeDelta()
+    if self.graph_file:
+      self.graph_file.write(text)
+      self.graph_file.write(EOI_LINE.decode())
+    solver_start = time.time()
+    try:
+      flows, algorithm_time = self.solver.solve(self.network, text)
+    except SolverTimeout:
+      self._writeStats(now, "Timeout", "Timeout", "Timeout", "Timeout",
+                       changes)
+      return None
+    flowsolver_time = time.time() - solver_start
+    if algorithm_time is None:
+      algorithm_time = flowsolver_time
+    self.placeAll(flows, now)
+    total_time = time.time() - start
+    latencies = [(now - task.submit_time) / 10**6 for task in self.placed]
+    self.placed = []
+    scheduling_latency = sum(latencies) / len(latencies) if latencies else 0
+    self._writeStats(now, scheduling_latency, algorithm_time, flowsolver_time,
+                     total_time, changes)
+    return total_time
+
+  def _writeStats(self, now, scheduling_latency, algorithm_time,
+                  flowsolver_time, total_time, changes):
+    if self.stats_writer is None:
+      return
+    row = {"cluster_timestamp": now,
+           "scheduling_latency": scheduling_latency,
+           "algorithm_time": algorithm_time,
+           "flowsolver_time": flowsolver_time,
+           "total_time": total_time,
+           "total_changes": sum(changes.values())}
+    row.update(changes)
+    self.stats_writer.writerow(row)
+
+  def run(self, events):
+    flags = self.flags
+    online = flags["online_factor"] > 0
+    events = iter(events)
+    next_event = next(events, None)
+    if next_event is None:
+      return
+    now = next_event[0]
+    num_events = 0
+    rounds = 0
+    while rounds < flags["max_scheduling_rounds"] and now <= flags["runtime"]:
+      # batch every event up to the round
+      while next_event is not None and next_event[0] <= now \
+            and num_events < flags["max_events"]:
+        self.applyEvent(next_event)
+        num_events += 1
+        next_event = next(events, None)
+      self.completeUntil(now)
+      round_start = now
+      round_time = self.schedulingRound(now, rounds == 0)
+      rounds += 1
+      if round_time is None:
+        break
+      if online:
+        step = min(round_time * flags["online_factor"],
+                   flags["online_max_time"]) * 10**6
+      else:
+        step = flags["batch_step"]
+      now += max(int(step), 1)
+      # skip idle time, when nothing would change
+      if next_event is None or num_events >= flags["max_events"]:
+        if not self.completions:
+          break
+        upcoming = self.completions[0][0]
+      else:
+        upcoming = next_event[0]
+        if self.completions:
+          upcoming = min(upcoming, self.completions[0][0])
+      if self.pending and self.cost_model.TIME_DEPENDENT:
+        # costs of waiting tasks change, by the second
+        upcoming = min(upcoming, round_start + COST_REFRESH)
+      now = max(now, upcoming)
+
+def solverCommand(flags):
+  if flags["solver"] != "custom":
+    raise ValueError("only the custom solver is supported")
+  return [flags["flow_scheduling_binary"]] \
+       + flags["custom_flow_scheduling_args"].split()
+
+def simulate(flags):
+  cost_model_class = COST_MODELS.get(flags["flow_scheduling_cost_model"])
+  if cost_model_class is None:
+    raise ValueError("cost model {} not supported"
+                     .format(flags["flow_scheduling_cost_model"]))
+  cost_model = cost_model_class(flags["simulated_quincy_random_seed"])
+  trace = trace_store.openTrace(flags["trace_path"],
+                                flags["num_files_to_process"])
+
+  solver_class = IncrementalSolver if flags["incremental_flow"] else FullSolver
+  solver = solver_class(solverCommand(flags), flags["solver_timeout"])
+  graph_file = None
+  stats_file = None
+  try:
+    if flags["graph_output_file"]:
+      graph_file = open(flags["graph_output_file"], 'w')
+    stats_writer = None
+    if flags["stats_file"]:
+      # line buffered: may be a FIFO, read as the simulation progresses
+      stats_file = open(flags["stats_file"], 'w', buffering=1, newline='')
+      stats_writer = csv.DictWriter(stats_file, fieldnames=STATS_FIELDS)
+      stats_writer.writeheader()
+    simulator = Simulator(flags, cost_model, solver, graph_file, stats_writer)
+    simulator.run(trace.events(flags["percentage"], flags["start_time"],
+                               flags["runtime"] + 1))
+  finally:
+    solver.close()
+    if graph_file:
+      graph_file.close()
+    if stats_file:
+      stats_file.close()
+
+USAGE = '''usage: {0} -flag value ...  (flags of google_trace_simulator)
+       {0} synthesise <directory> <machines> <jobs> <tasks per job>
+                      <duration (s)> <mean runtime (s)> [seed]'''
+
+if __name__ == "__main__":
+  if len(sys.argv) > 1 and sys.argv[1] == "synthesise":
+    if len(sys.argv) not in [8, 9]:
+      print(USAGE.format(sys.argv[0]), file=sys.stderr)
+      sys.exit(1)
+    directory = sys.argv[2]
+    num_machines, num_jobs, tasks_per_job = map(int, sys.argv[3:6])
+    duration, mean_runtime = map(float, sys.argv[6:8])
+    seed = int(sys.argv[8]) if len(sys.argv) == 9 else 0
+    synthesise(directory, num_machines, num_jobs, tasks_per_job, duration,
+               mean_runtime, seed)
+  else:
+    try:
+      flags = parseFlags(sys.argv[1:])
+    except (ValueError, StopIteration) as e:
+      print(e, file=sys.stderr)
+      print(USAGE.format(sys.argv[0]), file=sys.stderr)
+      sys.exit(1)
+    simulate(flags)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+'''Traces in the Google cluster trace format, as CSV or in a columnar store.
+
+To reach a time window of a CSV trace, every file before it has to be
+parsed. A store is converted from a trace once, and holds its events as
+columns of fixed-size integers, which are memory mapped. Replays seek to a
+time using the index, and read events by slicing the columns, without
+copying.
+
+A store is a directory of:
+  meta.json: number of rows in each table, the row ending each task event
+    file converted, and the interval of the index.
+  <table>.<column>: native array of each column, of the type in COLUMNS.
+  jobs.txt, machines.txt: IDs in the trace, one per line. Columns refer to
+    them by line number.
+  task_events.index: first task event row at or after each multiple of the
+    index interval, in microseconds.
+
+IDs are numbered and event types stored as bytes, so a store is a fraction of
+the size of the CSV it was converted from. It is not compressed any further,
+as it could not then be mapped.
+
+usage: trace_store.py <trace directory> <store directory> [num files]'''
+
+import array, bisect, csv, glob, gzip, heapq, json, mmap, os, shutil, sys, \
+       zlib
+
+# Google cluster trace event types
+MACHINE_ADD, MACHINE_REMOVE = 0, 1
+TASK_SUBMIT, TASK_SCHEDULE, TASK_EVICT, TASK_FAIL, TASK_FINISH, TASK_KILL, \
+  TASK_LOST = range(7)
+TASK_ENDS = [TASK_EVICT, TASK_FAIL, TASK_FINISH, TASK_KILL, TASK_LOST]
+# events of tasks acted on by replays: failed or killed tasks are withdrawn,
+# if not yet scheduled
+TASK_REPLAYED = [TASK_SUBMIT, TASK_FAIL, TASK_KILL]
+# Special event times: before the trace window, and after it
+TIME_BEFORE_TRACE = 0
+TIME_AFTER_TRACE = 2**63 - 1
+
+### CSV traces
+
+def openTraceFile(path):
+  if path.endswith(".gz"):
+    return gzip.open(path, 'rt', newline='')
+  else:
+    return open(path, 'r', newline='')
+
+def traceFiles(trace_path, table, num_files=None):
+  files = sorted(glob.glob(os.path.join(trace_path, table, "part-*.csv*")))
+  return files[:num_files] if num_files is not None else files
+
+def traceRows(files):
+  for path in files:
+    with openTraceFile(path) as f:
+      for row in csv.reader(f):
+        yield row
+
+def sampled(key, percentage):
+  '''Whether key is in the sample: the same keys are chosen every run.'''
+  return zlib.crc32(key.encode()) % 10000 < percentage * 100
+
+class CsvTrace(object):
+  '''Machine and task events, read from the CSV files of a trace.'''
+  def __init__(self, trace_path, num_files):
+    self.machine_files = traceFiles(trace_path, "machine_events")
+    self.task_files = traceFiles(trace_path, "task_events", num_files)
+    if not self.task_files:
+      raise ValueError("no task events in " + trace_path)
+    self.runtimes = self._runtimes()
+
+  def _runtimes(self):
+    '''(job, task index) -> microseconds from first being scheduled to ending,
+       for tasks that end in the trace.'''
+    started = {}
+    runtimes = {}
+    for row in traceRows(self.task_files):
+      event_type = int(row[5])
+      key = (row[2], row[3])
+      if event_type == TASK_SCHEDULE:
+        started.setdefault(key, int(row[0]))
+      elif event_type in TASK_ENDS and key in started and key not in runtimes:
+        runtimes[key] = int(row[0]) - started[key]
+    return runtimes
+
+  def _machineEvents(self, percentage, start, end):
+    for row in traceRows(self.machine_files):
+      event_time = int(row[0])
+      if event_time >= end:
+        return
+      if sampled(row[1], percentage):
+        yield (max(event_time, start), "machine", int(row[2]), row[1], None)
+
+  def _taskEvents(self, percentage, start, end):
+    for row in traceRows(self.task_files):
+      event_time = int(row[0])
+      if event_time >= end:
+        return
+      event_type = int(row[5])
+      if event_time >= start and event_type in TASK_REPLAYED \
+         and sampled(row[2], percentage):
+        key = (row[2], row[3])
+        runtime = self.runtimes.get(key) if event_type == TASK_SUBMIT else None
+        yield (event_time, "task", event_type, key, runtime)
+
+  def events(self, percentage=100, start=0, end=2**64):
+    '''(time, "machine" or "task", event type, key, runtime) in time order,
+       for tasks submitted in [start, end). Only the events replays act on are
+       yielded: tasks run for as long as they did in the trace, once
+       scheduled. Machines start as they were at start.'''
+    return heapq.merge(self._machineEvents(percentage, start, end),
+                       self._taskEvents(percentage, start, end),
+                       key=lambda event: event[0])
+
+### Columnar stores
+
+META_FILE = "meta.json"
+# table: [(column, array type code)]
+COLUMNS = {
+  "machine_events": [("time", "q"), ("machine", "I"), ("event_type", "B")],
+  "task_events": [("time", "q"), ("task", "I"), ("event_type", "B")],
+  # runtime is -1 if the task does not end in the trace
+  "tasks": [("job", "I"), ("index", "I"), ("runtime", "q")],
+}
+INDEX_INTERVAL = 60 * 10**6
+# rows buffered per column when converting, and sliced at a time on replay
+CHUNK_ROWS = 64 * 1024
+
+class ColumnWriter(object):
+  '''Appends rows of a table to its column files.'''
+  def __init__(self, directory, table):
+    self.columns = [(array.array(code),
+                     open(os.path.join(directory, table + "." + column), 'wb'))
+                    for column, code in COLUMNS[table]]
+    self.rows = 0
+
+  def append(self, *values):
+    for (buffer, _), value in zip(self.columns, values):
+      buffer.append(value)
+    self.rows += 1
+    if len(self.columns[0][0]) >= CHUNK_ROWS:
+      self.flush()
+
+  def flush(self):
+    for buffer, f in self.columns:
+      buffer.tofile(f)
+      del buffer[:]
+
+  def close(self):
+    self.flush()
+    for _, f in self.columns:
+      f.close()
+
+class Numbering(dict):
+  '''ID in the trace -> number, in order of first appearance'''
+  def number(self, key):
+    n = self.get(key)
+    if n is None:
+      n = len(self)
+      self[key] = n
+    return n
+
+  def write(self, path):
+    with open(path, 'w') as f:
+      for key in self:
+        f.write(key + "\n")
+
+def convert(trace_path, store_path, num_files=None):
+  '''Converts the first num_files task event files of the trace at
+     trace_path, and its machine events, to a store at store_path.'''
+  task_files = traceFiles(trace_path, "task_events", num_files)
+  if not task_files:
+    raise ValueError("no task events in " + trace_path)
+  # only appears once complete
+  tmp_path = store_path + ".tmp"
+  shutil.rmtree(tmp_path, ignore_errors=True)
+  os.makedirs(tmp_path)
+
+  machines = Numbering()
+  writer = ColumnWriter(tmp_path, "machine_events")
+  last_time = 0
+  for row in traceRows(traceFiles(trace_path, "machine_events")):
+    event_time = int(row[0])
+    if event_time < last_time:
+      raise ValueError("machine events not in time order")
+    last_time = event_time
+    writer.append(event_time, machines.number(row[1]), int(row[2]))
+  writer.close()
+  machine_rows = writer.rows
+
+  jobs = Numbering()
+  tasks = {}
+  task_jobs = array.array('I')
+  task_indices = array.array('I')
+  started = {}
+  runtimes = array.array('q')
+  index = array.array('q')
+  file_ends = []
+  writer = ColumnWriter(tmp_path, "task_events")
+  last_time = 0
+  for path in task_files:
+    for row in traceRows([path]):
+      event_time = int(row[0])
+      if event_time < last_time:
+        raise ValueError("task events not in time order, at " + path)
+      last_time = event_time
+      # events after the trace window are at the end: seek bisects them
+      while event_time != TIME_AFTER_TRACE \
+            and len(index) * INDEX_INTERVAL <= event_time:
+        index.append(writer.rows)
+      key = (row[2], row[3])
+      task = tasks.get(key)
+      if task is None:
+        task = len(tasks)
+        tasks[key] = task
+        task_jobs.append(jobs.number(row[2]))
+        task_indices.append(int(row[3]))
+        runtimes.append(-1)
+      event_type = int(row[5])
+      if event_type == TASK_SCHEDULE:
+        started.setdefault(task, event_time)
+      elif event_type in TASK_ENDS and task in started \
+           and runtimes[task] == -1:
+        runtimes[task] = event_time - started[task]
+      writer.append(event_time, task, event_type)
+    file_ends.append(writer.rows)
+  writer.close()
+
+  for (name, _), column in zip(COLUMNS["tasks"],
+                               [task_jobs, task_indices, runtimes]):
+    with open(os.path.join(tmp_path, "tasks." + name), 'wb') as f:
+      column.tofile(f)
+  with open(os.path.join(tmp_path, "task_events.index"), 'wb') as f:
+    index.tofile(f)
+  machines.write(os.path.join(tmp_path, "machines.txt"))
+  jobs.write(os.path.join(tmp_path, "jobs.txt"))
+  meta = {"rows": {"machine_events": machine_rows,
+                   "task_events": writer.rows,
+                   "tasks": len(tasks)},
+          "file_ends": file_ends,
+          "index_interval": INDEX_INTERVAL}
+  with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+    json.dump(meta, f, indent=2)
+  shutil.rmtree(store_path, ignore_errors=True)
+  os.rename(tmp_path, store_path)
+
+def isStore(path):
+  return os.path.exists(os.path.join(path, META_FILE))
+
+def mapArray(path, code):
+  '''Read-only, zero-copy view of an array file'''
+  with open(path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      # cannot map an empty file
+      return memoryview(array.array(code))
+    return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) \
+             .cast(code)
+
+class TraceStore(object):
+  '''Machine and task events, read from a store: as CsvTrace.'''
+  def __init__(self, store_path, num_files):
+    with open(os.path.join(store_path, META_FILE)) as f:
+      self.meta = json.load(f)
+    file_ends = self.meta["file_ends"]
+    if num_files is not None and num_files > len(file_ends):
+      raise ValueError("{} task event files requested, but {} has only {}"
+                       .format(num_files, store_path, len(file_ends)))
+    self.num_rows = file_ends[(num_files or len(file_ends)) - 1]
+    self.columns = {}
+    for table, columns in COLUMNS.items():
+      for column, code in columns:
+        path = os.path.join(store_path, table + "." + column)
+        self.columns[(table, column)] = mapArray(path, code)
+    self.index = mapArray(os.path.join(store_path, "task_events.index"), 'q')
+    with open(os.path.join(store_path, "machines.txt")) as f:
+      self.machines = f.read().splitlines()
+    with open(os.path.join(store_path, "jobs.txt")) as f:
+      self.jobs = f.read().splitlines()
+
+  def seek(self, event_time):
+    '''First task event row at or after event_time'''
+    times = self.columns[("task_events", "time")]
+    bucket = event_time // self.meta["index_interval"]
+    if bucket >= len(self.index):
+      # past the last indexed event: only events after the trace window,
+      # which are not indexed, may remain
+      low = self.index[-1] if len(self.index) else 0
+      return bisect.bisect_left(times, event_time, low, len(times))
+    low = self.index[bucket]
+    high = self.index[bucket + 1] if bucket + 1 < len(self.index) \
+           else len(times)
+    return bisect.bisect_left(times, event_time, low, high)
+
+  def _sample(self, keys, percentage):
+    '''Whether each key, by number, is sampled'''
+    if percentage >= 100:
+      return None
+    return bytes(sampled(key, percentage) for key in keys)
+
+  def _machineEvents(self, percentage, start, end):
+    chosen = self._sample(self.machines, percentage)
+    times = self.columns[("machine_events", "time")]
+    machines = self.columns[("machine_events", "machine")]
+    event_types = self.columns[("machine_events", "event_type")]
+    for event_time, machine, event_type in zip(times, machines, event_types):
+      if event_time >= end:
+        return
+      if chosen is None or chosen[machine]:
+        yield (max(event_time, start), "machine", event_type,
+               self.machines[machine], None)
+
+  def _taskEvents(self, percentage, start, end):
+    chosen = self._sample(self.jobs, percentage)
+    task_jobs = self.columns[("tasks", "job")]
+    task_indices = self.columns[("tasks", "index")]
+    runtimes = self.columns[("tasks", "runtime")]
+    first = self.seek(start)
+    last = min(self.seek(end), self.num_rows)
+    times = self.columns[("task_events", "time")]
+    tasks = self.columns[("task_events", "task")]
+    event_types = self.columns[("task_events", "event_type")]
+    for offset in range(first, last, CHUNK_ROWS):
+      stop = min(offset + CHUNK_ROWS, last)
+      for event_time, task, event_type in zip(times[offset:stop],
+                                              tasks[offset:stop],
+                                              event_types[offset:stop]):
+        if event_type not in TASK_REPLAYED:
+          continue
+        job = task_jobs[task]
+        if chosen is not None and not chosen[job]:
+          continue
+        key = (self.jobs[job], str(task_indices[task]))
+        runtime = None
+        if event_type == TASK_SUBMIT and runtimes[task] >= 0:
+          runtime = runtimes[task]
+        yield (event_time, "task", event_type, key, runtime)
+
+  def events(self, percentage=100, start=0, end=2**64):
+    return heapq.merge(self._machineEvents(percentage, start, end),
+                       self._taskEvents(percentage, start, end),
+                       key=lambda event: event[0])
+
+def openTrace(path, num_files=None):
+  '''A store if path is one, otherwise the CSV trace'''
+  if isStore(path):
+    return TraceStore(path, num_files)
+  else:
+    return CsvTrace(path, num_files)
+
+if __name__ == "__main__":
+  if len(sys.argv) not in [3, 4]:
+    print("usage: ", sys.argv[0], "<trace directory> <store directory> "
+          "[num files]", file=sys.stderr)
+    sys.exit(1)
+  num_files = int(sys.argv[3]) if len(sys.argv) == 4 else None
+  convert(sys.argv[1], sys.argv[2], num_files)
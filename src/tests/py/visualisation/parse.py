@@ -1,6 +1,21 @@
 import csv
 
+# Resource usage of solver run. Only present in newer result files, and only
+# filled in on the final row of each run.
+RUSAGE_FIELDNAMES = ["max_rss_kb", "utime", "stime", "minflt", "majflt",
+                     "nvcsw", "nivcsw"]
+
+# Memory of solver at end of each delta, in offline and hybrid result files.
+# Blank unless memory sampling was enabled for the test case.
+MEMORY_FIELDNAMES = ["rss_kb", "anon_kb"]
+
 FULL_FIELDNAMES = ["test", "file", "iteration", "algorithm_time", "total_time"]
+# Bound a run was killed at, if it was stopped early by a faster test. Only
+# present in newer full result files.
+RACE_FIELDNAMES = ["race_bound"]
+# Set for cases run co-located: instances run at once, which instance this
+# is, and its slowdown relative to running alone (instances 1, slowdown blank).
+COLOCATE_FIELDNAMES = ["instances", "instance", "slowdown"]
 OFFLINE_FIELDNAMES = ["test", "file", "delta_id", "iteration",
                       "algorithm_time", "total_time"]
 
@@ -9,6 +24,12 @@ CHANGE_FIELDNAMES = ["total_changes","new_node","remove_node",
 ONLINE_FIELDNAMES = ["test", "dataset", "delta_id", "cluster_timestamp", 
                      "iteration", "scheduling_latency", "algorithm_time", 
                      "flowsolver_time", "total_time"] + CHANGE_FIELDNAMES
+REPLAY_FIELDNAMES = ["test", "file", "speedup", "iteration", "delta_id",
+                     "arrival_time", "queueing_delay", "response_time",
+                     "algorithm_time"]
+THROUGHPUT_FIELDNAMES = ["test", "file", "copies", "iteration", "pass",
+                         "window_start", "window_end", "deltas", "changes",
+                         "deltas_per_second", "changes_per_second"]
                      
 APPROXIMATE_FIELDNAMES = ["refine_iteration", "refine_time", "overhead_time",
                           "epsilon", "cost","task_assignments_changed"]
@@ -16,25 +37,69 @@ APPROXIMATE_FULL_FIELDNAMES = ["file", "test_iteration"] + APPROXIMATE_FIELDNAME
 APPROXIMATE_INCREMENTAL_OFFLINE_FIELDNAMES = \
                  ["file", "delta_id", "test_iteration"] + APPROXIMATE_FIELDNAMES
 
-def _parse(fname, expected_fieldnames):
+def _parse(fname, expected_fieldnames, optional_fieldnames=()):
+  """Fields in optional_fieldnames may follow expected_fieldnames; these are
+     only present in files produced by newer versions of the benchmark."""
   with open(fname) as csvfile:
     reader = csv.DictReader(csvfile)
-    assert(reader.fieldnames == expected_fieldnames)
+    n = len(expected_fieldnames)
+    assert(reader.fieldnames[:n] == expected_fieldnames)
+    assert(set(reader.fieldnames[n:]) <= set(optional_fieldnames))
     data = list(reader)
     return data
 
+def _resource_conversion(s):
+  if not isinstance(s, str):
+    # already converted
+    return s
+  elif s == "":
+    return None
+  elif "." in s:
+    return float(s)
+  else:
+    return int(s)
+
+def get_memory_dict(row):
+  """Returns dict of memory at end of delta (rss_kb, anon_kb), or None
+     if memory was not sampled."""
+  if row.get(MEMORY_FIELDNAMES[0]) in ["", None]:
+    return None
+  return {k : int(row[k]) for k in MEMORY_FIELDNAMES}
+
+def get_resources_dict(row):
+  """Returns dict of resource usage (max_rss_kb, utime, stime, ...), or None
+     if the row has no resource usage recorded."""
+  if row.get(RUSAGE_FIELDNAMES[0]) in ["", None]:
+    return None
+  return {k : _resource_conversion(row[k]) for k in RUSAGE_FIELDNAMES}
+
+def get_colocation_dict(row):
+  """Returns dict of instances, instance and slowdown (None when running
+     alone), or None if the run was not part of a co-located case."""
+  if row.get(COLOCATE_FIELDNAMES[0]) in ["", None]:
+    return None
+  return {'instances': int(row['instances']),
+          'instance': int(row['instance']),
+          'slowdown': float(row['slowdown']) if row['slowdown'] else None}
+
 def identity(x):
   return x
 
-def _helper_full_or_offline(type, fname,
-                            file_filter=identity, test_filter=identity):
+def _helper_full_or_offline(type, fname, file_filter=identity,
+                            test_filter=identity, colocated=False):
   """Returns in format dict of filenames -> dict of implementations 
-     -> array of iterations -> dict of times (algo, total)"""
+     -> array of iterations -> dict of times (algo, total) and resources.
+
+     Rows of runs alongside other instances are skipped, unless colocated,
+     when the array of iterations is instead in a dict keyed by (instances,
+     instance), and the dict of times also has the slowdown."""
   data = None
   if type == "full":
-    data = _parse(fname, FULL_FIELDNAMES)
+    data = _parse(fname, FULL_FIELDNAMES,
+                  RUSAGE_FIELDNAMES + RACE_FIELDNAMES + COLOCATE_FIELDNAMES)
   else:
-    data = _parse(fname, OFFLINE_FIELDNAMES)
+    data = _parse(fname, OFFLINE_FIELDNAMES,
+                  MEMORY_FIELDNAMES + RUSAGE_FIELDNAMES + COLOCATE_FIELDNAMES)
   
   res = {}
   for row in data:
@@ -58,30 +123,59 @@ def _helper_full_or_offline(type, fname,
     if not test:
       continue
     
-    test_res = dict_of_implementations.get(test, [])
-    test_res.append({'algo': row['algorithm_time'],
-                     'total': row['total_time']})
-    
-    dict_of_implementations[test] = test_res
+    colocation = get_colocation_dict(row)
+    datum = {'algo': row['algorithm_time'],
+             'total': row['total_time'],
+             'memory': get_memory_dict(row),
+             'resources': get_resources_dict(row)}
+    if colocated:
+      if not colocation:
+        continue
+      datum['slowdown'] = colocation['slowdown']
+      instances_res = dict_of_implementations.get(test, {})
+      key = (colocation['instances'], colocation['instance'])
+      instances_res.setdefault(key, []).append(datum)
+      dict_of_implementations[test] = instances_res
+    else:
+      if colocation and colocation['instances'] > 1:
+        # timings under contention: see colocated_full
+        continue
+      test_res = dict_of_implementations.get(test, [])
+      test_res.append(datum)
+      dict_of_implementations[test] = test_res
     if type == 'incremental_offline':
       file_res[delta_id] = dict_of_implementations
     res[file] = file_res
     
-  return (type, res)
+  return ('colocated_' + type if colocated else type, res)
   
 def full(*args, **kwargs):
   """Returns in format dict of filenames -> dict of implementations 
-     -> array of iterations -> dict of times (algo, total)"""
+     -> array of iterations -> dict of times (algo, total) and resources"""
   return _helper_full_or_offline('full', *args, **kwargs)
 
-def incremental_offline(fname, file_filter=identity, test_filter=identity):
+def incremental_offline(*args, **kwargs):
   """Returns in format dict of filename/trace -> array indexed by delta IDs -> 
      -> dict of implementations -> array of iterations 
-     -> dict of times (algo, total)
+     -> dict of times (algo, total), memory (None unless sampled) 
+     and resources (None except on last delta)
      
      Covers offline and hybrid tests."""
   return _helper_full_or_offline('incremental_offline', *args, **kwargs)
 
+def colocated_full(*args, **kwargs):
+  """As full, for a co-located case, but with a dict keyed by (instances,
+     instance) -> array of iterations for each implementation. Runs alone
+     are keyed (1, 0); the dict of times also has the slowdown (None when
+     running alone)."""
+  return _helper_full_or_offline('full', *args, colocated=True, **kwargs)
+
+def colocated_incremental_offline(*args, **kwargs):
+  """As incremental_offline, keyed by (instances, instance) as in
+     colocated_full."""
+  return _helper_full_or_offline('incremental_offline', *args,
+                                 colocated=True, **kwargs)
+
 def get_changes_dict(row):
   return {'total': row['total_changes'],
           'node': {
@@ -137,6 +231,71 @@ def incremental_online(fname, trace_filter=identity, test_filter=identity):
   return ('incremental_online', res)
   return res
 
+def incremental_replay(fname, file_filter=identity, test_filter=identity):
+  """Returns in format dict of filenames -> dict of implementations
+     -> dict of speed-ups -> array of iterations -> array indexed by delta IDs
+     -> dict of times (arrival, queueing, response, algo) and resources
+     (None except on last delta). Times are "Timeout" if the delta timed out.
+
+     Speed-ups are absent beyond the first that timed out."""
+  data = _parse(fname, REPLAY_FIELDNAMES, RUSAGE_FIELDNAMES)
+  res = {}
+  for row in data:
+    file = file_filter(row['file'])
+    if not file:
+      continue
+    test = test_filter(row['test'])
+    if not test:
+      continue
+
+    file_res = res.setdefault(file, {})
+    test_res = file_res.setdefault(test, {})
+    speedup_res = test_res.setdefault(float(row['speedup']), [])
+
+    iteration = int(row['iteration'])
+    assert(iteration <= len(speedup_res))
+    if iteration == len(speedup_res):
+      speedup_res.append([])
+    speedup_res[iteration].append({'arrival': row['arrival_time'],
+                                   'queueing': row['queueing_delay'],
+                                   'response': row['response_time'],
+                                   'algo': row['algorithm_time'],
+                                   'resources': get_resources_dict(row)})
+
+  return ('incremental_replay', res)
+
+def incremental_throughput(fname, file_filter=identity, test_filter=identity):
+  """Returns in format dict of filenames -> dict of implementations
+     -> array of iterations -> array of windows
+     -> dict of pass, start, end, deltas, changes, deltas_per_second,
+     changes_per_second and resources (None except on last window).
+     Rates are "Timeout" if the run timed out."""
+  data = _parse(fname, THROUGHPUT_FIELDNAMES, RUSAGE_FIELDNAMES)
+  res = {}
+  for row in data:
+    file = file_filter(row['file'])
+    if not file:
+      continue
+    test = test_filter(row['test'])
+    if not test:
+      continue
+
+    test_res = res.setdefault(file, {}).setdefault(test, [])
+    iteration = int(row['iteration'])
+    assert(iteration <= len(test_res))
+    if iteration == len(test_res):
+      test_res.append([])
+    test_res[iteration].append({'pass': row['pass'],
+                                'start': row['window_start'],
+                                'end': row['window_end'],
+                                'deltas': row['deltas'],
+                                'changes': row['changes'],
+                                'deltas_per_second': row['deltas_per_second'],
+                                'changes_per_second': row['changes_per_second'],
+                                'resources': get_resources_dict(row)})
+
+  return ('incremental_throughput', res)
+
 def time_conversion(s):
   if s == "Timeout":
     return float('+inf')
@@ -152,13 +311,16 @@ APPROXIMATE_CONVERSIONS = {"file": str,
                            "task_assignments_changed": int,
                            "refine_time": time_conversion,
                            "overhead_time": time_conversion}
+APPROXIMATE_CONVERSIONS.update({k : _resource_conversion 
+                                for k in RUSAGE_FIELDNAMES})
 
 def _helper_approximate_full_or_offline(type, fname, file_filter=identity):
   data = None
   if type == "full":
-    data = _parse(fname, APPROXIMATE_FULL_FIELDNAMES)
+    data = _parse(fname, APPROXIMATE_FULL_FIELDNAMES, RUSAGE_FIELDNAMES)
   else:
-    data = _parse(fname, APPROXIMATE_INCREMENTAL_OFFLINE_FIELDNAMES)
+    data = _parse(fname, APPROXIMATE_INCREMENTAL_OFFLINE_FIELDNAMES,
+                  RUSAGE_FIELDNAMES)
   
   res = {}
   delta_id_map_of_files = {}
@@ -193,6 +355,7 @@ def _helper_approximate_full_or_offline(type, fname, file_filter=identity):
     assert(int(row['refine_iteration']) == len(refine_iteration_res))
     output_fieldnames = APPROXIMATE_FIELDNAMES[1:] # chop off refine_iteration
     refine_iteration_res.append({k : row[k] for k in output_fieldnames})
+    refine_iteration_res[-1]['resources'] = get_resources_dict(row)
     
     array_of_iterations[test_iteration] = refine_iteration_res
     if type == "incremental_offline":
@@ -204,12 +367,13 @@ def _helper_approximate_full_or_offline(type, fname, file_filter=identity):
 def approximate_full(*args, **kwargs):
   """Returns in format dict of filenames -> array of test iterations 
      -> array of refine iterations -> dict of parameters 
-     (refine_time, overhead_time, epsilon, cost, task_assignments_changed)"""
+     (refine_time, overhead_time, epsilon, cost, task_assignments_changed,
+     resources)"""
   return _helper_approximate_full_or_offline('full', *args, **kwargs)
 
 def approximate_incremental_offline(*args, **kwargs):
   """Returns in format dict of filenames -> array of delta IDs
      -> array of test iterations -> array of refine iterations 
      -> dict of parameters (refine_time, overhead_time, epsilon, 
-     cost, task_assignments_changed)"""
+     cost, task_assignments_changed, resources)"""
   return _helper_approximate_full_or_offline('incremental_offline', *args, **kwargs)
\ No newline at end of file